@@ -0,0 +1,236 @@
+# async_client_chat.py
+# Cliente de chat sobre asyncio, sem terminal: para bots, ferramentas e testes.
+#
+#     async with AsyncChatClient('127.0.0.1', 7070) as client:
+#         await client.connect("bot")
+#         await client.send("olá")
+#         async for event in client: # ChatMessage ou Notification
+#             ...
+import asyncio
+import time
+
+from chat_protocol import COMPRESSION_CODECS, DEFAULT_ROOM
+from client_chat import MAX_BUFF_SIZE, SERVER_HOST, SERVER_PORT
+from client_core import ClientSession, Notification, stream_chunks
+from pacing import DEFAULT_PACING, pacing_argument, parse_pacing
+from reliability import RELIABILITY_TICK
+
+HELLO_RETRY_INTERVAL = 1.0 # Segundos sem CMD:WELCOME até reenviar o CMD:HI
+IDLE_POLL_INTERVAL = 1.0 # Intervalo das tarefas periódicas quando não há uploads confiáveis em trânsito
+
+
+class _ClientDatagramProtocol(asyncio.DatagramProtocol):
+    """Ponte entre o transporte UDP do asyncio e o AsyncChatClient."""
+    def __init__(self, client):
+        self.client = client
+
+    def connection_made(self, transport):
+        self.client._connection_made(transport)
+
+    def datagram_received(self, data, addr):
+        self.client._datagram_received(data)
+
+    def error_received(self, exc):
+        # Ex: ICMP "port unreachable" quando o servidor não está rodando
+        print(f"[CLIENT_ERROR] Erro de socket recebido: {exc}")
+
+    def connection_lost(self, exc):
+        self.client._events.put_nowait(None)
+
+
+class AsyncChatClient:
+    """Cliente de chat não bloqueante: o protocolo fica no ClientSession, a E/S no loop de eventos.
+
+    Os eventos recebidos (ChatMessage e Notification de client_core.py) são lidos com
+    `await client.receive()` ou `async for event in client`.
+    """
+    def __init__(self, server_host=SERVER_HOST, server_port=SERVER_PORT, max_buff=MAX_BUFF_SIZE, reliable=False,
+                 pacing=None, request_max_buff=None, text_protocol=False, compression=None):
+        self.server_address = (server_host, server_port)
+        rate_controller_factory = parse_pacing(pacing)
+        rate_controller = rate_controller_factory() if rate_controller_factory is not None else None
+        self.session = ClientSession(None, max_buff, reliable=reliable, rate_controller=rate_controller,
+                                     request_max_buff=request_max_buff, text_protocol=text_protocol, compression=compression)
+        self.transport = None
+        self._events = asyncio.Queue() # Eventos recebidos; None sinaliza o fim da conexão
+        self._welcome = asyncio.Event()
+        self._wakeup = asyncio.Event() # Acorda a task de timers quando um upload confiável começa
+        self._timer_task = None
+
+    @property
+    def username(self):
+        return self.session.username
+
+    async def connect(self, username, timeout=5.0):
+        """Abre o socket e entra na sala. Se o CMD:HI pede opções, espera o CMD:WELCOME (reenviando o CMD:HI)."""
+        self.session.username = username
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: _ClientDatagramProtocol(self), remote_addr=self.server_address)
+        self._timer_task = loop.create_task(self._timer_loop())
+        deadline = loop.time() + timeout
+        while True:
+            self.transport.sendto(self.session.hello())
+            if not self.session.expects_welcome():
+                return
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise TimeoutError(f"O servidor {self.server_address} não respondeu ao CMD:HI.")
+            try:
+                await asyncio.wait_for(self._welcome.wait(), min(HELLO_RETRY_INTERVAL, remaining))
+                return
+            except asyncio.TimeoutError:
+                pass
+
+    def _connection_made(self, transport):
+        self.transport = transport
+
+    def _datagram_received(self, data):
+        try:
+            events = self.session.receive(data)
+        except ValueError as e: # Datagrama inválido ou malformado
+            print(f"[CLIENT_ERROR] {e}")
+            events = []
+        finally: # ACKs saem mesmo se o datagrama for inválido
+            self._flush()
+        if self.session.welcomed:
+            self._welcome.set()
+        for event in events:
+            self._events.put_nowait(event)
+
+    def _flush(self):
+        """Envia os datagramas (ACKs e retransmissões) que a sessão produziu."""
+        for packet in self.session.take_outgoing():
+            self.transport.sendto(packet)
+
+    async def send(self, message, room=DEFAULT_ROOM, user=None):
+        """Envia uma mensagem (str ou bytes) para a sala (ou, com `user`, como mensagem privada)."""
+        content_bytes = message.encode('utf-8') if isinstance(message, str) else message
+        if not content_bytes.strip(): # Não envia mensagens vazias
+            return
+        await self._send_upload(self.session.upload(content_bytes, room, user))
+
+    async def send_stream(self, source, total_size=None, room=DEFAULT_ROOM, user=None):
+        """Envia um conteúdo grande (arquivo binário aberto ou iterador de blocos) sem carregá-lo inteiro na memória."""
+        chunks, total_size = stream_chunks(source, total_size)
+        await self._send_upload(self.session.upload_stream(chunks, total_size, room, user))
+
+    def join(self, room):
+        """Entra em uma sala (as mensagens dela passam a chegar em `receive`)."""
+        self.transport.sendto(self.session.join(room))
+
+    def leave(self, room):
+        """Sai de uma sala."""
+        self.transport.sendto(self.session.leave(room))
+
+    def history(self, room=DEFAULT_ROOM, since_id=None):
+        """Pede as mensagens da sala com id maior que `since_id` (por padrão, a última recebida); elas chegam em
+        `receive`. Retorna False se o servidor não guarda histórico."""
+        if not self.session.supports_history:
+            return False
+        self.transport.sendto(self.session.history(room, since_id))
+        return True
+
+    async def _send_upload(self, packets):
+        if self.session.reliable_sender is not None: # A task de timers passa a acompanhar os timeouts
+            self._wakeup.set()
+        if not self.session.paced:
+            for packet in packets:
+                self.transport.sendto(packet)
+            return
+        rate_controller = self.session.rate_controller
+        for packet in packets: # Espera as fichas do controlador de taxa sem bloquear o loop
+            wait = rate_controller.reserve(time.monotonic())
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.transport.sendto(packet)
+
+    async def _timer_loop(self):
+        """Retransmissões a cada RELIABILITY_TICK enquanto há uploads confiáveis em trânsito; senão, quase sempre dormindo."""
+        while True:
+            self.session.poll()
+            self._flush()
+            if self.session.has_pending():
+                await asyncio.sleep(RELIABILITY_TICK)
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), IDLE_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def receive(self):
+        """Espera o próximo evento (ChatMessage ou Notification); retorna None quando o cliente é fechado."""
+        event = await self._events.get()
+        if event is None:
+            self._events.put_nowait(None) # Outras esperas também terminam
+        return event
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self.receive()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+    async def close(self):
+        """Sai da sala (CMD:BYE) e fecha o socket."""
+        if self._timer_task is not None:
+            self._timer_task.cancel()
+            self._timer_task = None
+        if self.transport is not None:
+            self.transport.sendto(self.session.bye())
+            self.transport.close() # connection_lost encerra os leitores de eventos
+            self.transport = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+async def _run_bot(args):
+    """Bot de exemplo: entra na sala, envia as mensagens pedidas e exibe o que receber."""
+    async with AsyncChatClient(args.host, args.port, reliable=args.reliable, pacing=args.pacing,
+                               request_max_buff=args.max_buff, text_protocol=args.text_protocol,
+                               compression=args.compress) as client:
+        await client.connect(args.username)
+        for room in args.join:
+            client.join(room)
+        if args.history:
+            for room in [DEFAULT_ROOM] + args.join:
+                client.history(room, 0)
+        for message in args.send:
+            await client.send(message, args.room)
+        async for event in client:
+            if isinstance(event, Notification):
+                print(event.text)
+            else:
+                prefix = "[privado] " if event.direct else "" if event.room == DEFAULT_ROOM else f"[#{event.room}] "
+                print(f"{prefix}{event.ip}:{event.port}/~{event.username}: {event.text} {event.timestamp}")
+
+
+if __name__ == '__main__':
+    import argparse
+    from chat_config import datagram_size, env_default, port_number
+    parser = argparse.ArgumentParser(description="Cliente de Chat UDP (asyncio, sem terminal interativo).")
+    parser.add_argument('username', help="Nome de usuário na sala")
+    parser.add_argument('--host', default=env_default('SERVER', SERVER_HOST), help="Endereço do servidor (ambiente: CHAT_SERVER)")
+    parser.add_argument('--port', type=port_number, default=env_default('PORT', SERVER_PORT), help="Porta do servidor (ambiente: CHAT_PORT)")
+    parser.add_argument('--send', action='append', default=[], help="Mensagem enviada ao entrar (pode repetir)")
+    parser.add_argument('--join', action='append', default=[], help="Sala em que o bot entra ao conectar (pode repetir)")
+    parser.add_argument('--room', default=DEFAULT_ROOM, help="Sala das mensagens de --send")
+    parser.add_argument('--history', action='store_true', help="Pede as mensagens guardadas das salas ao conectar")
+    parser.add_argument('--reliable', action='store_true', help="Pede entrega confiável (ACK/NACK com retransmissão) ao servidor")
+    parser.add_argument('--pacing', type=pacing_argument, default=DEFAULT_PACING, help=f"Controle de taxa dos envios: none, fixed:<pacotes/s>, aimd ou aimd:<inicial>:<máxima> (padrão: {DEFAULT_PACING}). O AIMD se ajusta com os ACKs da entrega confiável; sem --reliable vira uma taxa fixa de ~10 MB/s (entrega completa em loopback); use fixed:/none para mais vazão, aceitando perdas")
+    parser.add_argument('--max-buff', type=datagram_size, default=None, help="Tamanho de datagrama pedido ao servidor")
+    parser.add_argument('--text-protocol', action='store_true', help="Usa o protocolo de texto antigo (para servidores antigos)")
+    parser.add_argument('--compress', choices=sorted(COMPRESSION_CODECS), default=None,
+                        help="Comprime as mensagens grandes com este codec, se o servidor aceitar")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_run_bot(args))
+    except KeyboardInterrupt:
+        print("\nDesconectando...")
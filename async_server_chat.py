@@ -0,0 +1,182 @@
+# async_server_chat.py
+import asyncio
+import time
+
+from chat_config import add_network_arguments, datagram_size, set_socket_buffers
+from chat_protocol import MAX_DATAGRAM_SIZE
+from pacing import DEFAULT_PACING, pacing_argument
+from reliability import RELIABILITY_TICK
+from send_queue import DROP_NEWEST, SEND_BURST_PACKETS, SEND_QUEUE_MAX_PACKETS, SendQueue
+from server_chat import (HISTORY_REPLAY_BURST_PACKETS, UDPServer, MAX_BUFF_SIZE, SERVER_HOST, SERVER_PORT, add_history_arguments,
+                         add_send_queue_arguments, history_from_args)
+
+# Constantes de envio (pacing) das filas por destinatário
+# (a rodada por destinatário e o limite da fila são os de send_queue.py, os mesmos do servidor síncrono)
+SEND_PACING_INTERVAL = 0.0    # Pausa (s) entre rajadas sem controle de taxa; 0 apenas cede a vez para a recepção
+
+
+class _ServerDatagramProtocol(asyncio.DatagramProtocol):
+    """Ponte entre o transporte UDP do asyncio e o AsyncUDPServer."""
+    def __init__(self, server):
+        self.server = server
+
+    def connection_made(self, transport):
+        self.server.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            self.server._handle_datagram(data, addr)
+        except Exception as e: # Nunca deixa uma mensagem ruim derrubar o loop de eventos
+            print(f"[DEBUG_SERVER] Erro ao processar datagrama de {addr}: {e}")
+
+    def error_received(self, exc):
+        # No Linux, um ICMP "port unreachable" de um cliente que sumiu chega aqui (sem o endereço)
+        print(f"[DEBUG_SERVER] Erro de socket recebido: {exc}")
+
+
+class AsyncUDPServer(UDPServer):
+    """Servidor de chat UDP baseado em asyncio: recepção não bloqueante e filas de envio por destinatário.
+
+    Fala exatamente o mesmo protocolo do UDPServer (o tratamento das mensagens é herdado);
+    apenas a entrada e a saída de datagramas mudam.
+    """
+    def __init__(self, host, port, max_buff, burst_packets=SEND_BURST_PACKETS,
+                 pacing_interval=SEND_PACING_INTERVAL, max_queue_packets=SEND_QUEUE_MAX_PACKETS, pacing=None,
+                 max_datagram=MAX_DATAGRAM_SIZE, profile_path=None, overflow_policy=DROP_NEWEST, rcvbuf=None, sndbuf=None):
+        """Configura o servidor; o socket só é criado em start(), dentro do loop de eventos."""
+        self.host = host
+        self.port = port
+        self.socket_buffers = (rcvbuf, sndbuf) # SO_RCVBUF/SO_SNDBUF, aplicados em start()
+        self.burst_packets = burst_packets
+        self.pacing_interval = pacing_interval
+        self.transport = None
+        self.send_queues = {} # {(ip, port): SendQueue de pacotes pendentes}
+        self.writer_tasks = {} # {(ip, port): task que esvazia a fila daquele destinatário}
+        self.reliability_task = None
+        self._init_state(max_buff, pacing, max_datagram, profile_path)
+        self.set_send_queue(max_queue_packets, overflow_policy)
+
+    async def start(self):
+        """Cria o endpoint UDP no loop de eventos atual."""
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: _ServerDatagramProtocol(self), local_addr=(self.host, self.port))
+        set_socket_buffers(self.transport.get_extra_info('socket'), *self.socket_buffers)
+        self.reliability_task = loop.create_task(self._reliability_loop())
+        host, port = self.transport.get_extra_info('sockname')[:2]
+        print(f"Servidor de Chat IF975 (asyncio) iniciado em {host}:{port}")
+        print("Aguardando conexões...")
+
+    async def serve_forever(self):
+        """Inicia o servidor e o mantém rodando até ser cancelado."""
+        await self.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            self.close()
+
+    async def _reliability_loop(self):
+        """Verifica periodicamente os timeouts de retransmissão, os uploads incompletos e os clientes ociosos."""
+        while True:
+            busy = self.service_timers()
+            await asyncio.sleep(RELIABILITY_TICK if busy else 0.1)
+
+    def _send_packets(self, packets, target_client_addr):
+        """Enfileira os pacotes para o destinatário; o envio real acontece na task de escrita dele."""
+        if not packets:
+            return
+        queue = self.send_queues.get(target_client_addr)
+        if queue is None:
+            queue = self.send_queues[target_client_addr] = SendQueue(self.send_queue_limit, self.overflow_policy)
+
+        dropped = queue.push(packets) # Destinatário lento: a política da fila decide o que descartar
+        if dropped:
+            self._on_queue_overflow(target_client_addr, dropped)
+
+        if target_client_addr not in self.writer_tasks: # Acorda (cria) a task de escrita deste destinatário
+            self.writer_tasks[target_client_addr] = asyncio.get_running_loop().create_task(
+                self._drain_send_queue(target_client_addr))
+
+    async def _drain_send_queue(self, target_client_addr):
+        """Esvazia a fila de um destinatário em rajadas, cedendo o loop entre elas para não travar a recepção.
+
+        Com controle de taxa, cada pacote consome uma ficha do controlador do destinatário e a
+        task dorme até a próxima ficha quando elas acabam.
+        """
+        queue = self.send_queues[target_client_addr]
+        metrics = self.metrics
+        try:
+            while queue and self.transport is not None:
+                rate_controller = self.rate_controllers.get(target_client_addr)
+                budget = min(self.burst_packets, len(queue))
+                if rate_controller is not None:
+                    now = time.monotonic()
+                    allowed = 0
+                    while allowed < budget and rate_controller.try_send(now):
+                        allowed += 1
+                    budget = allowed
+                for packet in queue.pop(budget):
+                    self.transport.sendto(packet, target_client_addr)
+                    metrics.packets_out += 1
+                    metrics.bytes_out += len(packet)
+                if rate_controller is not None and queue:
+                    await asyncio.sleep(rate_controller.wait_time(time.monotonic()))
+                else:
+                    await asyncio.sleep(self.pacing_interval)
+        except Exception as e:
+            print(f"[DEBUG_SERVER] Erro ao enviar para {target_client_addr}: {e}")
+            metrics.record_send_error(target_client_addr)
+        finally:
+            # A task termina quando a fila esvazia; um novo envio cria outra
+            del self.writer_tasks[target_client_addr]
+            self.send_queues.pop(target_client_addr, None)
+
+    def _replay_budget(self, client_addr):
+        """O reenvio de histórico espera a fila de envio do cliente andar (sem chegar ao limite dela)."""
+        queued = len(self.send_queues.get(client_addr, ()))
+        return min(HISTORY_REPLAY_BURST_PACKETS - queued, self.send_queue_limit - queued)
+
+    def remove_clients(self, client_addresses, reason=""):
+        """Remove os clientes e descarta o que ainda estava na fila de envio para eles."""
+        super().remove_clients(client_addresses, reason)
+        for client_address in client_addresses:
+            queue = self.send_queues.get(client_address)
+            if queue is not None:
+                queue.clear()
+
+    def close(self):
+        """Fecha o transporte do servidor de forma limpa."""
+        print("Servidor de Chat encerrando.")
+        for task in list(self.writer_tasks.values()):
+            task.cancel()
+        if self.reliability_task is not None:
+            self.reliability_task.cancel()
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+        self.metrics.close()
+        self.set_history(None)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Servidor de Chat UDP (asyncio).")
+    add_network_arguments(parser, SERVER_HOST, SERVER_PORT, MAX_BUFF_SIZE, 'BIND', "Endereço em que o servidor escuta")
+    parser.add_argument('--pacing', type=pacing_argument, default=DEFAULT_PACING, help=f"Controle de taxa por cliente: none, fixed:<pacotes/s>, aimd ou aimd:<inicial>:<máxima> (padrão: {DEFAULT_PACING}). O AIMD se ajusta com os ACKs da entrega confiável; sem --reliable vira uma taxa fixa de ~10 MB/s (entrega completa em loopback); use fixed:/none para mais vazão, aceitando perdas")
+    parser.add_argument('--max-datagram', type=datagram_size, default=MAX_DATAGRAM_SIZE, help="Maior tamanho de datagrama aceito na negociação com os clientes")
+    parser.add_argument('--profile-file', default=None, help="Grava uma amostra das latências internas neste arquivo (perfil amostral)")
+    parser.add_argument('--no-chat-log', action='store_true',
+                        help="Não loga as mensagens da sala no console (nem descomprime as que chegam comprimidas)")
+    add_history_arguments(parser)
+    add_send_queue_arguments(parser)
+    args = parser.parse_args()
+
+    # Cria e inicia a instância do servidor assíncrono
+    server = AsyncUDPServer(args.host, args.port, args.buffer_size, pacing=args.pacing, max_datagram=args.max_datagram,
+                            profile_path=args.profile_file, max_queue_packets=args.send_queue, overflow_policy=args.overflow,
+                            rcvbuf=args.rcvbuf, sndbuf=args.sndbuf)
+    server.chat_log = not args.no_chat_log
+    server.set_history(history_from_args(args))
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt: # Permite encerrar o servidor com Ctrl+C
+        print("\nServidor interrompido pelo usuário.")
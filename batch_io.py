@@ -0,0 +1,357 @@
+# batch_io.py
+# E/S de datagramas em lote para o servidor: várias mensagens por chamada de sistema.
+#
+# Recepção: a cada vez que o socket fica legível, drena até `batch_size` datagramas em buffers
+# pré-alocados (recvmmsg no Linux via ctypes; senão, recvfrom em um laço não bloqueante).
+# Envio: os datagramas são enfileirados e saem juntos em flush(). Sequências de fragmentos do
+# mesmo tamanho para o mesmo destino viram um único envio com UDP GSO (UDP_SEGMENT), que o
+# kernel divide em datagramas; o resto sai com sendmmsg ou, sem ele, em um laço de sendto.
+import bisect
+import errno
+import itertools
+import select
+import socket as skt
+import struct
+import sys
+from array import array
+
+from chat_protocol import MAX_DATAGRAM_SIZE
+
+try:
+    import ctypes
+except ImportError: # Python compilado sem ctypes: só os laços de recvfrom/sendto
+    ctypes = None
+
+BATCH_SIZE = 32             # Datagramas recebidos por chamada (cada um com um buffer de MAX_DATAGRAM_SIZE)
+SEND_BATCH_SIZE = 256       # Datagramas por chamada de sendmmsg
+SEND_BUFFER_SIZE = 1024 * 1024 # Bytes copiados por chamada de sendmmsg
+GSO_MAX_SEGMENTS = 64       # Limite de segmentos por envio com UDP_SEGMENT (UDP_MAX_SEGMENTS do kernel)
+MIN_GSO_SEGMENT = 512       # Abaixo disso, um EINVAL no GSO indica falta de suporte, não MTU
+SOL_UDP = 17
+UDP_SEGMENT = 103           # Linux >= 4.18; o módulo socket não exporta a constante
+SOCKADDR_IN_SIZE = 16
+ADDRESS_CACHE_LIMIT = 16384 # Endereços guardados nos caches de sockaddr; acima disso, eles são esvaziados
+RETRY_ERRNOS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS)
+GSO_UNSUPPORTED_ERRNOS = (errno.EINVAL, errno.EIO, errno.ENOPROTOOPT, errno.EOPNOTSUPP)
+
+_libc = None
+if ctypes is not None and sys.platform.startswith('linux'):
+    class _IOVec(ctypes.Structure):
+        _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+    class _MsgHdr(ctypes.Structure):
+        _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+                    ('msg_iov', ctypes.c_void_p), ('msg_iovlen', ctypes.c_size_t),
+                    ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                    ('msg_flags', ctypes.c_int)]
+
+    class _MMsgHdr(ctypes.Structure):
+        _fields_ = [('msg_hdr', _MsgHdr), ('msg_len', ctypes.c_uint)]
+
+    try:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+        _libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    except (OSError, AttributeError): # libc sem recvmmsg/sendmmsg (ex: musl antiga)
+        _libc = None
+
+
+def mmsg_supported():
+    """True se recvmmsg/sendmmsg estão disponíveis (Linux com ctypes)."""
+    return _libc is not None
+
+
+def batch_io_supported(sckt):
+    """True se o socket pode usar o BatchSocketIO (UDP sobre IPv4 em uma plataforma com MSG_DONTWAIT)."""
+    return sckt.family == skt.AF_INET and hasattr(skt, 'MSG_DONTWAIT')
+
+
+class BatchSocketIO:
+    """Recepção e envio em lote de datagramas em um socket UDP IPv4.
+
+    Os datagramas devolvidos por receive() são cópias (bytes) e podem ser guardados à vontade;
+    os pacotes passados a queue() precisam ser bytes e só saem em flush().
+    """
+    def __init__(self, sckt, batch_size=BATCH_SIZE, use_mmsg=None, use_gso=None):
+        self.sckt = sckt
+        self.fd = sckt.fileno()
+        self.batch_size = batch_size
+        self.use_mmsg = mmsg_supported() if use_mmsg is None else (use_mmsg and mmsg_supported())
+        self.use_gso = (sys.platform.startswith('linux') if use_gso is None else use_gso) and hasattr(sckt, 'sendmsg')
+        self.gso_max_segment = MAX_DATAGRAM_SIZE # Baixa se a rota recusar segmentos grandes (ex: acima do MTU)
+        self.outbox = [] # [(pacotes, endereço)] à espera de flush()
+        self._sockaddrs = _SockaddrCache() if self.use_mmsg else None
+        self._poller = select.poll() if hasattr(select, 'poll') else None
+        if self._poller is not None:
+            self._poller.register(self.fd, select.POLLIN)
+        if self.use_mmsg:
+            self._init_mmsg()
+
+    def _init_mmsg(self):
+        """Monta uma vez as estruturas do recvmmsg/sendmmsg; por chamada só mudam ponteiros e tamanhos.
+
+        Os arrays ficam em bytearrays e são preenchidos por fatias com passo de uma memoryview
+        (cópias em C), sem um acesso a campo ctypes por datagrama.
+        """
+        n = self.batch_size
+        word = ctypes.sizeof(ctypes.c_void_p)
+        self._word_code = 'Q' if word == 8 else 'I'
+        self._hdr_words = ctypes.sizeof(_MMsgHdr) // word # Passo entre os msg_name de mmsghdrs vizinhos
+
+        # Recepção: um buffer de MAX_DATAGRAM_SIZE e um sockaddr_in por posição do lote, reaproveitados a cada lote
+        self._recv_buffer = bytearray(MAX_DATAGRAM_SIZE * n)
+        self._recv_view = memoryview(self._recv_buffer)
+        recv_base = ctypes.addressof((ctypes.c_char * len(self._recv_buffer)).from_buffer(self._recv_buffer))
+        self._recv_names = bytearray(SOCKADDR_IN_SIZE * n)
+        names_base = ctypes.addressof((ctypes.c_char * len(self._recv_names)).from_buffer(self._recv_names))
+        self._recv_iovs = (_IOVec * n)()
+        self._recv_msgs = self._mmsghdrs(n, self._recv_iovs, names_base)
+        iov_words = memoryview(self._recv_iovs).cast('B').cast(self._word_code)
+        iov_words[0::2] = array(self._word_code, range(recv_base, recv_base + n * MAX_DATAGRAM_SIZE, MAX_DATAGRAM_SIZE))
+        iov_words[1::2] = array(self._word_code, [MAX_DATAGRAM_SIZE] * n)
+        self._recv_lengths = memoryview(self._recv_msgs).cast('B')[_MMsgHdr.msg_len.offset:].cast('I')
+        self._len_stride = ctypes.sizeof(_MMsgHdr) // 4
+        self._recv_name_words = memoryview(self._recv_names).cast('Q')
+        self._name_stride = SOCKADDR_IN_SIZE // 8
+        self._recv_starts = range(0, n * MAX_DATAGRAM_SIZE, MAX_DATAGRAM_SIZE)
+        self._addresses = _AddressCache()
+
+        # Envio: os pacotes de cada chamada são copiados (um b"".join) para um buffer contíguo
+        self._send_buffer = bytearray(SEND_BUFFER_SIZE)
+        self._send_base = ctypes.addressof((ctypes.c_char * SEND_BUFFER_SIZE).from_buffer(self._send_buffer))
+        self._send_iovs = (_IOVec * SEND_BATCH_SIZE)()
+        self._send_msgs = self._mmsghdrs(SEND_BATCH_SIZE, self._send_iovs, None)
+        self._send_iov_words = memoryview(self._send_iovs).cast('B').cast(self._word_code)
+        self._send_name_words = memoryview(self._send_msgs).cast('B').cast(self._word_code)
+
+    @staticmethod
+    def _mmsghdrs(n, iovs, names_base):
+        """Array de mmsghdr com um iovec e um sockaddr_in por mensagem."""
+        msgs = (_MMsgHdr * n)()
+        for i in range(n):
+            hdr = msgs[i].msg_hdr
+            if names_base is not None:
+                hdr.msg_name = names_base + i * SOCKADDR_IN_SIZE
+            hdr.msg_namelen = SOCKADDR_IN_SIZE
+            hdr.msg_iov = ctypes.addressof(iovs[i])
+            hdr.msg_iovlen = 1
+        return msgs
+
+    # Recepção
+
+    def wait_readable(self, timeout):
+        """Espera o socket ficar legível por até `timeout` segundos (None = sem limite); retorna False no timeout."""
+        if self._poller is not None:
+            return bool(self._poller.poll(None if timeout is None else timeout * 1000))
+        return bool(select.select([self.sckt], [], [], timeout)[0])
+
+    def receive(self, timeout=None):
+        """Espera até `timeout` segundos por datagramas e retorna todos os já disponíveis (até batch_size).
+
+        Retorna uma lista de (dados, (ip, porta)); vazia se o tempo acabar.
+        """
+        if not self.wait_readable(timeout):
+            return []
+        if self.use_mmsg:
+            return self._receive_mmsg()
+        return self._receive_loop()
+
+    def _receive_mmsg(self):
+        received = _libc.recvmmsg(self.fd, self._recv_msgs, self.batch_size, skt.MSG_DONTWAIT, None)
+        if received < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            raise OSError(err, f"recvmmsg: {errno.errorcode.get(err, err)}")
+        lengths = self._recv_lengths[0:received * self._len_stride:self._len_stride].tolist()
+        # Os 8 primeiros bytes do sockaddr_in (família, porta e IP) identificam o remetente
+        keys = self._recv_name_words[0:received * self._name_stride:self._name_stride].tolist()
+        view, addresses = self._recv_view, self._addresses
+        return [(bytes(view[start:start + length]), addresses[key])
+                for start, length, key in zip(self._recv_starts, lengths, keys)]
+
+    def _receive_loop(self):
+        """Sem recvmmsg: drena o socket com recvfrom não bloqueante.
+
+        Um recvfrom_into no buffer pré-alocado exigiria copiar cada datagrama de novo para bytes;
+        medido, o recvfrom direto sai mais barato.
+        """
+        batch = []
+        recvfrom = self.sckt.recvfrom
+        for _ in range(self.batch_size):
+            try:
+                batch.append(recvfrom(MAX_DATAGRAM_SIZE, skt.MSG_DONTWAIT))
+            except (BlockingIOError, InterruptedError):
+                break
+        return batch
+
+    # Envio
+
+    def queue(self, packets, address):
+        """Enfileira datagramas (bytes) para `address`; retorna (pacotes, bytes) enfileirados."""
+        if not isinstance(packets, list):
+            packets = list(packets)
+        if packets:
+            self.outbox.append((packets, address))
+        return len(packets), sum(map(len, packets))
+
+    def flush(self):
+        """Envia tudo o que está na fila, na ordem; retorna [(endereço, OSError)] dos envios que falharam."""
+        units, self.outbox = self.outbox, []
+        errors = []
+        plain_packets, plain_addresses = [], [] # Pacotes avulsos acumulados para o mesmo sendmmsg
+        for packets, address in units:
+            if len(packets) == 1: # Caso mais comum (broadcast, ACK, notificação)
+                plain_packets.append(packets[0])
+                plain_addresses.append(address)
+                continue
+            if not self.use_gso or len(packets[-1]) > self.gso_max_segment:
+                plain_packets.extend(packets)
+                plain_addresses.extend([address] * len(packets))
+                continue
+            i, total = 0, len(packets)
+            while i < total:
+                end = _gso_run_end(packets, i) if len(packets[i]) <= self.gso_max_segment else i + 1
+                if end - i < 2:
+                    plain_packets.append(packets[i])
+                    plain_addresses.append(address)
+                else:
+                    if plain_packets: # Mantém a ordem: o que veio antes sai antes
+                        self._send_plain(plain_packets, plain_addresses, errors)
+                        plain_packets, plain_addresses = [], []
+                    self._send_gso(packets[i:end], address, errors)
+                i = end
+        if plain_packets:
+            self._send_plain(plain_packets, plain_addresses, errors)
+        return errors
+
+    def _send_gso(self, packets, address, errors):
+        """Envia uma sequência de segmentos do mesmo tamanho em uma chamada; o kernel a divide em datagramas."""
+        segment_size = len(packets[0])
+        try:
+            self._retry(self.sckt.sendmsg, [b"".join(packets)], [(SOL_UDP, UDP_SEGMENT, struct.pack('=H', segment_size))],
+                        0, address)
+        except OSError as e:
+            if e.errno in GSO_UNSUPPORTED_ERRNOS: # Sem suporte: envia pacote a pacote
+                if e.errno == errno.EINVAL and segment_size > MIN_GSO_SEGMENT: # Segmento maior que o MTU da rota
+                    self.gso_max_segment = min(self.gso_max_segment, segment_size - 1)
+                else: # Kernel sem UDP_SEGMENT
+                    self.use_gso = False
+                self._send_plain(packets, [address] * len(packets), errors)
+            else:
+                errors.append((address, e))
+
+    def _retry(self, send, *args):
+        """Repete um envio enquanto o buffer de envio do socket estiver cheio."""
+        while True:
+            try:
+                return send(*args)
+            except OSError as e:
+                if e.errno not in RETRY_ERRNOS:
+                    raise
+                select.select([], [self.sckt], [], 1.0)
+
+    def _send_plain(self, packets, addresses, errors):
+        if not self.use_mmsg:
+            sendto = self.sckt.sendto
+            for packet, address in zip(packets, addresses):
+                try:
+                    self._retry(sendto, packet, address)
+                except OSError as e:
+                    errors.append((address, e))
+            return
+        start, total = 0, len(packets)
+        while start < total:
+            end = min(total, start + SEND_BATCH_SIZE)
+            sizes = list(itertools.accumulate(map(len, packets[start:end])))
+            if sizes[-1] > SEND_BUFFER_SIZE: # Pacotes grandes: menos pacotes por chamada
+                end = start + max(1, bisect.bisect_right(sizes, SEND_BUFFER_SIZE))
+            self._send_mmsg(packets[start:end], addresses[start:end], errors)
+            start = end
+
+    def _send_mmsg(self, packets, addresses, errors):
+        """Um sendmmsg para `packets`, cada um para o endereço correspondente."""
+        count = len(packets)
+        code = self._word_code
+        data = b"".join(packets)
+        self._send_buffer[:len(data)] = data
+        lengths = list(map(len, packets))
+        iov_words = self._send_iov_words
+        iov_words[0:2 * count:2] = array(code, itertools.accumulate(lengths[:-1], initial=self._send_base))
+        iov_words[1:2 * count:2] = array(code, lengths)
+        stride = self._hdr_words
+        sockaddrs = self._sockaddrs
+        if len(sockaddrs) >= ADDRESS_CACHE_LIMIT: # Só entre envios: os ponteiros do lote ficam válidos até o sendmmsg
+            sockaddrs.clear()
+        self._send_name_words[0:count * stride:stride] = array(code, map(sockaddrs.__getitem__, addresses))
+        start = 0
+        while start < count:
+            sent = _libc.sendmmsg(self.fd, ctypes.byref(self._send_msgs, start * ctypes.sizeof(_MMsgHdr)), count - start, 0)
+            if sent >= 0:
+                start += sent
+                continue
+            err = ctypes.get_errno()
+            if err == errno.EINTR:
+                continue
+            if err in RETRY_ERRNOS: # Buffer de envio cheio (socket não bloqueante)
+                select.select([], [self.sckt], [], 1.0)
+                continue
+            # O primeiro pacote restante falhou (ex: destino inalcançável): registra e segue com os outros
+            errors.append((addresses[start], OSError(err, f"sendmmsg: {errno.errorcode.get(err, err)}")))
+            start += 1
+
+
+def _gso_run_end(packets, start):
+    """Fim da sequência de pacotes, a partir de `start`, que cabe em um envio com UDP_SEGMENT.
+
+    Todos os segmentos têm o tamanho do primeiro, exceto o último, que pode ser menor.
+    """
+    segment_size = len(packets[start])
+    total_bytes = segment_size
+    end = start + 1
+    limit = min(len(packets), start + GSO_MAX_SEGMENTS)
+    while end < limit:
+        size = len(packets[end])
+        if size > segment_size or total_bytes + size > MAX_DATAGRAM_SIZE:
+            break
+        total_bytes += size
+        end += 1
+        if size < segment_size: # Segmento final menor encerra a sequência
+            break
+    return end
+
+
+class _AddressCache(dict):
+    """Primeiros 8 bytes de um sockaddr_in (como inteiro) -> (ip, porta), decodificado no primeiro uso.
+
+    Cada remetente novo (inclusive clientes que já saíram ou pacotes forjados) ganha uma entrada; com
+    ADDRESS_CACHE_LIMIT entradas, o cache é esvaziado, como o de IPs em chat_protocol.
+    """
+    def __missing__(self, key):
+        if len(self) >= ADDRESS_CACHE_LIMIT:
+            self.clear()
+        _, port, packed_ip = struct.unpack('=H2s4s', key.to_bytes(8, sys.byteorder))
+        address = self[key] = (skt.inet_ntoa(packed_ip), int.from_bytes(port, 'big'))
+        return address
+
+
+class _SockaddrCache(dict):
+    """(ip, porta) -> endereço de um sockaddr_in pronto para o sendmmsg (criado no primeiro uso).
+
+    Limitado por quem o usa (_send_mmsg), que chama clear() antes de montar um lote: esvaziar no meio
+    do lote liberaria sockaddr_in cujos endereços já estão nos cabeçalhos do sendmmsg.
+    """
+    def __init__(self):
+        super().__init__()
+        self._buffers = [] # Mantém os sockaddr_in vivos
+
+    def clear(self):
+        super().clear()
+        self._buffers.clear()
+
+    def __missing__(self, address):
+        raw = struct.pack('=H', skt.AF_INET) + struct.pack('!H', address[1]) + skt.inet_aton(address[0]) + bytes(8)
+        sockaddr = ctypes.create_string_buffer(raw, SOCKADDR_IN_SIZE)
+        self._buffers.append(sockaddr)
+        pointer = self[address] = ctypes.addressof(sockaddr)
+        return pointer
@@ -0,0 +1,158 @@
+# benchmarks/bench_batch_io.py
+# Compara a E/S de datagramas em lote (batch_io.py) com um recvfrom/sendto por datagrama, em
+# loopback: pacotes por segundo no envio (sequência de fragmentos para um destino, como um
+# upload repassado, e um pacote para cada um de vários destinos, como um broadcast) e na
+# recepção (drenando um socket com datagramas acumulados).
+import argparse
+import os
+import socket as skt
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_io import BatchSocketIO, mmsg_supported # noqa: E402
+
+RECEIVE_BUFFER_SIZE = 8 * 1024 * 1024
+FILL_PACKETS = 500 # Datagramas acumulados no socket antes de cada rodada de recepção
+
+
+def _udp_socket():
+    sckt = skt.socket(skt.AF_INET, skt.SOCK_DGRAM)
+    sckt.bind(('127.0.0.1', 0))
+    return sckt
+
+
+def send_modes():
+    """Modos de envio comparados: (nome, fábrica de função que envia uma lista de (pacotes, destino))."""
+    def simple(sckt):
+        sendto = sckt.sendto
+        def send(units):
+            for packets, address in units:
+                for packet in packets:
+                    sendto(packet, address)
+        return send
+
+    def batched(use_mmsg, use_gso):
+        def factory(sckt):
+            io = BatchSocketIO(sckt, use_mmsg=use_mmsg, use_gso=use_gso)
+            def send(units):
+                for packets, address in units:
+                    io.queue(packets, address)
+                io.flush()
+            return send
+        return factory
+
+    modes = [('sendto', simple), ('lote (laço)', batched(False, False))]
+    if mmsg_supported():
+        modes.append(('sendmmsg', batched(True, False)))
+    if sys.platform.startswith('linux'):
+        modes.append(('sendmmsg+GSO' if mmsg_supported() else 'GSO', batched(None, True)))
+    return modes
+
+
+def bench_send(packet_size, rounds, destinations):
+    """Retorna [(cenário, modo, pacotes/s)] para o envio de 64 pacotes por rodada."""
+    sender = _udp_socket()
+    sinks = [_udp_socket() for _ in range(destinations)] # Ninguém lê: o kernel descarta quando o buffer enche
+    results = []
+    try:
+        # Um upload de 64 fragmentos (o último menor) repassado a um destino, e um pacote para cada destino
+        fragments = [b'x' * packet_size] * 63 + [b'y' * (packet_size // 2)]
+        scenarios = [
+            ('fragmentos', [(fragments, sinks[0].getsockname())], len(fragments)),
+            ('broadcast', [([b'x' * packet_size], sink.getsockname()) for sink in sinks], len(sinks)),
+        ]
+        for scenario, units, packets_per_round in scenarios:
+            for mode, factory in send_modes():
+                send = factory(sender)
+                send(units) # Aquecimento (e detecção de GSO indisponível)
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    send(units)
+                results.append((scenario, mode, rounds * packets_per_round / (time.perf_counter() - start)))
+    finally:
+        sender.close()
+        for sink in sinks:
+            sink.close()
+    return results
+
+
+def bench_receive(packet_size, rounds):
+    """Retorna [(modo, pacotes/s)] drenando um socket com FILL_PACKETS datagramas acumulados."""
+    sender = _udp_socket()
+    receiver = _udp_socket()
+    receiver.setsockopt(skt.SOL_SOCKET, skt.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+    address = receiver.getsockname()
+    packet = b'x' * packet_size
+
+    def simple_drain():
+        received = 0
+        receiver.setblocking(False)
+        try:
+            while True:
+                receiver.recvfrom(65535)
+                received += 1
+        except BlockingIOError:
+            pass
+        finally:
+            receiver.setblocking(True)
+        return received
+
+    def batched_drain(io):
+        def drain():
+            received = 0
+            while True:
+                batch = io.receive(0)
+                if not batch:
+                    return received
+                received += len(batch)
+        return drain
+
+    modes = [('recvfrom', simple_drain), ('lote (laço)', batched_drain(BatchSocketIO(receiver, use_mmsg=False)))]
+    if mmsg_supported():
+        modes.append(('recvmmsg', batched_drain(BatchSocketIO(receiver, use_mmsg=True))))
+    results = []
+    try:
+        for mode, drain in modes:
+            elapsed = 0.0
+            received = 0
+            for _ in range(rounds):
+                for _ in range(FILL_PACKETS):
+                    sender.sendto(packet, address)
+                start = time.perf_counter()
+                received += drain()
+                elapsed += time.perf_counter() - start
+            results.append((mode, received / elapsed if elapsed else 0.0))
+    finally:
+        sender.close()
+        receiver.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pacotes por segundo com E/S em lote vs. um datagrama por chamada.")
+    parser.add_argument('--sizes', default='64,1024', help="Tamanhos de pacote (bytes), separados por vírgula")
+    parser.add_argument('--send-rounds', type=int, default=300, help="Rodadas de envio por modo")
+    parser.add_argument('--receive-rounds', type=int, default=50, help="Rodadas de recepção por modo")
+    parser.add_argument('--destinations', type=int, default=64, help="Destinos no cenário de broadcast")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    print(f"recvmmsg/sendmmsg: {'disponível' if mmsg_supported() else 'indisponível (laços de recvfrom/sendto)'}")
+    print(f"{'envio':<12} {'pacote':>7} {'modo':<14} {'pacotes/s':>11} {'ganho':>6}")
+    for size in sizes:
+        baseline = {}
+        for scenario, mode, rate in bench_send(size, args.send_rounds, args.destinations):
+            baseline.setdefault(scenario, rate)
+            print(f"{scenario:<12} {size:>7} {mode:<14} {rate:>11.0f} {rate / baseline[scenario]:>5.2f}x")
+    print(f"\n{'recepção':<12} {'pacote':>7} {'modo':<14} {'pacotes/s':>11} {'ganho':>6}")
+    for size in sizes:
+        results = bench_receive(size, args.receive_rounds)
+        baseline = results[0][1]
+        for mode, rate in results:
+            print(f"{'':<12} {size:>7} {mode:<14} {rate:>11.0f} {rate / baseline:>5.2f}x")
+
+
+if __name__ == '__main__':
+    main()
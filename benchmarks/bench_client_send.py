@@ -0,0 +1,81 @@
+# benchmarks/bench_client_send.py
+# Compara mensagens/s do envio do cliente: caminho antigo (arquivo .txt temporário criado,
+# consultado com os.stat, relido em blocos e apagado a cada mensagem) vs. envio em memória.
+import argparse
+import contextlib
+import math
+import os
+import socket as skt
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_protocol import FRAGMENT_HEADER, FRAGMENT_MARKER, fragment_payload_size # noqa: E402
+from client_chat import UDPClient # noqa: E402
+
+MAX_BUFF_SIZE = 1024
+
+
+def legacy_send_message_file(client, message_content):
+    """Reproduz o envio antigo: mensagem gravada em arquivo temporário, medida com os.stat e relida do disco."""
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".txt", mode="w", encoding="utf-8")
+    temp_file.write(message_content)
+    temp_file.close()
+    temp_file_path = temp_file.name
+    try:
+        payload_size = fragment_payload_size(client.MAX_BUFF)
+        num_packets = math.ceil(os.stat(temp_file_path).st_size / payload_size) if os.path.exists(temp_file_path) else 0
+        if num_packets == 0 and os.path.exists(temp_file_path) and os.stat(temp_file_path).st_size > 0:
+            num_packets = 1
+        message_id = next(client.session._message_ids)
+        client.sckt.sendto(f"MSG_UPLOAD_START:{message_id}:{num_packets}".encode('utf-8'), client.server_address)
+        with open(temp_file_path, 'rb') as f:
+            for seq in range(num_packets):
+                chunk = f.read(payload_size)
+                fragment_header = FRAGMENT_HEADER.pack(FRAGMENT_MARKER, message_id, seq, num_packets)
+                client.sckt.sendto(fragment_header + chunk, client.server_address)
+    finally:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+
+
+def measure(send, client, message, duration):
+    """Envia a mesma mensagem repetidamente por `duration` segundos e retorna mensagens/s."""
+    count = 0
+    start = time.perf_counter()
+    deadline = start + duration
+    while time.perf_counter() < deadline:
+        for _ in range(50):
+            send(client, message)
+        count += 50
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mensagens/s: arquivo temporário vs. envio em memória.")
+    parser.add_argument('--sizes', default='32,1024,16384', help="Tamanhos de mensagem (bytes) separados por vírgula")
+    parser.add_argument('--duration', type=float, default=1.0, help="Segundos de medição por caso")
+    args = parser.parse_args()
+
+    # Destino que nunca lê: o kernel descarta o excesso, o que não afeta o custo do envio
+    sink = skt.socket(skt.AF_INET, skt.SOCK_DGRAM)
+    sink.bind(('127.0.0.1', 0))
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        client = UDPClient(*sink.getsockname(), MAX_BUFF_SIZE)
+
+    print(f"{'bytes':>7} {'arquivo temp (msg/s)':>21} {'memória (msg/s)':>16} {'ganho':>7}")
+    try:
+        for size in (int(n) for n in args.sizes.split(',')):
+            message = "m" * size
+            legacy = measure(legacy_send_message_file, client, message, args.duration)
+            in_memory = measure(UDPClient.send_message, client, message, args.duration)
+            print(f"{size:>7} {legacy:>21.0f} {in_memory:>16.0f} {in_memory / legacy:>6.1f}x")
+    finally:
+        client.close()
+        sink.close()
+
+
+if __name__ == '__main__':
+    main()
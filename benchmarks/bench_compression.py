@@ -0,0 +1,126 @@
+# benchmarks/bench_compression.py
+# Mede o efeito da compressão negociada nas mensagens grandes de texto (logs e textos colados):
+# tamanho do conteúdo e número de fragmentos, custo de comprimir no remetente e bytes/tempo da
+# retransmissão do servidor para uma sala em que todos negociaram o codec (o servidor repassa os
+# bytes comprimidos, sem descomprimir) e em que metade não negociou (descomprime uma vez).
+import argparse
+import contextlib
+import io
+import os
+import random
+import socket as skt
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_protocol import (COMPRESSION_CODECS, ENCODING_NONE, compress_payload, fragment_payload_size, # noqa: E402
+                           packet_count)
+from server_chat import MessageContent, UDPServer # noqa: E402
+
+MAX_BUFF_SIZE = 1024
+LOG_LEVELS = ("INFO", "INFO", "INFO", "DEBUG", "WARN", "ERROR")
+LOG_PATHS = ("/api/v1/items", "/api/v1/users", "/login", "/static/app.js", "/health")
+WORDS = ("o", "a", "de", "que", "servidor", "cliente", "mensagem", "pacote", "sala", "rede", "erro", "tempo",
+         "porta", "enviado", "recebido", "fila", "taxa", "entrega", "para", "com", "não", "uma", "mais")
+
+
+def sample_text(kind, size, seed=1):
+    """Texto de exemplo com `size` bytes: linhas de log ('log') ou texto corrido ('texto')."""
+    rng = random.Random(seed)
+    lines = []
+    total = 0
+    while total < size:
+        if kind == 'log':
+            line = (f"2026-10-17 12:{rng.randrange(60):02d}:{rng.randrange(60):02d}.{rng.randrange(1000):03d} "
+                    f"{rng.choice(LOG_LEVELS):<5} worker-{rng.randrange(8)} {rng.choice(LOG_PATHS)} "
+                    f"status={rng.choice((200, 200, 200, 304, 404, 500))} tempo={rng.randrange(1, 900)}ms "
+                    f"req={rng.getrandbits(48):012x}")
+        else:
+            line = " ".join(rng.choice(WORDS) for _ in range(rng.randrange(6, 16))).capitalize() + "."
+        lines.append(line)
+        total += len(line) + 1
+    return "\n".join(lines).encode('utf-8')[:size]
+
+
+def drain(sockets):
+    """Descarta tudo o que estiver pendente nos sockets dos destinatários."""
+    for s in sockets:
+        while True:
+            try:
+                s.recv(65535)
+            except BlockingIOError:
+                break
+
+
+def measure_relay(server, receivers, content, repeat):
+    """Retransmite `content` para a sala `repeat` vezes; retorna (mediana em ms, bytes enviados por retransmissão)."""
+    sender_address = ('127.0.0.1', 1) # Remetente fictício (nunca recebe)
+    sender_info = (sender_address[0], sender_address[1], 'bench')
+    samples = []
+    bytes_before = server.metrics.bytes_out
+    for _ in range(repeat):
+        drain(receivers)
+        relayed = MessageContent(content.data, content.encoding) # Sem reaproveitar a descompressão da rodada anterior
+        start = time.perf_counter()
+        server.broadcast_file_content(relayed, sender_info, sender_address=sender_address)
+        samples.append((time.perf_counter() - start) * 1000.0)
+    samples.sort()
+    return samples[len(samples) // 2], (server.metrics.bytes_out - bytes_before) // repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compressão das mensagens: tamanho, CPU e bytes retransmitidos.")
+    parser.add_argument('--sizes', default='4096,65536,524288', help="Tamanhos das mensagens (bytes), separados por vírgula")
+    parser.add_argument('--kinds', default='log,texto', help="Tipos de texto: log, texto")
+    parser.add_argument('--room-size', type=int, default=16, help="Destinatários na sala")
+    parser.add_argument('--repeat', type=int, default=5, help="Repetições por medição (usa a mediana)")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()): # Silencia as mensagens de inicialização do servidor
+        server = UDPServer('127.0.0.1', 0, MAX_BUFF_SIZE)
+    receivers = []
+    for i in range(args.room_size):
+        r = skt.socket(skt.AF_INET, skt.SOCK_DGRAM)
+        r.bind(('127.0.0.1', 0))
+        r.setblocking(False)
+        receivers.append(r)
+        server._register_client(r.getsockname(), f"user{i}") # Entra na sala padrão
+    payload_size = fragment_payload_size(MAX_BUFF_SIZE)
+    codecs = [('nenhum', ENCODING_NONE)] + sorted(COMPRESSION_CODECS.items())
+
+    print(f"Sala: {args.room_size} destinatários; 'metade' = metade deles sem o codec (o servidor descomprime uma vez)")
+    print(f"{'texto':<6} {'bytes':>7} {'codec':<7} {'comprimido':>10} {'frags':>6} {'comprimir':>10} "
+          f"{'relay (ms)':>10} {'enviado':>9} {'ganho':>6} {'metade (ms)':>11} {'enviado':>9}")
+    try:
+        for kind in args.kinds.split(','):
+            for size in (int(size) for size in args.sizes.split(',')):
+                content_bytes = sample_text(kind, size)
+                baseline_bytes = None
+                for name, encoding in codecs:
+                    start = time.perf_counter()
+                    data = compress_payload(content_bytes, encoding) if encoding != ENCODING_NONE else content_bytes
+                    compress_ms = (time.perf_counter() - start) * 1000.0
+                    content = MessageContent(data, encoding)
+
+                    # Todos negociaram o codec
+                    for client_addr in server.clients:
+                        server.client_encodings[client_addr] = frozenset(COMPRESSION_CODECS.values())
+                    relay_ms, sent = measure_relay(server, receivers, content, args.repeat)
+                    baseline_bytes = baseline_bytes or sent
+                    # Metade da sala sem o codec
+                    for client_addr in list(server.clients)[::2]:
+                        server.client_encodings.pop(client_addr)
+                    mixed_ms, mixed_sent = measure_relay(server, receivers, content, args.repeat)
+
+                    print(f"{kind:<6} {size:>7} {name:<7} {len(data):>10} {packet_count(len(data), payload_size):>6} "
+                          f"{compress_ms:>8.2f}ms {relay_ms:>10.3f} {sent:>9} {baseline_bytes / sent:>5.1f}x "
+                          f"{mixed_ms:>11.3f} {mixed_sent:>9}")
+    finally:
+        for r in receivers:
+            r.close()
+        server.sckt.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# benchmarks/bench_datagram_size.py
+# Mede a vazão de mensagens grandes (cliente -> servidor -> cliente, em loopback) em função do
+# tamanho de datagrama negociado no CMD:HI: datagramas maiores significam menos pacotes, e
+# portanto menos chamadas de sistema e menos trabalho do Python por byte transferido.
+import argparse
+import contextlib
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_loss import CountingClient # noqa: E402
+from chat_protocol import fragment_payload_size, packet_count # noqa: E402
+from reliability import RELIABILITY_TICK # noqa: E402
+from server_chat import UDPServer # noqa: E402
+
+MAX_BUFF_SIZE = 1024
+
+
+def run_scenario(datagram_size, messages, message_bytes, settle_timeout):
+    """Envia `messages` mensagens com o tamanho de datagrama pedido; retorna (entregues, MB/s, retransmissões)."""
+    server = UDPServer('127.0.0.1', 0, MAX_BUFF_SIZE)
+    server_running = threading.Event()
+    server_running.set()
+
+    def serve():
+        server.sckt.settimeout(RELIABILITY_TICK)
+        while server_running.is_set():
+            server.serve_one_datagram()
+            server.service_timers()
+
+    server_thread = threading.Thread(target=serve, daemon=True)
+    server_thread.start()
+    address = server.sckt.getsockname()
+    # Entrega confiável: datagramas grandes descartados por buffer cheio são retransmitidos, e a medida é do que chega
+    sender = CountingClient(*address, MAX_BUFF_SIZE, reliable=True, request_max_buff=datagram_size)
+    receiver = CountingClient(*address, MAX_BUFF_SIZE, reliable=True, request_max_buff=datagram_size)
+    try:
+        for client, username in ((receiver, 'receiver'), (sender, 'sender')):
+            client.username = username
+            threading.Thread(target=client.receive_messages, daemon=True).start()
+            client.send_hello()
+        time.sleep(0.2) # Espera os CMD:WELCOME com o tamanho negociado
+
+        filler = "x" * message_bytes
+        start = time.perf_counter()
+        for i in range(messages):
+            sender.send_message(f"{i}:{filler}")
+        last_count, last_progress = -1, time.perf_counter()
+        while len(receiver.delivered) < messages and time.perf_counter() - last_progress < settle_timeout:
+            if len(receiver.delivered) != last_count:
+                last_count, last_progress = len(receiver.delivered), time.perf_counter()
+            time.sleep(0.005)
+
+        elapsed = (receiver.last_delivery or time.perf_counter()) - start
+        throughput = receiver.delivered_bytes / elapsed / 2 ** 20 if elapsed > 0 else 0.0
+        return len(receiver.delivered) / messages, throughput, sender.reliable_sender.retransmissions
+    finally:
+        for client in (sender, receiver):
+            client.stop_event.set()
+            client.close()
+        server_running.clear()
+        server_thread.join()
+        server.sckt.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vazão em função do tamanho de datagrama negociado.")
+    parser.add_argument('--sizes', default='1024,1472,8192,65507', help="Tamanhos de datagrama (bytes) separados por vírgula")
+    parser.add_argument('--messages', type=int, default=20, help="Mensagens enviadas por cenário")
+    parser.add_argument('--message-bytes', type=int, default=1024 * 1024, help="Tamanho de cada mensagem")
+    parser.add_argument('--settle-timeout', type=float, default=3.0, help="Segundos sem progresso antes de encerrar o cenário")
+    args = parser.parse_args()
+
+    out = sys.stdout
+    print(f"{args.messages} mensagens de {args.message_bytes} bytes por cenário (entrega confiável)", file=out)
+    print(f"{'datagrama':>10} {'pacotes/msg':>12} {'entregues':>10} {'vazão (MB/s)':>13} {'retransm.':>10}", file=out)
+    for size in (int(n) for n in args.sizes.split(',')):
+        with contextlib.redirect_stdout(open(os.devnull, 'w')): # Silencia os logs de servidor/clientes
+            completion, throughput, retransmissions = run_scenario(size, args.messages, args.message_bytes, args.settle_timeout)
+        packets = packet_count(args.message_bytes, fragment_payload_size(size))
+        print(f"{size:>10} {packets:>12} {completion:>10.1%} {throughput:>13.1f} {retransmissions:>10}", file=out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/bench_fanout.py
+# Mede a latência de retransmissão (relay) de uma mensagem em função do tamanho da sala,
+# comparando o caminho antigo (re-fragmentação + pausa de 1 ms por pacote, por destinatário)
+# com o fan-out que codifica a mensagem uma única vez.
+import argparse
+import contextlib
+import io
+import math
+import os
+import socket as skt
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server_chat import UDPServer, get_current_timestamp # noqa: E402
+
+MAX_BUFF_SIZE = 1024
+
+
+def legacy_send_file_content_to_client(server, target_client_addr, content_bytes, original_sender_info_tuple):
+    """Reproduz o envio por destinatário da versão original (cabeçalho e fatias refeitos, sleep por pacote)."""
+    num_packets = math.ceil(len(content_bytes) / server.MAX_BUFF)
+    timestamp_for_clients = get_current_timestamp()
+    header_msg_str = f"MSG_INCOMING:{original_sender_info_tuple[0]}:{original_sender_info_tuple[1]}:{original_sender_info_tuple[2]}:{timestamp_for_clients}:{num_packets}"
+    server.sckt.sendto(header_msg_str.encode('utf-8'), target_client_addr)
+    time.sleep(0.001)
+    for i in range(num_packets):
+        chunk = content_bytes[i * server.MAX_BUFF : (i + 1) * server.MAX_BUFF]
+        server.sckt.sendto(chunk, target_client_addr)
+        time.sleep(0.001)
+
+
+def legacy_relay(server, content_bytes, sender_info, sender_address):
+    """Laço de retransmissão original: um send_file_content_to_client completo por destinatário."""
+    for target_addr in list(server.clients.keys()):
+        if target_addr != sender_address:
+            legacy_send_file_content_to_client(server, target_addr, content_bytes, sender_info)
+
+
+def fanout_relay(server, content_bytes, sender_info, sender_address):
+    """Novo caminho: cabeçalho e fragmentos montados uma vez e enviados a todos os destinatários."""
+    server.broadcast_file_content(content_bytes, sender_info, sender_address=sender_address)
+
+
+def drain(sockets):
+    """Descarta tudo o que estiver pendente nos sockets dos destinatários."""
+    for s in sockets:
+        while True:
+            try:
+                s.recv(65535)
+            except BlockingIOError:
+                break
+
+
+def measure(server, receivers, relay, content_bytes, repeat):
+    """Executa a retransmissão `repeat` vezes e retorna a mediana do tempo em milissegundos."""
+    sender_address = ('127.0.0.1', 1) # Remetente fictício (nunca recebe)
+    sender_info = (sender_address[0], sender_address[1], 'bench')
+    samples = []
+    for _ in range(repeat):
+        drain(receivers)
+        start = time.perf_counter()
+        relay(server, content_bytes, sender_info, sender_address)
+        samples.append((time.perf_counter() - start) * 1000.0)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latência de retransmissão vs. tamanho da sala.")
+    parser.add_argument('--room-sizes', default='1,4,16,64,128', help="Tamanhos de sala separados por vírgula")
+    parser.add_argument('--message-bytes', type=int, default=8 * 1024, help="Tamanho da mensagem retransmitida")
+    parser.add_argument('--repeat', type=int, default=5, help="Repetições por medição (usa a mediana)")
+    parser.add_argument('--skip-legacy', action='store_true', help="Não mede o caminho antigo (lento em salas grandes)")
+    args = parser.parse_args()
+
+    room_sizes = [int(n) for n in args.room_sizes.split(',')]
+    content_bytes = os.urandom(args.message_bytes)
+    num_packets = math.ceil(len(content_bytes) / MAX_BUFF_SIZE)
+
+    with contextlib.redirect_stdout(io.StringIO()): # Silencia as mensagens de inicialização do servidor
+        server = UDPServer('127.0.0.1', 0, MAX_BUFF_SIZE)
+
+    print(f"Mensagem: {len(content_bytes)} bytes ({num_packets} fragmentos + cabeçalho)")
+    print(f"{'clientes':>8} {'antigo (ms)':>12} {'fan-out (ms)':>13} {'ganho':>8}")
+    receivers = []
+    try:
+        for room_size in room_sizes:
+            while len(receivers) < room_size: # Cria os destinatários que faltam para este tamanho de sala
+                r = skt.socket(skt.AF_INET, skt.SOCK_DGRAM)
+                r.bind(('127.0.0.1', 0))
+                r.setblocking(False)
+                receivers.append(r)
+                server._register_client(r.getsockname(), f"user{len(receivers)}") # Entra na sala padrão
+
+            fanout_ms = measure(server, receivers, fanout_relay, content_bytes, args.repeat)
+            if args.skip_legacy:
+                print(f"{room_size:>8} {'-':>12} {fanout_ms:>13.3f} {'-':>8}")
+            else:
+                legacy_ms = measure(server, receivers, legacy_relay, content_bytes, args.repeat)
+                print(f"{room_size:>8} {legacy_ms:>12.3f} {fanout_ms:>13.3f} {legacy_ms / fanout_ms:>7.1f}x")
+    finally:
+        for r in receivers:
+            r.close()
+        server.sckt.close()
+
+
+if __name__ == '__main__':
+    main()
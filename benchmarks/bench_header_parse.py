@@ -0,0 +1,88 @@
+# benchmarks/bench_header_parse.py
+# Compara o custo de interpretar as mensagens de controle mais frequentes (início de upload, no
+# servidor, e cabeçalho de entrega, no cliente) com o parsing antigo por strings (decode +
+# startswith + split), com o modo de compatibilidade de texto e com o cabeçalho binário
+# (struct.Struct pré-compilado + despacho por tabela), incluindo a chamada do tratador.
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_protocol import (INCOMING, UPLOAD_START, decode_control, decode_text_control, encode_control, # noqa: E402
+                           is_control)
+
+
+def legacy_parse_upload_start(data):
+    """Parsing antigo do servidor: decodifica e testa os prefixos dos comandos em ordem."""
+    message_str = data.decode('utf-8')
+    if message_str.startswith("CMD:HI:"):
+        return None
+    elif message_str.startswith("CMD:BYE"):
+        return None
+    elif message_str.startswith("CMD:STATS"):
+        return None
+    elif message_str.startswith("MSG_UPLOAD_START:"):
+        parts = message_str.split(':', 2)
+        return int(parts[1]), int(parts[2])
+
+
+def legacy_parse_incoming(data):
+    """Parsing antigo do cliente para MSG_INCOMING:<id>:<ip>:<porta>:<usuário>:<timestamp>:<num_packets>."""
+    message_str = data.decode('utf-8')
+    if message_str.startswith("NOTIFY:"):
+        return None
+    if message_str.startswith("MSG_INCOMING:"):
+        content_part = message_str[len("MSG_INCOMING:"):]
+        message_id_str, content_part = content_part.split(':', 1)
+        before_num_packets, _, num_packets_str = content_part.rpartition(':')
+        fields = before_num_packets.split(':', 3)
+        return int(message_id_str), fields[0], fields[1], fields[2], fields[3], int(num_packets_str)
+
+
+def dispatch_parse(handlers):
+    """Parsing atual (cliente e servidor): binário ou texto, seguido do despacho pela tabela de tratadores."""
+    def parse(data):
+        message_type, fields = decode_control(data) if is_control(data) else decode_text_control(data.decode('utf-8'))
+        return handlers[message_type](*fields)
+    return parse
+
+
+def measure(parse, data, iterations, rounds):
+    """Mensagens interpretadas por segundo, na melhor de algumas rodadas (descarta as interrompidas por outros processos)."""
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            parse(data)
+        best = min(best, time.perf_counter() - start)
+    return iterations / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mensagens de controle interpretadas por segundo: texto vs. binário.")
+    parser.add_argument('--iterations', type=int, default=200000, help="Mensagens interpretadas por rodada")
+    parser.add_argument('--rounds', type=int, default=5, help="Rodadas por caso; vale a mais rápida")
+    args = parser.parse_args()
+
+    handler = lambda *fields: fields # noqa: E731 (o tratador real faz o mesmo trabalho nos dois protocolos)
+    upload_start = (UPLOAD_START, 123456, 64)
+    incoming = (INCOMING, 123456, '192.168.0.10', 54321, 'alice', int(time.time()), 64)
+    cases = [
+        ("UPLOAD_START (servidor)", upload_start, legacy_parse_upload_start, dispatch_parse({UPLOAD_START: handler})),
+        ("INCOMING (cliente)", incoming, legacy_parse_incoming, dispatch_parse({INCOMING: handler})),
+    ]
+
+    print(f"{'mensagem':<24} {'formato':<22} {'bytes':>6} {'msgs/s':>11} {'ganho':>6}")
+    for name, message, legacy_parse, parse in cases:
+        text_data, binary_data = encode_control(*message, text=True), encode_control(*message)
+        baseline = measure(legacy_parse, text_data, args.iterations, args.rounds)
+        for label, data, rate in (("texto (parsing antigo)", text_data, baseline),
+                                  ("texto (compatibilidade)", text_data, measure(parse, text_data, args.iterations, args.rounds)),
+                                  ("binário", binary_data, measure(parse, binary_data, args.iterations, args.rounds))):
+            print(f"{name:<24} {label:<22} {len(data):>6} {rate:>11.0f} {rate / baseline:>5.2f}x")
+
+
+if __name__ == '__main__':
+    main()
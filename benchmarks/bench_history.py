@@ -0,0 +1,80 @@
+# benchmarks/bench_history.py
+# Mede o custo de entregar o histórico de uma sala a um cliente que entra: montar de novo o
+# cabeçalho e os fragmentos de cada mensagem (o que o servidor faria guardando só o conteúdo)
+# vs. reaproveitar os pacotes já codificados do histórico em memória, e vs. lê-los do log em
+# disco (mmap). Mede também o custo de guardar cada mensagem, pago a cada retransmissão.
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_protocol import DEFAULT_ROOM, ENCODING_NONE, TARGET_ROOM # noqa: E402
+from history import MessageHistory # noqa: E402
+from server_chat import UDPServer # noqa: E402
+
+MAX_BUFF_SIZE = 1024
+SENDER_INFO = ('127.0.0.1', 40000, 'bench')
+
+
+def replay_reencoding(server, contents):
+    """Sem pacotes guardados: monta cabeçalho e fragmentos de cada mensagem para o cliente."""
+    return [server._build_file_packets(content, SENDER_INFO, MAX_BUFF_SIZE, False, ENCODING_NONE, TARGET_ROOM, DEFAULT_ROOM)
+            for content in contents]
+
+
+def best_of(function, repeat):
+    """Menor tempo (em segundos) de `repeat` execuções."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entrega do histórico de uma sala: remontagem vs. pacotes guardados.")
+    parser.add_argument('--messages', default='50,200,1000', help="Mensagens no histórico, separadas por vírgula")
+    parser.add_argument('--message-bytes', default='200,4000', help="Tamanhos de mensagem, separados por vírgula")
+    parser.add_argument('--repeat', type=int, default=5, help="Repetições por medição (usa a menor)")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()): # Silencia as mensagens de inicialização do servidor
+        server = UDPServer('127.0.0.1', 0, MAX_BUFF_SIZE, batch_io=False)
+    server.sckt.close()
+    print(f"Datagramas de {MAX_BUFF_SIZE} bytes; tempos em µs por mensagem entregue do histórico")
+    print(f"{'mensagens':>9} {'bytes':>6} {'remontagem':>11} {'memória':>8} {'ganho':>6} {'log (mmap)':>11} "
+          f"{'guardar':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for num_messages in (int(n) for n in args.messages.split(',')):
+            for message_bytes in (int(n) for n in args.message_bytes.split(',')):
+                contents = [os.urandom(message_bytes) for _ in range(num_messages)]
+                packets = replay_reencoding(server, contents)
+                memory = MessageHistory(max_messages=num_messages, max_bytes=1 << 40, max_total_bytes=1 << 40)
+                start = time.perf_counter()
+                for message_id, message_packets in enumerate(packets, 1):
+                    memory.add(DEFAULT_ROOM, message_id, message_packets)
+                add_us = (time.perf_counter() - start) * 1e6 / num_messages
+                # Histórico só em disco: memória para uma mensagem, o resto vai para o log
+                log_path = os.path.join(tmp, f"history-{num_messages}-{message_bytes}.log")
+                on_disk = MessageHistory(max_messages=1, log_path=log_path)
+                for message_id, message_packets in enumerate(packets, 1):
+                    on_disk.add(DEFAULT_ROOM, message_id, message_packets)
+                assert len(memory.since(DEFAULT_ROOM, 0)) == len(on_disk.since(DEFAULT_ROOM, 0)) == num_messages
+
+                reencode_s = best_of(lambda: replay_reencoding(server, contents), args.repeat)
+                memory_s = best_of(lambda: memory.since(DEFAULT_ROOM, 0), args.repeat)
+                disk_s = best_of(lambda: on_disk.since(DEFAULT_ROOM, 0), args.repeat)
+                on_disk.close()
+                reencode_us, memory_us, disk_us = (seconds * 1e6 / num_messages for seconds in (reencode_s, memory_s, disk_s))
+                print(f"{num_messages:>9} {message_bytes:>6} {reencode_us:>11.2f} {memory_us:>8.3f} "
+                      f"{reencode_us / memory_us:>5.0f}x {disk_us:>11.2f} {add_us:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/bench_liveness.py
+# Mede o custo da detecção de clientes sem sinal de vida: varredura de todos os clientes
+# conferindo o último datagrama de cada um vs. a roda de timers do servidor, que só olha os
+# prazos vencidos (e reagenda os clientes que deram sinal de vida). As tarefas periódicas
+# rodam a cada iteração do loop do servidor: entre dois ticks da roda, a verificação dela é
+# constante, enquanto a varredura custaria sempre O(clientes).
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server_chat import CLIENT_TIMEOUT, LIVENESS_RESOLUTION, UDPServer # noqa: E402
+
+
+def scan_expired(last_seen, now, timeout):
+    """Expiração por varredura: confere todos os clientes."""
+    return [client_addr for client_addr, seen in last_seen.items() if now - seen > timeout]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Custo da expiração de clientes: varredura vs. roda de timers.")
+    parser.add_argument('--clients', default='1000,10000,100000', help="Números de clientes conectados, separados por vírgula")
+    parser.add_argument('--ticks', type=int, default=2 * int(CLIENT_TIMEOUT), help="Ticks simulados (um por resolução da roda)")
+    parser.add_argument('--dead', type=float, default=0.01, help="Fração dos clientes que para de dar sinal de vida")
+    args = parser.parse_args()
+    if args.ticks <= CLIENT_TIMEOUT: # Os clientes que param só expiram depois do tempo limite
+        parser.error(f"--ticks precisa ser maior que o tempo limite ({CLIENT_TIMEOUT:g} ticks)")
+
+    tick = LIVENESS_RESOLUTION
+    print(f"Tempo limite: {CLIENT_TIMEOUT:g}s; {args.ticks} ticks de {tick:g}s; clientes conectados ao longo de "
+          f"{CLIENT_TIMEOUT:g}s; {args.dead:.0%} param de dar sinal de vida")
+    print(f"{'clientes':>9} {'varredura (µs/tick)':>20} {'roda (µs/tick)':>15} {'ganho':>6} "
+          f"{'roda entre ticks (µs)':>22} {'expirados':>10}")
+    for num_clients in (int(n) for n in args.clients.split(',')):
+        with contextlib.redirect_stdout(io.StringIO()): # Silencia a inicialização e os avisos de expiração
+            server = UDPServer('127.0.0.1', 0, 1024, batch_io=False)
+        server.sckt.close()
+        start_now = time.monotonic()
+        clients = [('127.0.0.2', 1024 + i) for i in range(num_clients)]
+        for i, client_addr in enumerate(clients): # O que add_client faz para quem negocia o heartbeat
+            connected = start_now - (i % int(CLIENT_TIMEOUT))
+            server.last_seen[client_addr] = connected
+            server.liveness_wheel.schedule(client_addr, connected + server.client_timeout)
+        # Só a detecção é medida: a remoção (e a notificação das salas) custa o mesmo nos dois casos
+        expired_by_wheel = []
+        def remove_clients(client_addresses, reason=""):
+            for client_addr in client_addresses:
+                del server.last_seen[client_addr]
+            expired_by_wheel.extend(client_addresses)
+        server.remove_clients = remove_clients
+        scan_seen = dict(server.last_seen)
+        alive = clients[int(num_clients * args.dead):]
+
+        scan_ns = wheel_ns = idle_ns = 0
+        expired_by_scan = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            for tick_number in range(1, args.ticks + 1):
+                now = start_now + tick_number * tick
+                for client_addr in alive: # Datagramas recebidos durante o tick (fora da medição)
+                    server.last_seen[client_addr] = scan_seen[client_addr] = now - tick / 2
+                start = time.perf_counter_ns()
+                for client_addr in scan_expired(scan_seen, now, server.client_timeout):
+                    del scan_seen[client_addr]
+                    expired_by_scan += 1
+                scan_ns += time.perf_counter_ns() - start
+                start = time.perf_counter_ns()
+                server.service_liveness(now)
+                wheel_ns += time.perf_counter_ns() - start
+                start = time.perf_counter_ns()
+                server.service_liveness(now) # Nova iteração do loop antes do próximo tick
+                idle_ns += time.perf_counter_ns() - start
+        assert len(expired_by_wheel) == expired_by_scan == num_clients - len(alive)
+        scan_us, wheel_us, idle_us = (ns / args.ticks / 1000 for ns in (scan_ns, wheel_ns, idle_ns))
+        print(f"{num_clients:>9} {scan_us:>20.1f} {wheel_us:>15.1f} {scan_us / wheel_us:>5.1f}x "
+              f"{idle_us:>22.2f} {len(expired_by_wheel):>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,386 @@
+# benchmarks/bench_load.py
+# Gerador de carga: centenas ou milhares de clientes simulados contra um servidor local.
+#
+# Cada cliente é um socket com um ClientSession (mesmo protocolo do terminal: CMD:HI,
+# MSG_UPLOAD_START, fragmentos e, opcionalmente, entrega confiável), sem thread nem console:
+# um único laço com selector atende os sockets de todos eles e dispara os envios no ritmo pedido.
+# Cada mensagem leva o instante de envio, então a latência medida é a do caminho completo
+# (cliente -> servidor -> demais clientes), e um enchimento próprio do remetente, com o tamanho,
+# então cada entrega também é conferida (fragmentos de mensagens diferentes misturados na
+# remontagem aparecem como entregas corrompidas). O resultado sai em JSON, para comparar commits.
+import argparse
+import contextlib
+import heapq
+import json
+import multiprocessing
+import os
+import random
+import selectors
+import socket as skt
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from client_core import ClientSession, Notification # noqa: E402
+from metrics import LatencyHistogram, query_stats # noqa: E402
+from pacing import parse_pacing # noqa: E402
+from reliability import RELIABILITY_TICK # noqa: E402
+
+MAX_BUFF_SIZE = 1024
+EXPIRE_INTERVAL = 1.0 # Segundos entre as tarefas periódicas dos clientes sem entrega confiável
+JOIN_RETRY_INTERVAL = 1.0 # Segundos sem CMD:WELCOME até reenviar o CMD:HI de um cliente
+WORKERS_STARTUP_DELAY = 1.0 # Segundos de espera pelos workers iniciados localmente (--server workers:N)
+
+
+class LoadClient:
+    """Cliente simulado sobre o ClientSession: registra a latência das mensagens recebidas em vez de exibi-las."""
+    def __init__(self, server_address, username, max_buff, reliable=False, pacing=None, request_max_buff=None,
+                 latency=None):
+        self.server_address = server_address
+        self.sckt = skt.socket(skt.AF_INET, skt.SOCK_DGRAM)
+        self.sckt.bind(('127.0.0.1', 0))
+        rate_controller_factory = parse_pacing(pacing)
+        rate_controller = rate_controller_factory() if rate_controller_factory is not None else None
+        self.session = ClientSession(username, max_buff, reliable=reliable, rate_controller=rate_controller,
+                                     request_max_buff=request_max_buff)
+        self.latency = latency # LatencyHistogram compartilhado por todos os clientes
+        self.notifications = 0
+        self.delivered = 0
+        self.delivered_bytes = 0
+        self.corrupted = 0 # Entregas com tamanho ou enchimento diferentes dos enviados
+        self.receive_errors = 0 # Datagramas recusados pelo ClientSession (ValueError)
+        self.last_delivery = None
+
+    @property
+    def welcomed(self):
+        return self.session.welcomed
+
+    @property
+    def reliable_sender(self):
+        return self.session.reliable_sender
+
+    def _send(self, packets):
+        for packet in packets:
+            self.sckt.sendto(packet, self.server_address)
+
+    def send_hello(self):
+        self.sckt.sendto(self.session.hello(), self.server_address)
+
+    def send_message(self, message):
+        packets = self.session.upload(message.encode('utf-8'))
+        if not self.session.paced:
+            self._send(packets)
+            return
+        rate_controller = self.session.rate_controller
+        for packet in packets: # Mesmo ritmo do UDPClient: espera as fichas do controlador de taxa
+            wait = rate_controller.reserve(time.monotonic())
+            if wait > 0:
+                time.sleep(wait)
+            self.sckt.sendto(packet, self.server_address)
+
+    def on_datagram(self, data):
+        try:
+            events = self.session.receive(data)
+        except ValueError:
+            self.receive_errors += 1
+            events = []
+        self._send(self.session.take_outgoing())
+        for event in events:
+            if isinstance(event, Notification): # Entradas/saídas da sala: só conta
+                self.notifications += 1
+                continue
+            # Conteúdo: "<remetente>:<sequência>:<enviado em (ns)>:<tamanho do enchimento>:<enchimento>"
+            content = bytes(event.content)
+            sender, _, sent_ns, filler_size, filler = content.split(b":", 4)
+            if len(filler) != int(filler_size) or filler.strip(filler_byte(int(sender))):
+                self.corrupted += 1
+                continue
+            now = time.perf_counter_ns()
+            self.latency.record((now - int(sent_ns)) // 1000)
+            self.delivered += 1
+            self.delivered_bytes += len(event.content)
+            self.last_delivery = now
+
+    def poll(self, now):
+        self.session.poll(now)
+        self._send(self.session.take_outgoing())
+
+    def close(self):
+        try:
+            self.sckt.sendto(self.session.bye(), self.server_address)
+        except OSError:
+            pass
+        self.sckt.close()
+
+
+def parse_size_mix(spec):
+    """Interpreta '64:0.7,1024:0.2,16384:0.1' (bytes:peso) como (tamanhos, pesos)."""
+    sizes, weights = [], []
+    for item in spec.split(','):
+        size, _, weight = item.partition(':')
+        sizes.append(int(size))
+        weights.append(float(weight) if weight else 1.0)
+    return sizes, weights
+
+
+def filler_byte(sender):
+    """Byte de enchimento das mensagens de um remetente (letras diferentes para remetentes vizinhos)."""
+    return bytes([ord('a') + sender % 26])
+
+
+def _serve(impl, pacing, port_queue):
+    """Processo do servidor: informa a porta escolhida e atende até ser terminado."""
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        if impl.startswith('workers:'): # N processos na mesma porta (server_workers.py)
+            from server_workers import run_workers
+            with contextlib.closing(skt.socket(skt.AF_INET, skt.SOCK_DGRAM)) as probe: # Porta livre para todos os workers
+                probe.bind(('127.0.0.1', 0))
+                port = probe.getsockname()[1]
+            port_queue.put(port)
+            run_workers('127.0.0.1', port, MAX_BUFF_SIZE, int(impl.partition(':')[2]), pacing=pacing, chat_log=False)
+        elif impl == 'async':
+            import asyncio
+            from async_server_chat import AsyncUDPServer
+
+            async def main():
+                server = AsyncUDPServer('127.0.0.1', 0, MAX_BUFF_SIZE, pacing=pacing)
+                await server.start()
+                port_queue.put(server.transport.get_extra_info('sockname')[1])
+                await asyncio.Event().wait()
+            asyncio.run(main())
+        else:
+            from server_chat import UDPServer
+            server = UDPServer('127.0.0.1', 0, MAX_BUFF_SIZE, pacing=pacing)
+            port_queue.put(server.sckt.getsockname()[1])
+            server.run()
+
+
+def start_server(impl, pacing):
+    """Inicia o servidor em outro processo (sem disputar o GIL com os clientes); retorna (processo, endereço)."""
+    port_queue = multiprocessing.Queue()
+    # Processos daemon não podem iniciar outros, e o modo workers inicia um por worker
+    process = multiprocessing.Process(target=_serve, args=(impl, pacing, port_queue), daemon=not impl.startswith('workers:'))
+    process.start()
+    address = ('127.0.0.1', port_queue.get(timeout=10))
+    if impl.startswith('workers:'):
+        time.sleep(WORKERS_STARTUP_DELAY) # A porta é informada antes de os workers a abrirem
+    return process, address
+
+
+def raise_fd_limit(needed):
+    """Sobe o limite de descritores abertos (um socket por cliente), até o máximo permitido."""
+    try:
+        import resource
+    except ImportError: # Ex: Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (needed if hard == resource.RLIM_INFINITY else min(needed, hard), hard))
+
+
+def git_revision():
+    """Commit atual do repositório (para identificar o resultado), ou None."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class LoadGenerator:
+    """Conecta os clientes simulados, gera a carga e mede entregas e latências."""
+    def __init__(self, server_address, num_clients, senders, rate, size_mix, reliable=False, pacing=None,
+                 max_buff=None, seed=1):
+        self.server_address = server_address
+        self.latency = LatencyHistogram()
+        self.clients = [LoadClient(server_address, f"load{i}", MAX_BUFF_SIZE, reliable=reliable, pacing=pacing,
+                                   request_max_buff=max_buff or MAX_BUFF_SIZE, latency=self.latency)
+                        for i in range(num_clients)]
+        self.senders = self.clients[:senders]
+        self.rate = rate
+        self.sizes, self.weights = size_mix
+        self.reliable = reliable
+        self.random = random.Random(seed)
+        self.selector = selectors.DefaultSelector()
+        for client in self.clients:
+            self.selector.register(client.sckt, selectors.EVENT_READ, client)
+        self._next_client_poll = 0.0
+        self.joined = 0
+        self.sent = 0
+        self.sent_bytes = 0
+
+    def _poll(self, timeout):
+        """Processa os datagramas que chegarem em até `timeout` segundos e as tarefas periódicas dos clientes."""
+        for key, _ in self.selector.select(timeout):
+            client = key.data
+            data, address = client.sckt.recvfrom(65535)
+            if address == client.server_address:
+                client.on_datagram(data)
+        now = time.monotonic()
+        if now >= self._next_client_poll: # Retransmissões (entrega confiável) e mensagens recebidas pela metade
+            self._next_client_poll = now + (RELIABILITY_TICK if self.reliable else EXPIRE_INTERVAL)
+            for client in self.clients:
+                client.poll(now)
+
+    def join(self, join_rate, timeout):
+        """Envia os CMD:HI (no máximo `join_rate` por segundo) e espera o CMD:WELCOME de todos os clientes.
+
+        Cada cliente pede um tamanho de datagrama, então o servidor sempre confirma a entrada; sob
+        carga (cada entrada gera uma notificação para toda a sala) um CMD:HI pode se perder e é reenviado.
+        """
+        start = time.perf_counter()
+        for i, client in enumerate(self.clients):
+            client.send_hello()
+            deadline = start + (i + 1) / join_rate
+            while time.perf_counter() < deadline:
+                self._poll(max(0.0, deadline - time.perf_counter()))
+        next_retry = time.perf_counter() + JOIN_RETRY_INTERVAL
+        while time.perf_counter() - start < timeout:
+            missing = [client for client in self.clients if not client.welcomed]
+            if not missing:
+                break
+            if time.perf_counter() >= next_retry:
+                for client in missing:
+                    client.send_hello()
+                next_retry = time.perf_counter() + JOIN_RETRY_INTERVAL
+            self._poll(0.05)
+        self.joined = sum(client.welcomed for client in self.clients)
+        return time.perf_counter() - start
+
+    def run(self, duration, settle):
+        """Gera carga por `duration` segundos e espera as entregas por até `settle` segundos sem progresso."""
+        # Chegadas de Poisson: intervalos exponenciais com média 1/rate para cada remetente
+        schedule = [(time.perf_counter() + self.random.expovariate(self.rate), i) for i in range(len(self.senders))]
+        heapq.heapify(schedule)
+        fillers = {sender: filler_byte(sender).decode('ascii') * max(self.sizes) for sender in range(len(self.senders))}
+        sequences = [0] * len(self.senders)
+        start = time.perf_counter()
+        end = start + duration
+        while True:
+            now = time.perf_counter()
+            while schedule[0][0] <= now and now < end:
+                _, i = heapq.heappop(schedule)
+                size = self.random.choices(self.sizes, self.weights)[0]
+                prefix = f"{i}:{sequences[i]}:{time.perf_counter_ns()}:"
+                filler_size = max(0, size - len(prefix) - len(str(size)) - 1)
+                message = f"{prefix}{filler_size}:{fillers[i][:filler_size]}"
+                self.senders[i].send_message(message)
+                sequences[i] += 1
+                self.sent += 1
+                self.sent_bytes += len(message)
+                heapq.heappush(schedule, (now + self.random.expovariate(self.rate), i))
+            if now >= end:
+                break
+            self._poll(max(0.0, min(schedule[0][0], end) - time.perf_counter()))
+
+        expected = self.sent * (self.joined - 1) # Cada mensagem vai para todos os outros da sala
+        last_count, last_progress = -1, time.perf_counter()
+        while time.perf_counter() - last_progress < settle:
+            delivered = sum(client.delivered for client in self.clients)
+            if delivered >= expected:
+                break
+            if delivered != last_count:
+                last_count, last_progress = delivered, time.perf_counter()
+            self._poll(0.01)
+        return start
+
+    def results(self, start):
+        """Resumo da execução: mensagens enviadas/entregues, perda, vazão entregue e latências."""
+        delivered = sum(client.delivered for client in self.clients)
+        delivered_bytes = sum(client.delivered_bytes for client in self.clients)
+        last_delivery = max((client.last_delivery for client in self.clients if client.last_delivery), default=None)
+        elapsed = (last_delivery / 1e9 - start) if last_delivery else 0.0
+        expected = self.sent * (self.joined - 1) # Cada mensagem vai para todos os outros da sala
+        return {
+            'joined_clients': self.joined,
+            'sent_messages': self.sent,
+            'sent_bytes': self.sent_bytes,
+            'expected_deliveries': expected,
+            'delivered': delivered,
+            'corrupted': sum(client.corrupted for client in self.clients),
+            'receive_errors': sum(client.receive_errors for client in self.clients),
+            'loss_rate': round(1 - delivered / expected, 6) if expected else 0.0,
+            'elapsed_seconds': round(elapsed, 3),
+            'delivered_messages_per_second': round(delivered / elapsed, 1) if elapsed > 0 else 0.0,
+            'delivered_mb_per_second': round(delivered_bytes / elapsed / 2 ** 20, 3) if elapsed > 0 else 0.0,
+            'latency_us': self.latency.summary(),
+            'retransmissions': sum(client.reliable_sender.retransmissions for client in self.clients
+                                   if client.reliable_sender is not None),
+        }
+
+    def close(self):
+        for client in self.clients:
+            self.selector.unregister(client.sckt)
+            client.close() # Envia o CMD:BYE
+        self.selector.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de carga para o servidor de chat (resultado em JSON).")
+    parser.add_argument('--clients', type=int, default=200, help="Clientes simulados na sala")
+    parser.add_argument('--senders', type=int, default=None, help="Quantos desses clientes enviam mensagens (padrão: todos)")
+    parser.add_argument('--rate', type=float, default=0.5, help="Mensagens por segundo de cada remetente (chegadas de Poisson)")
+    parser.add_argument('--sizes', default='64:0.7,1024:0.2,16384:0.1', help="Mistura de tamanhos de mensagem: bytes:peso,...")
+    parser.add_argument('--duration', type=float, default=10.0, help="Segundos gerando carga")
+    parser.add_argument('--settle', type=float, default=2.0, help="Segundos sem entregas antes de encerrar a medição")
+    parser.add_argument('--reliable', action='store_true', help="Clientes pedem entrega confiável")
+    parser.add_argument('--pacing', default=None, help="Controle de taxa (no servidor iniciado e nos clientes)")
+    parser.add_argument('--max-buff', type=int, default=None, help="Tamanho de datagrama pedido no CMD:HI")
+    parser.add_argument('--server', default='sync', help="Servidor iniciado localmente (sync, async ou workers:N) ou host:porta de um já em execução")
+    parser.add_argument('--join-rate', type=float, default=500.0, help="CMD:HI por segundo durante a entrada na sala")
+    parser.add_argument('--join-timeout', type=float, default=30.0, help="Tempo máximo esperando todos entrarem")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default=None, help="Arquivo JSON de saída (padrão: stdout)")
+    args = parser.parse_args()
+
+    senders = args.senders if args.senders is not None else args.clients
+    if not 1 <= senders <= args.clients:
+        parser.error("--senders precisa estar entre 1 e --clients")
+
+    raise_fd_limit(args.clients + 64)
+    server_process = None
+    if args.server in ('sync', 'async') or args.server.startswith('workers:'):
+        server_process, server_address = start_server(args.server, args.pacing)
+    else:
+        host, _, port = args.server.rpartition(':')
+        server_address = (host, int(port))
+
+    try:
+        generator = LoadGenerator(server_address, args.clients, senders, args.rate, parse_size_mix(args.sizes),
+                                  reliable=args.reliable, pacing=args.pacing, max_buff=args.max_buff, seed=args.seed)
+        try:
+            join_seconds = generator.join(args.join_rate, args.join_timeout)
+            start = generator.run(args.duration, args.settle)
+            results = generator.results(start)
+        finally:
+            generator.close()
+        try: # Métricas do próprio servidor (CMD:STATS), se ele responder
+            server_stats = query_stats(*server_address)['metrics']
+        except (OSError, ValueError):
+            server_stats = None
+    finally:
+        if server_process is not None:
+            server_process.terminate()
+            server_process.join()
+
+    report = {
+        'revision': git_revision(),
+        'config': {'clients': args.clients, 'senders': senders, 'rate_per_sender': args.rate, 'sizes': args.sizes,
+                   'duration': args.duration, 'reliable': args.reliable, 'pacing': args.pacing, 'max_buff': args.max_buff,
+                   'server': args.server},
+        'join_seconds': round(join_seconds, 3),
+        **results,
+        'server_metrics': server_stats,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
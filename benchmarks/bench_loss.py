@@ -0,0 +1,169 @@
+# benchmarks/bench_loss.py
+# Harness local com perda de pacotes: um proxy UDP entre os clientes e o servidor descarta
+# datagramas aleatoriamente (nos dois sentidos). Mede a taxa de entrega e a vazão das
+# mensagens com e sem a entrega confiável (ACK/NACK com janela deslizante), com e sem
+# controle de taxa (pacing) no servidor e nos clientes.
+import argparse
+import contextlib
+import os
+import random
+import selectors
+import socket as skt
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from client_chat import UDPClient # noqa: E402
+from reliability import RELIABILITY_TICK # noqa: E402
+from server_chat import UDPServer # noqa: E402
+
+MAX_BUFF_SIZE = 1024
+
+
+class LossyProxy:
+    """Proxy UDP que repassa datagramas entre clientes e servidor, descartando uma fração deles."""
+    def __init__(self, server_address, seed=1):
+        self.server_address = server_address
+        self.loss_rate = 0.0 # Começa sem perdas para que o CMD:HI/CMD:WELCOME sempre passem
+        self.random = random.Random(seed)
+        self.public = skt.socket(skt.AF_INET, skt.SOCK_DGRAM) # Lado dos clientes
+        self.public.bind(('127.0.0.1', 0))
+        self.address = self.public.getsockname()
+        self.upstreams = {} # {endereço do cliente: socket usado para falar com o servidor}
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.public, selectors.EVENT_READ, None)
+        self.dropped = 0
+        self.forwarded = 0
+        self.running = True
+
+    def _drop(self):
+        if self.loss_rate and self.random.random() < self.loss_rate:
+            self.dropped += 1
+            return True
+        self.forwarded += 1
+        return False
+
+    def run(self):
+        while self.running:
+            for key, _ in self.selector.select(timeout=0.1):
+                if key.data is None: # Cliente -> servidor
+                    data, client_address = self.public.recvfrom(65535)
+                    upstream = self.upstreams.get(client_address)
+                    if upstream is None: # Um socket por cliente preserva endereços distintos no servidor
+                        upstream = self.upstreams[client_address] = skt.socket(skt.AF_INET, skt.SOCK_DGRAM)
+                        upstream.bind(('127.0.0.1', 0))
+                        self.selector.register(upstream, selectors.EVENT_READ, client_address)
+                    if not self._drop():
+                        upstream.sendto(data, self.server_address)
+                else: # Servidor -> cliente
+                    data = key.fileobj.recv(65535)
+                    if not self._drop():
+                        self.public.sendto(data, key.data)
+
+    def close(self):
+        self.running = False
+        for upstream in self.upstreams.values():
+            upstream.close()
+        self.public.close()
+
+
+class CountingClient(UDPClient):
+    """Cliente que conta as mensagens entregues em vez de exibi-las."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delivered = set()
+        self.delivered_bytes = 0
+        self.last_delivery = None
+
+    def _display_chat_message(self, message):
+        message_index = bytes(message.content.split(b":", 1)[0])
+        if message_index not in self.delivered:
+            self.delivered.add(message_index)
+            self.delivered_bytes += len(message.content)
+            self.last_delivery = time.perf_counter()
+
+    def _display_prompt(self):
+        pass
+
+
+def run_scenario(loss_rate, reliable, messages, message_bytes, settle_timeout, pacing=None):
+    """Executa um cenário e retorna (taxa de entrega, vazão em KB/s, retransmissões do remetente)."""
+    server = UDPServer('127.0.0.1', 0, MAX_BUFF_SIZE, pacing=pacing)
+    proxy = LossyProxy(server.sckt.getsockname())
+    server_running = threading.Event()
+    server_running.set()
+
+    def serve():
+        # Mesmo laço do UDPServer.run(), mas que pode ser encerrado ao fim do cenário
+        server.sckt.settimeout(RELIABILITY_TICK)
+        while server_running.is_set():
+            server.serve_one_datagram()
+            server.service_timers()
+
+    server_thread = threading.Thread(target=serve, daemon=True)
+    server_thread.start()
+    threading.Thread(target=proxy.run, daemon=True).start()
+
+    sender = CountingClient(*proxy.address, MAX_BUFF_SIZE, reliable=reliable, pacing=pacing)
+    receiver = CountingClient(*proxy.address, MAX_BUFF_SIZE, reliable=reliable, pacing=pacing)
+    try:
+        for client, username in ((receiver, 'receiver'), (sender, 'sender')):
+            client.username = username
+            threading.Thread(target=client.receive_messages, daemon=True).start()
+            client.send_hello()
+        time.sleep(0.3) # Espera os CMD:WELCOME antes de ligar as perdas
+        proxy.loss_rate = loss_rate
+
+        filler = "x" * message_bytes
+        start = time.perf_counter()
+        for i in range(messages):
+            sender.send_message(f"{i}:{filler}")
+
+        # Espera todas as entregas, ou até ficar `settle_timeout` segundos sem progresso
+        last_count, last_progress = -1, time.perf_counter()
+        while len(receiver.delivered) < messages and time.perf_counter() - last_progress < settle_timeout:
+            if len(receiver.delivered) != last_count:
+                last_count, last_progress = len(receiver.delivered), time.perf_counter()
+            time.sleep(0.01)
+
+        elapsed = (receiver.last_delivery or time.perf_counter()) - start
+        completion = len(receiver.delivered) / messages
+        throughput = receiver.delivered_bytes / elapsed / 1024 if elapsed > 0 else 0.0
+        retransmissions = sender.reliable_sender.retransmissions if sender.reliable_sender else 0
+        return completion, throughput, retransmissions
+    finally:
+        for client in (sender, receiver):
+            client.stop_event.set()
+            client.close()
+        proxy.close()
+        server_running.clear()
+        server_thread.join()
+        server.sckt.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entrega e vazão com perda de pacotes injetada.")
+    parser.add_argument('--loss-rates', default='0,0.01,0.05,0.10', help="Taxas de perda separadas por vírgula")
+    parser.add_argument('--messages', type=int, default=50, help="Mensagens enviadas por cenário")
+    parser.add_argument('--message-bytes', type=int, default=16 * 1024, help="Tamanho de cada mensagem")
+    parser.add_argument('--settle-timeout', type=float, default=3.0, help="Segundos sem progresso antes de encerrar o cenário")
+    parser.add_argument('--pacing', default='none,aimd', help="Configurações de pacing comparadas, separadas por vírgula")
+    args = parser.parse_args()
+
+    out = sys.stdout
+    print(f"{args.messages} mensagens de {args.message_bytes} bytes por cenário", file=out)
+    print(f"{'perda':>6} {'modo':>10} {'pacing':>12} {'entregues':>10} {'vazão (KB/s)':>13} {'retransm.':>10}", file=out)
+    for loss_rate in (float(r) for r in args.loss_rates.split(',')):
+        for reliable in (False, True):
+            for pacing in args.pacing.split(','):
+                with contextlib.redirect_stdout(open(os.devnull, 'w')): # Silencia os logs de servidor/clientes
+                    completion, throughput, retransmissions = run_scenario(
+                        loss_rate, reliable, args.messages, args.message_bytes, args.settle_timeout, pacing)
+                mode = "confiável" if reliable else "simples"
+                print(f"{loss_rate:>6.0%} {mode:>10} {pacing:>12} {completion:>10.1%} {throughput:>13.1f} {retransmissions:>10}", file=out)
+
+
+if __name__ == '__main__':
+    main()
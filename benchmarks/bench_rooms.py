@@ -0,0 +1,130 @@
+# benchmarks/bench_rooms.py
+# Mede o custo por mensagem da entrega em uma sala e de uma mensagem privada à medida que o
+# número de salas (e, com ele, de clientes conectados) cresce, com o tamanho da sala fixo:
+# varredura de todos os clientes conferindo a sala de cada um (e busca linear pelo nome) vs.
+# índices sala -> membros e nome -> endereço, em que o custo só depende do tamanho da sala.
+import argparse
+import contextlib
+import io
+import os
+import socket as skt
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_protocol import TARGET_ROOM # noqa: E402
+from server_chat import UDPServer # noqa: E402
+
+MAX_BUFF_SIZE = 1024
+TARGET_ROOM_NAME = "sala0" # Sala medida (a única com destinatários reais)
+
+
+def scan_relay(server, content_bytes, sender_info, sender_address, room):
+    """Entrega por varredura: percorre todos os clientes conectados e confere se cada um está na sala."""
+    packets = server._build_file_packets(content_bytes, sender_info, None, False, TARGET_ROOM, TARGET_ROOM, room)
+    for target_addr in list(server.clients.keys()):
+        if target_addr != sender_address and room in server.client_rooms.get(target_addr, ()):
+            server.send_file_content_to_client(target_addr, None, sender_info, packets=packets)
+
+
+def indexed_relay(server, content_bytes, sender_info, sender_address, room):
+    """Entrega pelo índice sala -> membros."""
+    server.broadcast_file_content(content_bytes, sender_info, sender_address=sender_address, room=room)
+
+
+def scan_lookup(server, username):
+    """Busca linear do endereço de um usuário (mensagem privada)."""
+    for client_addr, name in server.clients.items():
+        if name == username:
+            return client_addr
+    return None
+
+
+def indexed_lookup(server, username):
+    """Busca pelo índice nome -> endereço."""
+    return server.usernames.get(username)
+
+
+def drain(sockets):
+    """Descarta tudo o que estiver pendente nos sockets dos destinatários."""
+    for s in sockets:
+        while True:
+            try:
+                s.recv(65535)
+            except BlockingIOError:
+                break
+
+
+def measure_relay(server, receivers, relay, content_bytes, repeat):
+    """Mediana, em microssegundos, de uma entrega na sala medida."""
+    sender_address = ('127.0.0.1', 1) # Remetente fictício (nunca recebe)
+    sender_info = (sender_address[0], sender_address[1], 'bench')
+    samples = []
+    for _ in range(repeat):
+        drain(receivers)
+        start = time.perf_counter()
+        relay(server, content_bytes, sender_info, sender_address, TARGET_ROOM_NAME)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def measure_lookup(server, lookup, username, iterations):
+    """Tempo médio, em microssegundos, de uma busca de destinatário."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        lookup(server, username)
+    return (time.perf_counter() - start) * 1e6 / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Custo por mensagem vs. número de salas (tamanho de sala fixo).")
+    parser.add_argument('--room-counts', default='1,16,64,256,1024', help="Números de salas separados por vírgula")
+    parser.add_argument('--room-size', type=int, default=16, help="Membros por sala")
+    parser.add_argument('--message-bytes', type=int, default=256, help="Tamanho da mensagem entregue")
+    parser.add_argument('--repeat', type=int, default=51, help="Repetições por medição (usa a mediana)")
+    args = parser.parse_args()
+
+    content_bytes = os.urandom(args.message_bytes)
+    with contextlib.redirect_stdout(io.StringIO()): # Silencia as mensagens de inicialização do servidor
+        server = UDPServer('127.0.0.1', 0, MAX_BUFF_SIZE)
+    # Só a sala medida tem sockets reais; as demais são endereços fictícios que nunca recebem nada
+    receivers = []
+    for i in range(args.room_size):
+        r = skt.socket(skt.AF_INET, skt.SOCK_DGRAM)
+        r.bind(('127.0.0.1', 0))
+        r.setblocking(False)
+        receivers.append(r)
+        server._register_client(r.getsockname(), f"sala0-user{i}")
+        server._add_member(r.getsockname(), TARGET_ROOM_NAME)
+    rooms = 1
+    last_user = f"sala0-user{args.room_size - 1}"
+
+    print(f"Sala medida: {args.room_size} membros; mensagem de {args.message_bytes} bytes; tempos em µs por mensagem")
+    print(f"{'salas':>6} {'clientes':>8} {'varredura':>10} {'índice':>8} {'ganho':>6} "
+          f"{'privada (varr.)':>15} {'privada (índ.)':>15}")
+    try:
+        for room_count in (int(n) for n in args.room_counts.split(',')):
+            while rooms < room_count: # Cria as salas (e os clientes) que faltam
+                for i in range(args.room_size):
+                    client_addr = ('127.0.0.2', 1024 + len(server.clients))
+                    server._register_client(client_addr, f"sala{rooms}-user{i}")
+                    server._add_member(client_addr, f"sala{rooms}")
+                rooms += 1
+                last_user = f"sala{rooms - 1}-user{args.room_size - 1}" # Último a conectar: pior caso da busca linear
+
+            scan_us = measure_relay(server, receivers, scan_relay, content_bytes, args.repeat)
+            indexed_us = measure_relay(server, receivers, indexed_relay, content_bytes, args.repeat)
+            scan_lookup_us = measure_lookup(server, scan_lookup, last_user, args.repeat)
+            indexed_lookup_us = measure_lookup(server, indexed_lookup, last_user, args.repeat)
+            print(f"{room_count:>6} {len(server.clients):>8} {scan_us:>10.1f} {indexed_us:>8.1f} {scan_us / indexed_us:>5.1f}x "
+                  f"{scan_lookup_us:>15.2f} {indexed_lookup_us:>15.3f}")
+    finally:
+        for r in receivers:
+            r.close()
+        server.sckt.close()
+
+
+if __name__ == '__main__':
+    main()
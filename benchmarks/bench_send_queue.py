@@ -0,0 +1,136 @@
+# benchmarks/bench_send_queue.py
+# Mede o efeito das filas de saída por destinatário (send_queue.py) em duas situações:
+#  - uma mensagem grande para uma sala: quanto tempo o servidor fica preso no tratamento do
+#    datagrama (sem receber mais nada) e quanto demora o primeiro pacote do último cliente
+#    da sala, enviando tudo de uma vez (como antes) vs. em rodadas de SEND_BURST_PACKETS;
+#  - um consumidor lento (pacing baixo) numa sala movimentada: memória presa na fila dele
+#    sem limite (como antes) vs. com limite e cada política de fila cheia.
+import argparse
+import contextlib
+import io
+import os
+import socket as skt
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server_chat # noqa: E402
+from pacing import RateController # noqa: E402
+from send_queue import OVERFLOW_POLICIES, SEND_BURST_PACKETS # noqa: E402
+from server_chat import UDPServer # noqa: E402
+
+MAX_BUFF_SIZE = 1024
+SENDER_ADDRESS = ('127.0.0.1', 1) # Remetente fictício (nunca recebe)
+SENDER_INFO = (SENDER_ADDRESS[0], SENDER_ADDRESS[1], 'bench')
+
+
+def make_server(receivers):
+    """Servidor sem E/S em lote (cada envio sai na hora, para medir quando cada cliente recebe) com os destinatários na sala."""
+    with contextlib.redirect_stdout(io.StringIO()): # Silencia as mensagens de inicialização do servidor
+        server = UDPServer('127.0.0.1', 0, MAX_BUFF_SIZE, batch_io=False)
+        for number, receiver in enumerate(receivers):
+            server._register_client(receiver.getsockname(), f"user{number}")
+    server.set_history(None)
+    return server
+
+
+def first_packet_times(server):
+    """Instrumenta o servidor para anotar o instante do primeiro envio a cada cliente."""
+    first_sent = {}
+    transmit = server._transmit
+
+    def timed_transmit(packets, target_client_addr):
+        first_sent.setdefault(target_client_addr, time.perf_counter())
+        transmit(packets, target_client_addr)
+    server._transmit = timed_transmit
+    return first_sent
+
+
+def large_message(receivers, content_bytes, burst_packets, repeat):
+    """Mediana de (ms no tratamento do datagrama, ms até o primeiro pacote do último cliente, ms até esvaziar as filas)."""
+    server_chat.SEND_BURST_PACKETS = burst_packets # Rodada do envio imediato e de service_send_queues
+    server = make_server(receivers)
+    server.set_send_queue(max_packets=1 << 30)
+    samples = []
+    try:
+        for _ in range(repeat):
+            first_sent = first_packet_times(server)
+            start = time.perf_counter()
+            server.broadcast_file_content(content_bytes, SENDER_INFO, sender_address=SENDER_ADDRESS)
+            handled = time.perf_counter()
+            while server.service_send_queues(): # O que o loop faria entre um datagrama e outro
+                pass
+            done = time.perf_counter()
+            del server._transmit
+            samples.append(((handled - start) * 1e3, (max(first_sent.values()) - start) * 1e3, (done - start) * 1e3))
+    finally:
+        server.sckt.close()
+        server_chat.SEND_BURST_PACKETS = SEND_BURST_PACKETS
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def slow_consumer(receivers, content_bytes, messages, slow_rate, max_packets, policy):
+    """Retransmite `messages` mensagens com um destinatário lento; retorna (pico da fila dele, pacotes descartados, conectado no fim)."""
+    server = make_server(receivers)
+    server.set_send_queue(max_packets, policy)
+    slow_address = receivers[0].getsockname()
+    server.rate_controllers[slow_address] = RateController(slow_rate)
+    peak = 0
+    try:
+        with contextlib.redirect_stdout(io.StringIO()): # Avisos de fila cheia e de saída
+            for _ in range(messages):
+                server.broadcast_file_content(content_bytes, SENDER_INFO, sender_address=SENDER_ADDRESS)
+                peak = max(peak, len(server.outbound_queues.get(slow_address, ())))
+                server.service_send_queues()
+        return peak, server.metrics.peer_dropped_packets.get(slow_address, server.metrics.dropped_packets), slow_address in server.clients
+    finally:
+        server.sckt.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Filas de saída por destinatário: rodadas de envio e consumidores lentos.")
+    parser.add_argument('--room-sizes', default='4,16,64', help="Tamanhos de sala separados por vírgula")
+    parser.add_argument('--message-bytes', type=int, default=256 * 1024, help="Tamanho da mensagem grande")
+    parser.add_argument('--repeat', type=int, default=5, help="Repetições por medição (usa a mediana)")
+    parser.add_argument('--slow-rate', type=float, default=200.0, help="Pacotes/s do consumidor lento")
+    parser.add_argument('--slow-messages', type=int, default=2000, help="Mensagens retransmitidas no cenário do consumidor lento")
+    parser.add_argument('--slow-message-bytes', type=int, default=4000, help="Tamanho das mensagens no cenário do consumidor lento")
+    parser.add_argument('--queue-limit', type=int, default=1024, help="Limite da fila no cenário do consumidor lento")
+    args = parser.parse_args()
+
+    room_sizes = [int(n) for n in args.room_sizes.split(',')]
+    receivers = []
+    for _ in range(max(room_sizes)):
+        receiver = skt.socket(skt.AF_INET, skt.SOCK_DGRAM)
+        receiver.bind(('127.0.0.1', 0)) # Nunca lidos: o kernel descarta o que não couber no buffer
+        receivers.append(receiver)
+    try:
+        content_bytes = os.urandom(args.message_bytes)
+        print(f"Mensagem de {len(content_bytes)} bytes; tempos em ms (mediana): tratamento do datagrama / "
+              "primeiro pacote do último cliente / filas vazias")
+        print(f"{'clientes':>8} {'tudo de uma vez':>24} {f'rodadas de {SEND_BURST_PACKETS}':>24}")
+        for room_size in room_sizes:
+            room = receivers[:room_size]
+            inline = large_message(room, content_bytes, 1 << 30, args.repeat)
+            rounds = large_message(room, content_bytes, SEND_BURST_PACKETS, args.repeat)
+            print(f"{room_size:>8} " + " ".join(f"{'/'.join(f'{ms:.1f}' for ms in result):>24}" for result in (inline, rounds)))
+
+        content_bytes = os.urandom(args.slow_message_bytes)
+        print(f"\nConsumidor lento ({args.slow_rate:g} pacotes/s) numa sala de {room_sizes[-1]} clientes, "
+              f"{args.slow_messages} mensagens de {len(content_bytes)} bytes")
+        print(f"{'fila':>24} {'pico (pacotes)':>15} {'descartados':>12} {'conectado':>10}")
+        scenarios = [("sem limite (antes)", 1 << 30, OVERFLOW_POLICIES[0])]
+        scenarios += [(f"{args.queue_limit}, {policy}", args.queue_limit, policy) for policy in OVERFLOW_POLICIES]
+        for label, max_packets, policy in scenarios:
+            peak, dropped, connected = slow_consumer(receivers[:room_sizes[-1]], content_bytes, args.slow_messages, args.slow_rate,
+                                                     max_packets, policy)
+            print(f"{label:>24} {peak:>15} {dropped:>12} {'sim' if connected else 'não':>10}")
+    finally:
+        for receiver in receivers:
+            receiver.close()
+
+
+if __name__ == '__main__':
+    main()
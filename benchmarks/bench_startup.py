@@ -0,0 +1,127 @@
+# benchmarks/bench_startup.py
+# Mede a partida a frio e a memória ociosa de cada processo: o tempo de importação dos módulos
+# do servidor e do cliente (descontada a partida do próprio interpretador), o tempo do comando
+# até o servidor responder ao primeiro CMD:STATS e a memória residente (RSS) de um servidor e
+# de um cliente parados. Mede também o que as importações adiadas (json, traceback, datetime)
+# custariam se fossem feitas na partida, como antes.
+import argparse
+import os
+import socket as skt
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+READY_TIMEOUT = 10.0 # Segundos esperando o servidor responder
+
+
+def median(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2]
+
+
+def python_ms(code, repeat):
+    """Mediana do tempo (ms) de `python -c code`, rodado na raiz do projeto."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True)
+        samples.append((time.perf_counter() - start) * 1e3)
+    return median(samples)
+
+
+def rss_kb(pid):
+    """Memória residente (VmRSS, em KB) do processo; None fora do Linux."""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def free_port():
+    with skt.socket(skt.AF_INET, skt.SOCK_DGRAM) as sckt:
+        sckt.bind(('127.0.0.1', 0))
+        return sckt.getsockname()[1]
+
+
+def wait_stats(port):
+    """Repete CMD:STATS até o servidor responder; retorna o instante da resposta."""
+    deadline = time.perf_counter() + READY_TIMEOUT
+    with skt.socket(skt.AF_INET, skt.SOCK_DGRAM) as sckt:
+        sckt.settimeout(0.005)
+        while time.perf_counter() < deadline:
+            sckt.sendto(b"CMD:STATS", ('127.0.0.1', port))
+            try:
+                if sckt.recv(65535).startswith(b"CMD:STATS\n"):
+                    return time.perf_counter()
+            except (skt.timeout, ConnectionRefusedError):
+                pass
+    raise RuntimeError(f"o servidor na porta {port} não respondeu em {READY_TIMEOUT}s")
+
+
+def server_start(script, repeat, idle_seconds):
+    """Mediana de (ms até o primeiro CMD:STATS respondido, RSS ocioso em KB) de um servidor."""
+    ready, memory = [], []
+    for _ in range(repeat):
+        port = free_port()
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, script, '--host', '127.0.0.1', '--port', str(port)], cwd=ROOT,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            ready.append((wait_stats(port) - start) * 1e3)
+            time.sleep(idle_seconds)
+            memory.append(rss_kb(process.pid))
+        finally:
+            process.terminate()
+            process.wait()
+    return median(ready), None if None in memory else median(memory)
+
+
+def client_idle_rss(repeat, idle_seconds):
+    """Mediana do RSS (KB) de um processo com um UDPClient criado e parado (sem terminal)."""
+    code = ("import sys, client_chat; client = client_chat.UDPClient('127.0.0.1', 9, client_chat.MAX_BUFF_SIZE); "
+            "print('ready', flush=True); sys.stdin.read()")
+    memory = []
+    for _ in range(repeat):
+        process = subprocess.Popen([sys.executable, '-c', code], cwd=ROOT, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL, text=True)
+        try:
+            while process.stdout.readline().strip() != 'ready':
+                pass
+            time.sleep(idle_seconds)
+            memory.append(rss_kb(process.pid))
+        finally:
+            process.stdin.close()
+            process.wait()
+    return None if None in memory else median(memory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partida a frio e memória ociosa do servidor e do cliente.")
+    parser.add_argument('--repeat', type=int, default=7, help="Repetições por medição (usa a mediana)")
+    parser.add_argument('--idle-seconds', type=float, default=0.5, help="Espera antes de medir a memória ociosa")
+    args = parser.parse_args()
+
+    interpreter_ms = python_ms('pass', args.repeat)
+    print(f"Partida do interpretador: {interpreter_ms:.1f} ms (descontada das importações abaixo)")
+    print(f"{'importação':<40} {'ms':>7}")
+    for label, code in (("server_chat", "import server_chat"),
+                        ("server_chat + json/traceback/datetime", "import server_chat, json, traceback, datetime"),
+                        ("client_chat", "import client_chat"),
+                        ("client_chat + json/traceback/datetime", "import client_chat, json, traceback, datetime")):
+        print(f"{label:<40} {python_ms(code, args.repeat) - interpreter_ms:>7.1f}")
+
+    print(f"\n{'processo':<40} {'pronto (ms)':>11} {'RSS ocioso (KB)':>16}")
+    for label, script in (("servidor (server_chat.py)", 'server_chat.py'), ("servidor asyncio (async_server_chat.py)", 'async_server_chat.py')):
+        ready_ms, memory = server_start(script, args.repeat, args.idle_seconds)
+        print(f"{label:<40} {ready_ms:>11.1f} {memory if memory is not None else '-':>16}")
+    memory = client_idle_rss(args.repeat, args.idle_seconds)
+    print(f"{'cliente (UDPClient parado)':<40} {'-':>11} {memory if memory is not None else '-':>16}")
+
+
+if __name__ == '__main__':
+    main()
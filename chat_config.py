@@ -0,0 +1,92 @@
+# chat_config.py
+# Configuração de rede do servidor e do cliente: opções de linha de comando com valores padrão
+# vindos de variáveis de ambiente (CHAT_*), para rodar várias instâncias (testes de carga, um
+# servidor por sala...) sem editar as constantes dos módulos. A linha de comando tem prioridade
+# sobre o ambiente, e o ambiente sobre as constantes.
+import os
+import socket as skt
+
+from chat_protocol import MAX_DATAGRAM_SIZE, MIN_DATAGRAM_SIZE
+
+ENV_PREFIX = 'CHAT_'
+
+
+def env_default(name, default):
+    """Valor da variável de ambiente CHAT_<name>, ou `default` se ela não existir (ou estiver vazia).
+
+    O valor do ambiente é uma string: usado como default do argparse, ele passa pela mesma
+    conversão (`type`) e validação de um valor digitado na linha de comando.
+    """
+    return os.environ.get(ENV_PREFIX + name) or default
+
+
+MAX_PORT = 65535
+MAX_SOCKET_BUFFER = 2**31 - 1 # setsockopt recebe um int de C
+
+
+def _bounded_int(text, what, minimum, maximum, unit):
+    """Converte `text` em inteiro entre `minimum` e `maximum` (None: sem limite superior), ou falha com a
+    mensagem de erro do argparse."""
+    import argparse
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{what}: valor inválido '{text}' (use um número {unit})") from None
+    if maximum is None and value < minimum:
+        raise argparse.ArgumentTypeError(f"{what}: {value} fora do intervalo (use pelo menos {minimum})")
+    if maximum is not None and not minimum <= value <= maximum:
+        raise argparse.ArgumentTypeError(f"{what}: {value} fora do intervalo (use de {minimum} a {maximum})")
+    return value
+
+
+def datagram_size(text):
+    """`type` do argparse para --buffer-size: um inteiro entre MIN_DATAGRAM_SIZE e MAX_DATAGRAM_SIZE.
+
+    Abaixo do mínimo, os cabeçalhos dos fragmentos não cabem (ou quase não sobra carga útil); acima do
+    máximo, nenhum datagrama UDP sobre IPv4 consegue carregar o fragmento.
+    """
+    return _bounded_int(text, "Tamanho de datagrama", MIN_DATAGRAM_SIZE, MAX_DATAGRAM_SIZE, "de bytes")
+
+
+def port_number(text):
+    """`type` do argparse para --port: uma porta UDP de 1 a 65535."""
+    return _bounded_int(text, "Porta", 1, MAX_PORT, "de porta")
+
+
+def socket_buffer_size(text):
+    """`type` do argparse para --rcvbuf/--sndbuf: bytes do buffer do socket (0 mantém o padrão do sistema)."""
+    return _bounded_int(text, "Tamanho de buffer do socket", 0, MAX_SOCKET_BUFFER, "de bytes")
+
+
+def positive_count(what):
+    """`type` do argparse para contagens que precisam ser pelo menos 1 (ex.: --workers, --send-queue)."""
+    def convert(text):
+        return _bounded_int(text, what, 1, None, "inteiro")
+    return convert
+
+
+def add_network_arguments(parser, host, port, max_buff, host_env, host_help):
+    """Opções de endereço, porta, tamanho de datagrama e buffers do socket (CHAT_<host_env>, CHAT_PORT,
+    CHAT_BUFFER_SIZE, CHAT_RCVBUF e CHAT_SNDBUF no ambiente)."""
+    parser.add_argument('--host', default=env_default(host_env, host), help=f"{host_help} (ambiente: {ENV_PREFIX}{host_env})")
+    parser.add_argument('--port', type=port_number, default=env_default('PORT', port), help=f"Porta do servidor (ambiente: {ENV_PREFIX}PORT)")
+    parser.add_argument('--buffer-size', type=datagram_size, default=env_default('BUFFER_SIZE', max_buff),
+                        help=f"Tamanho padrão dos datagramas (fragmentos) enviados, de {MIN_DATAGRAM_SIZE} a {MAX_DATAGRAM_SIZE} bytes "
+                             f"(ambiente: {ENV_PREFIX}BUFFER_SIZE)")
+    parser.add_argument('--rcvbuf', type=socket_buffer_size, default=env_default('RCVBUF', None),
+                        help=f"SO_RCVBUF do socket em bytes; padrão do sistema se omitido (ambiente: {ENV_PREFIX}RCVBUF)")
+    parser.add_argument('--sndbuf', type=socket_buffer_size, default=env_default('SNDBUF', None),
+                        help=f"SO_SNDBUF do socket em bytes; padrão do sistema se omitido (ambiente: {ENV_PREFIX}SNDBUF)")
+
+
+def set_socket_buffers(sckt, rcvbuf=None, sndbuf=None):
+    """Ajusta os buffers de recepção/envio do socket (None mantém o padrão do sistema).
+
+    O kernel pode limitar os valores (no Linux, a net.core.rmem_max/wmem_max) e costuma dobrá-los;
+    retorna os tamanhos efetivos (SO_RCVBUF, SO_SNDBUF).
+    """
+    if rcvbuf:
+        sckt.setsockopt(skt.SOL_SOCKET, skt.SO_RCVBUF, rcvbuf)
+    if sndbuf:
+        sckt.setsockopt(skt.SOL_SOCKET, skt.SO_SNDBUF, sndbuf)
+    return sckt.getsockopt(skt.SOL_SOCKET, skt.SO_RCVBUF), sckt.getsockopt(skt.SOL_SOCKET, skt.SO_SNDBUF)
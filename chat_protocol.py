@@ -0,0 +1,690 @@
+# chat_protocol.py
+# Enquadramento binário dos fragmentos de mensagem e das mensagens de controle, compartilhado por cliente e servidor.
+import functools
+import socket as skt
+import struct
+import time
+import zlib
+
+try:
+    import lzma
+except ImportError: # Python compilado sem liblzma: só zlib fica disponível
+    lzma = None
+
+from timer_wheel import TimerWheel
+
+# Todo fragmento começa com um byte 0xFE, que nunca aparece em texto UTF-8; assim os
+# fragmentos são separados dos comandos/cabeçalhos de texto sem tentativa de decodificação.
+FRAGMENT_MARKER = 0xFE
+# Cabeçalho do fragmento: marcador, id da mensagem, índice do fragmento, total de fragmentos
+FRAGMENT_HEADER = struct.Struct("!BIII")
+FRAGMENT_HEADER_SIZE = FRAGMENT_HEADER.size
+MESSAGE_ID_MODULO = 2 ** 32 # Ids de mensagem são inteiros de 32 bits (dão a volta)
+
+# Tamanho dos datagramas: negociado no CMD:HI (opção max_buff) entre estes limites. Os buffers
+# de recepção usam sempre o máximo, então nenhum datagrama (nem cabeçalho longo) é truncado.
+MAX_DATAGRAM_SIZE = 65507 # Maior carga útil de um datagrama UDP sobre IPv4
+MIN_DATAGRAM_SIZE = 512
+
+
+def is_fragment(data):
+    """Indica se o datagrama é um fragmento de mensagem (e não um comando/cabeçalho de texto)."""
+    return len(data) >= FRAGMENT_HEADER_SIZE and data[0] == FRAGMENT_MARKER
+
+
+def fragment_message_id(fragment):
+    """Id da mensagem à qual o fragmento pertence."""
+    return FRAGMENT_HEADER.unpack_from(fragment)[1]
+
+
+def fragment_payload_size(max_buff):
+    """Carga útil de cada fragmento para que o datagrama inteiro (cabeçalho incluso) caiba em `max_buff`."""
+    return max_buff - FRAGMENT_HEADER_SIZE
+
+
+def packet_count(content_size, payload_size):
+    """Número de fragmentos necessários para `content_size` bytes (pelo menos um)."""
+    return max(1, -(-content_size // payload_size))
+
+
+def build_fragments(content_bytes, message_id, payload_size):
+    """Fragmenta o conteúdo em datagramas com cabeçalho, cada um com até `payload_size` bytes de carga útil."""
+    content_view = memoryview(content_bytes) # Fatias sem cópia do conteúdo original
+    total = packet_count(len(content_view), payload_size)
+    pack = FRAGMENT_HEADER.pack
+    return [
+        pack(FRAGMENT_MARKER, message_id, seq, total) + content_view[seq * payload_size : (seq + 1) * payload_size]
+        for seq in range(total)
+    ]
+
+
+def iter_stream_fragments(chunks, message_id, total_size, payload_size):
+    """Fragmenta um fluxo de blocos de bytes de tamanhos arbitrários sem carregá-lo inteiro na memória.
+
+    Gera os datagramas sob demanda; levanta ValueError se o fluxo não tiver exatamente `total_size` bytes.
+    """
+    total = packet_count(total_size, payload_size)
+    pack = FRAGMENT_HEADER.pack
+    pending = bytearray() # Sobra do último bloco que ainda não completa um fragmento
+    seq = 0
+    sent_bytes = 0
+    for chunk in chunks:
+        chunk_view = memoryview(chunk)
+        if sent_bytes + len(pending) + len(chunk_view) > total_size:
+            raise ValueError(f"fluxo maior que os {total_size} bytes anunciados")
+        offset = 0
+        if pending: # Completa o fragmento parcial com o início deste bloco
+            offset = min(payload_size - len(pending), len(chunk_view))
+            pending += chunk_view[:offset]
+            if len(pending) < payload_size:
+                continue
+            yield pack(FRAGMENT_MARKER, message_id, seq, total) + pending
+            seq += 1
+            sent_bytes += len(pending)
+            pending = bytearray()
+        while len(chunk_view) - offset >= payload_size: # Fragmentos inteiros direto do bloco, sem cópia intermediária
+            yield pack(FRAGMENT_MARKER, message_id, seq, total) + chunk_view[offset : offset + payload_size]
+            seq += 1
+            offset += payload_size
+            sent_bytes += payload_size
+        pending += chunk_view[offset:]
+    if pending or seq == 0: # Último fragmento (ou o único, se o fluxo for vazio)
+        yield pack(FRAGMENT_MARKER, message_id, seq, total) + pending
+        sent_bytes += len(pending)
+    if sent_bytes != total_size:
+        raise ValueError(f"fluxo com {sent_bytes} bytes, esperado {total_size}")
+
+
+class MessageReassembler:
+    """Remonta mensagens fragmentadas, aceitando fragmentos e cabeçalho em qualquer ordem.
+
+    Cada mensagem é identificada por (remetente, id da mensagem), então um mesmo remetente
+    pode ter várias mensagens em trânsito ao mesmo tempo. Uma mensagem só é entregue quando
+    todos os fragmentos e os metadados (vindos do cabeçalho de texto) chegaram.
+
+    Os fragmentos são copiados direto para um bytearray pré-alocado (total x carga útil).
+    Opcionalmente, a memória reservada é limitada por remetente e no total (mensagens que
+    passariam do limite são recusadas com ValueError), e mensagens sem atividade por mais de
+    `idle_timeout` segundos são descartadas por expire().
+    """
+    def __init__(self, max_sender_bytes=None, max_total_bytes=None, idle_timeout=None):
+        # {(remetente, message_id): {'meta': dict|None, 'total': N, 'received': bytearray, 'count': N,
+        #                            'buffer': bytearray|None, 'payload_size': N|None, 'tail': bytes|None,
+        #                            'tail_size': N|None, 'reserved': N}}
+        self.pending = {}
+        self.by_sender = {} # {remetente: set(message_id)} para descartar tudo de um remetente
+        self.max_sender_bytes = max_sender_bytes
+        self.max_total_bytes = max_total_bytes
+        self.idle_timeout = idle_timeout
+        self.timers = TimerWheel() if idle_timeout is not None else None
+        # Métricas
+        self.sender_bytes = {} # {remetente: bytes reservados}
+        self.buffered_bytes = 0 # Bytes reservados por todas as mensagens incompletas
+        self.evicted = 0 # Mensagens descartadas por inatividade
+        self.rejected = 0 # Mensagens recusadas por limite de memória
+
+    def _reserve(self, sender, entry, nbytes):
+        """Reserva memória para uma mensagem; retorna False se isso passar de algum limite."""
+        sender_bytes = self.sender_bytes.get(sender, 0) + nbytes
+        if self.max_sender_bytes is not None and sender_bytes > self.max_sender_bytes:
+            return False
+        if self.max_total_bytes is not None and self.buffered_bytes + nbytes > self.max_total_bytes:
+            return False
+        self.sender_bytes[sender] = sender_bytes
+        self.buffered_bytes += nbytes
+        entry['reserved'] += nbytes
+        return True
+
+    def _release(self, sender, entry, nbytes):
+        """Devolve memória reservada por uma mensagem."""
+        entry['reserved'] -= nbytes
+        self.buffered_bytes -= nbytes
+        sender_bytes = self.sender_bytes[sender] - nbytes
+        if sender_bytes:
+            self.sender_bytes[sender] = sender_bytes
+        else:
+            del self.sender_bytes[sender]
+
+    def _reject(self, sender, message_id, entry=None):
+        """Recusa uma mensagem que passaria do limite de memória (descartando o que já havia dela)."""
+        if entry is not None:
+            self._forget(sender, message_id)
+        self.rejected += 1
+        raise ValueError(f"limite de memória de remontagem excedido (mensagem {message_id})")
+
+    def _entry(self, sender, message_id, total_packets, now):
+        """Retorna (criando se preciso) o estado de remontagem de uma mensagem e renova seu prazo de inatividade."""
+        key = (sender, message_id)
+        entry = self.pending.get(key)
+        if entry is None:
+            entry = {'meta': None, 'total': total_packets, 'received': None, 'count': 0, 'buffer': None,
+                     'payload_size': None, 'tail': None, 'tail_size': None, 'reserved': 0}
+            if not self._reserve(sender, entry, total_packets): # O mapa de fragmentos recebidos também conta
+                self._reject(sender, message_id)
+            entry['received'] = bytearray(total_packets)
+            self.pending[key] = entry
+            self.by_sender.setdefault(sender, set()).add(message_id)
+        if self.timers is not None:
+            self.timers.schedule(key, (time.monotonic() if now is None else now) + self.idle_timeout)
+        return entry
+
+    def _complete(self, sender, message_id, entry):
+        """Se a mensagem estiver completa, remove-a do buffer e retorna (meta, conteúdo)."""
+        if entry['meta'] is None or entry['count'] < entry['total']:
+            return None
+        self._forget(sender, message_id)
+        content = entry['buffer']
+        del content[(entry['total'] - 1) * entry['payload_size'] + entry['tail_size']:] # O último fragmento pode ser menor
+        return entry['meta'], content
+
+    def _forget(self, sender, message_id):
+        """Descarta o estado de uma mensagem e libera a memória reservada por ela."""
+        key = (sender, message_id)
+        entry = self.pending.pop(key)
+        self._release(sender, entry, entry['reserved'])
+        if self.timers is not None:
+            self.timers.cancel(key)
+        message_ids = self.by_sender[sender]
+        message_ids.discard(message_id)
+        if not message_ids:
+            del self.by_sender[sender]
+
+    def set_header(self, sender, message_id, total_packets, meta, now=None):
+        """Registra os metadados de uma mensagem; retorna (meta, conteúdo) se ela ficar completa."""
+        entry = self._entry(sender, message_id, total_packets, now)
+        if entry['total'] != total_packets: # Cabeçalho e fragmentos discordam: descarta a mensagem
+            self._forget(sender, message_id)
+            raise ValueError(f"cabeçalho anuncia {total_packets} pacotes, fragmentos anunciam {entry['total']}")
+        entry['meta'] = meta
+        return self._complete(sender, message_id, entry)
+
+    def add_fragment(self, sender, data, now=None):
+        """Armazena um fragmento recebido; retorna (meta, conteúdo) se a mensagem ficar completa."""
+        _, message_id, seq, total = FRAGMENT_HEADER.unpack_from(data)
+        if total == 0 or seq >= total:
+            raise ValueError(f"fragmento inválido {seq}/{total} da mensagem {message_id}")
+        entry = self._entry(sender, message_id, total, now)
+        if entry['total'] != total:
+            raise ValueError(f"fragmento anuncia {total} pacotes, esperado {entry['total']} (mensagem {message_id})")
+        received = entry['received']
+        if received[seq]: # Duplicatas são ignoradas
+            return None
+        payload = memoryview(data)[FRAGMENT_HEADER_SIZE:]
+        payload_size = entry['payload_size']
+
+        if seq < total - 1: # Fragmento cheio: todos têm a mesma carga útil, que define o tamanho do buffer
+            if payload_size is None:
+                payload_size = len(payload)
+                if payload_size == 0:
+                    raise ValueError(f"fragmento {seq}/{total} vazio (mensagem {message_id})")
+                if not self._reserve(sender, entry, payload_size * total):
+                    self._reject(sender, message_id, entry)
+                entry['payload_size'] = payload_size
+                entry['buffer'] = bytearray(payload_size * total)
+                tail = entry['tail']
+                if tail is not None: # O último fragmento tinha chegado antes: move-o para o buffer
+                    if len(tail) > payload_size:
+                        self._forget(sender, message_id)
+                        raise ValueError(f"último fragmento maior que os demais (mensagem {message_id})")
+                    offset = (total - 1) * payload_size
+                    entry['buffer'][offset : offset + len(tail)] = tail
+                    entry['tail'] = None
+                    self._release(sender, entry, len(tail))
+            elif len(payload) != payload_size:
+                raise ValueError(f"fragmento {seq}/{total} com {len(payload)} bytes, esperado {payload_size} (mensagem {message_id})")
+            offset = seq * payload_size
+            entry['buffer'][offset : offset + payload_size] = payload
+        else: # Último fragmento (ou o único)
+            if payload_size is not None and len(payload) > payload_size:
+                raise ValueError(f"último fragmento maior que os demais (mensagem {message_id})")
+            if payload_size is None and not self._reserve(sender, entry, len(payload)): # Senão, já está no buffer reservado
+                self._reject(sender, message_id, entry)
+            if total == 1:
+                entry['payload_size'] = len(payload)
+                entry['buffer'] = bytearray(payload)
+            elif payload_size is None: # Ainda não se sabe o tamanho dos fragmentos cheios: guarda à parte
+                entry['tail'] = bytes(payload)
+            else:
+                offset = (total - 1) * payload_size
+                entry['buffer'][offset : offset + len(payload)] = payload
+            entry['tail_size'] = len(payload)
+
+        received[seq] = 1
+        entry['count'] += 1
+        return self._complete(sender, message_id, entry)
+
+    def expire(self, now=None):
+        """Descarta as mensagens sem atividade há mais de `idle_timeout`; retorna as chaves (remetente, id) descartadas."""
+        if self.timers is None:
+            return []
+        expired = self.timers.expire(now)
+        for sender, message_id in expired:
+            self._forget(sender, message_id)
+        self.evicted += len(expired)
+        return expired
+
+    def discard_sender(self, sender):
+        """Descarta todas as mensagens incompletas de um remetente."""
+        for message_id in list(self.by_sender.get(sender, ())):
+            self._forget(sender, message_id)
+
+    def stats(self):
+        """Métricas da remontagem: mensagens incompletas, bytes reservados, descartes e recusas."""
+        return {'messages': len(self.pending), 'buffered_bytes': self.buffered_bytes,
+                'evicted': self.evicted, 'rejected': self.rejected}
+
+    def __contains__(self, sender):
+        return sender in self.by_sender
+
+
+def format_options(options):
+    """Serializa opções negociadas (ex: no CMD:HI) como linhas 'chave=valor' após o comando."""
+    return "".join(f"\n{key}={value}" for key, value in options.items())
+
+
+def parse_options(text):
+    """Interpreta as linhas 'chave=valor' de um comando; linhas sem '=' são ignoradas."""
+    options = {}
+    for line in text.split("\n"):
+        key, sep, value = line.partition("=")
+        if sep:
+            options[key.strip()] = value.strip()
+    return options
+
+
+def parse_hello(hello_body):
+    """Separa o corpo de um CMD:HI em (nome de usuário, opções).
+
+    O nome vem na primeira linha; as linhas seguintes (opcionais) trazem as opções pedidas
+    pelo cliente, então um 'CMD:HI:<nome>' simples continua válido.
+    """
+    username, _, options_text = hello_body.partition("\n")
+    return username, parse_options(options_text)
+
+
+# Compressão do conteúdo das mensagens
+#
+# Negociada no HELLO (opção 'compress' com os codecs que o cliente sabe descomprimir, o preferido
+# primeiro); o servidor responde no WELCOME os que aceita. O remetente comprime só mensagens a
+# partir de COMPRESSION_THRESHOLD bytes, e só se ficarem menores, e informa o codec (encoding) no
+# UPLOAD_START. O servidor repassa os bytes comprimidos (INCOMING com o mesmo encoding) a quem
+# negociou o codec e só descomprime para o próprio log e para clientes que não o negociaram.
+ENCODING_NONE = 0
+ENCODING_ZLIB = 1
+ENCODING_LZMA = 2
+COMPRESSION_THRESHOLD = 1024 # Mensagens menores cabem em poucos fragmentos; comprimir não compensa
+ZLIB_LEVEL = 6
+LZMA_PRESET = 1 # Presets maiores comprimem pouco mais texto de chat, com muito mais CPU e memória
+MAX_DECOMPRESSED_SIZE = 64 * 1024 * 1024 # Limite do conteúdo descomprimido (contra "bombas" de compressão)
+
+# Codecs disponíveis neste Python: nome (na opção 'compress') -> encoding
+COMPRESSION_CODECS = {'zlib': ENCODING_ZLIB}
+if lzma is not None:
+    COMPRESSION_CODECS['lzma'] = ENCODING_LZMA
+
+
+def parse_compress_option(value):
+    """Encodings disponíveis de uma opção 'compress' ('lzma,zlib'), na ordem de preferência; ignora os desconhecidos."""
+    encodings = []
+    for name in value.split(','):
+        encoding = COMPRESSION_CODECS.get(name.strip())
+        if encoding is not None and encoding not in encodings:
+            encodings.append(encoding)
+    return encodings
+
+
+def format_compress_option(encodings):
+    """Valor da opção 'compress' para uma lista de encodings."""
+    names = {encoding: name for name, encoding in COMPRESSION_CODECS.items()}
+    return ",".join(names[encoding] for encoding in encodings)
+
+
+def compress_payload(content_bytes, encoding):
+    """Comprime o conteúdo de uma mensagem com o codec do encoding."""
+    if encoding == ENCODING_ZLIB:
+        return zlib.compress(content_bytes, ZLIB_LEVEL)
+    if encoding == ENCODING_LZMA and lzma is not None:
+        return lzma.compress(content_bytes, preset=LZMA_PRESET, check=lzma.CHECK_NONE)
+    raise ValueError(f"encoding {encoding} não suportado")
+
+
+def decompress_payload(content_bytes, encoding, max_size=MAX_DECOMPRESSED_SIZE):
+    """Descomprime o conteúdo de uma mensagem; levanta ValueError se ele for inválido ou passar de `max_size` bytes."""
+    if encoding == ENCODING_NONE:
+        return content_bytes
+    if encoding == ENCODING_ZLIB:
+        decompressor, errors = zlib.decompressobj(), (zlib.error,)
+    elif encoding == ENCODING_LZMA and lzma is not None:
+        decompressor, errors = lzma.LZMADecompressor(), (lzma.LZMAError,)
+    else:
+        raise ValueError(f"encoding {encoding} não suportado")
+    try:
+        content = decompressor.decompress(content_bytes, max_size + 1)
+    except errors as e:
+        raise ValueError(f"conteúdo comprimido inválido: {e}") from None
+    if len(content) > max_size:
+        raise ValueError(f"conteúdo descomprimido passa de {max_size} bytes")
+    if not decompressor.eof:
+        raise ValueError("conteúdo comprimido truncado")
+    return content
+
+
+# Mensagens de controle (comandos e cabeçalhos de upload/entrega)
+#
+# Uma mensagem de controle é um tipo (HELLO, UPLOAD_START, ...) e uma tupla de campos, na ordem
+# listada abaixo. No protocolo binário, ela começa com o marcador 0xFC (inválido em UTF-8, como os
+# de fragmento e de ACK), a versão do protocolo e o tipo, seguidos dos campos de tamanho fixo; os
+# de tamanho variável (nome de usuário, texto, opções) ficam no fim, com o tamanho informado quando
+# não são o último. Cada tipo é decodificado por um struct.Struct pré-compilado, escolhido por
+# tabela, sem decodificar texto nem dividir strings. Os comandos de texto antigos (CMD:HI,
+# MSG_UPLOAD_START, MSG_INCOMING...) continuam aceitos e são traduzidos para os mesmos tipos e
+# campos, para compatibilidade com clientes (e servidores) antigos.
+CONTROL_MARKER = 0xFC
+PROTOCOL_VERSION = 3 # 2: encoding (compressão) no UPLOAD_START e no INCOMING; 3: destino (sala ou usuário)
+CONTROL_HEADER = struct.Struct("!BBB") # Marcador, versão, tipo
+CONTROL_HEADER_SIZE = CONTROL_HEADER.size
+MAX_SHORT_FIELD = 255 # Tamanho máximo (em bytes UTF-8) de um nome de usuário ou de sala
+
+# Salas: todo cliente entra na DEFAULT_ROOM ao se conectar e pode entrar em outras com JOIN. Cada
+# mensagem vai para uma sala (TARGET_ROOM) ou, em privado, para um usuário (TARGET_USER).
+DEFAULT_ROOM = "geral" # Viaja como nome vazio no protocolo binário
+TARGET_ROOM = 0
+TARGET_USER = 1
+
+# Tipos de mensagem de controle e seus campos
+HELLO = 1        # (usuário, opções): entrada na sala com as opções pedidas (CMD:HI)
+WELCOME = 2      # (opções,): resposta ao HELLO com as opções aceitas (CMD:WELCOME)
+BYE = 3          # (): saída da sala (CMD:BYE)
+UPLOAD_START = 4 # (id da mensagem, número de fragmentos, encoding, tipo de destino, destino): início de um upload (MSG_UPLOAD_START)
+INCOMING = 5     # (id, ip, porta, usuário, timestamp, número de fragmentos, encoding, tipo de destino, destino):
+                 # mensagem retransmitida (MSG_INCOMING); o destino é a sala, ou vazio em mensagens privadas
+NOTIFY = 6       # (texto,): notificação para a sala (NOTIFY)
+STATS = 7        # (prometheus,): pedido de métricas (CMD:STATS)
+JOIN = 8         # (sala,): entrada em uma sala (só no protocolo binário)
+LEAVE = 9        # (sala,): saída de uma sala (só no protocolo binário)
+HEARTBEAT = 10   # (): sinal de vida do cliente ocioso (só no protocolo binário, se negociado no HELLO)
+HISTORY = 11     # (sala, desde o id): pedido das mensagens da sala com id maior (só no protocolo binário, se negociado)
+# O timestamp do INCOMING é em segundos desde a época no protocolo binário e já vem formatado no de texto.
+# O encoding é sempre ENCODING_NONE no protocolo de texto, que não negocia compressão nem conhece
+# salas: clientes de texto ficam só na DEFAULT_ROOM.
+
+# Campos fixos de cada tipo, logo após o cabeçalho comum (um único unpack_from por mensagem). WELCOME
+# (+ opções aceitas), BYE, NOTIFY (+ texto), JOIN e LEAVE (+ sala) e HEARTBEAT têm só o cabeçalho comum.
+HELLO_STRUCT = struct.Struct("!B")            # Tamanho do nome; seguem o nome e as opções ('chave=valor')
+UPLOAD_START_STRUCT = struct.Struct("!IIBB")   # Id da mensagem, número de fragmentos, encoding, tipo de destino; segue o destino
+INCOMING_STRUCT = struct.Struct("!II4sHIBBB")  # Id, fragmentos, IPv4 e porta do remetente, timestamp (s), encoding, tipo de
+                                               # destino, tamanho do nome; seguem o nome e o destino
+STATS_STRUCT = struct.Struct("!B")             # Formato da resposta (0 = JSON, 1 = Prometheus)
+HISTORY_STRUCT = struct.Struct("!I")           # Id da última mensagem que o cliente já tem (0 = todas); segue a sala
+_HELLO_FIELDS_END = CONTROL_HEADER_SIZE + HELLO_STRUCT.size
+_UPLOAD_START_FIELDS_END = CONTROL_HEADER_SIZE + UPLOAD_START_STRUCT.size
+_INCOMING_FIELDS_END = CONTROL_HEADER_SIZE + INCOMING_STRUCT.size
+_HISTORY_FIELDS_END = CONTROL_HEADER_SIZE + HISTORY_STRUCT.size
+
+TIMESTAMP_FORMAT = "%H:%M:%S %d/%m/%Y"
+TIMESTAMP_CACHE_SIZE = 256 # Segundos distintos já formatados guardados (as mensagens de uma rajada, ou do histórico)
+
+
+@functools.lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)
+def _format_second(second):
+    return time.strftime(TIMESTAMP_FORMAT, time.localtime(second))
+
+
+def format_timestamp(timestamp):
+    """Formata um timestamp de mensagem (segundos desde a época) como HH:MM:SS DD/MM/YYYY.
+
+    A resolução é de segundos, então o strftime roda uma vez por segundo distinto, não por
+    mensagem: as demais mensagens do mesmo segundo reaproveitam a string do cache.
+    """
+    if isinstance(timestamp, str): # Veio formatado pelo servidor (protocolo de texto)
+        return timestamp
+    return _format_second(int(timestamp))
+
+
+def is_control(data):
+    """Indica se o datagrama é uma mensagem de controle do protocolo binário."""
+    return len(data) >= CONTROL_HEADER_SIZE and data[0] == CONTROL_MARKER
+
+
+def _header(message_type):
+    return CONTROL_HEADER.pack(CONTROL_MARKER, PROTOCOL_VERSION, message_type)
+
+
+def _short_field(text):
+    field = text.encode('utf-8')
+    if len(field) > MAX_SHORT_FIELD:
+        raise ValueError(f"campo com mais de {MAX_SHORT_FIELD} bytes: '{text[:20]}...'")
+    return field
+
+
+def _encode_hello(username, options):
+    username = _short_field(username)
+    return _header(HELLO) + HELLO_STRUCT.pack(len(username)) + username + format_options(options or {}).encode('utf-8')
+
+
+def _target_field(target_kind, target):
+    if target_kind == TARGET_ROOM and target == DEFAULT_ROOM:
+        return b""
+    return _short_field(target)
+
+
+def _target_name(target_kind, field):
+    if target_kind == TARGET_ROOM and not field:
+        return DEFAULT_ROOM
+    return field.decode('utf-8')
+
+
+def _encode_upload_start(message_id, num_packets, encoding=ENCODING_NONE, target_kind=TARGET_ROOM, target=DEFAULT_ROOM):
+    return (_header(UPLOAD_START) + UPLOAD_START_STRUCT.pack(message_id, num_packets, encoding, target_kind) +
+            _target_field(target_kind, target))
+
+
+def _encode_incoming(message_id, ip, port, username, timestamp, num_packets, encoding=ENCODING_NONE,
+                     target_kind=TARGET_ROOM, target=DEFAULT_ROOM):
+    username = _short_field(username)
+    return (_header(INCOMING) + INCOMING_STRUCT.pack(message_id, num_packets, skt.inet_aton(ip), int(port), int(timestamp),
+                                                     encoding, target_kind, len(username)) +
+            username + _target_field(target_kind, target))
+
+
+def _decode_hello(data):
+    name_end = _HELLO_FIELDS_END + HELLO_STRUCT.unpack_from(data, CONTROL_HEADER_SIZE)[0]
+    if len(data) < name_end:
+        raise ValueError("nome de usuário truncado")
+    return data[_HELLO_FIELDS_END:name_end].decode('utf-8'), parse_options(data[name_end:].decode('utf-8'))
+
+
+_IP_TEXT_CACHE = {} # IPv4 empacotado -> texto; uma sala tem poucos remetentes, então a conversão se repete
+_IP_TEXT_CACHE_LIMIT = 1024
+
+
+def _ip_text(packed_ip):
+    ip = _IP_TEXT_CACHE.get(packed_ip)
+    if ip is None:
+        if len(_IP_TEXT_CACHE) >= _IP_TEXT_CACHE_LIMIT:
+            _IP_TEXT_CACHE.clear()
+        ip = _IP_TEXT_CACHE[packed_ip] = skt.inet_ntoa(packed_ip)
+    return ip
+
+
+def _decode_upload_start(data):
+    message_id, num_packets, encoding, target_kind = UPLOAD_START_STRUCT.unpack_from(data, CONTROL_HEADER_SIZE)
+    return message_id, num_packets, encoding, target_kind, _target_name(target_kind, data[_UPLOAD_START_FIELDS_END:])
+
+
+# Final do INCOMING (tipo de destino, tamanho do nome, nome e destino) -> (usuário, destino) já decodificados: os
+# remetentes e salas se repetem, então cada cabeçalho custa só o unpack e uma consulta ao dicionário
+_INCOMING_NAMES_CACHE = {}
+_INCOMING_NAMES_CACHE_LIMIT = 1024
+_INCOMING_NAMES_START = _INCOMING_FIELDS_END - 2
+
+
+def _decode_incoming(data):
+    (message_id, num_packets, ip, port, timestamp, encoding, target_kind,
+     name_size) = INCOMING_STRUCT.unpack_from(data, CONTROL_HEADER_SIZE)
+    names_key = data[_INCOMING_NAMES_START:]
+    names = _INCOMING_NAMES_CACHE.get(names_key)
+    if names is None:
+        name_end = _INCOMING_FIELDS_END + name_size
+        if len(data) < name_end:
+            raise ValueError("nome de usuário truncado")
+        if len(_INCOMING_NAMES_CACHE) >= _INCOMING_NAMES_CACHE_LIMIT:
+            _INCOMING_NAMES_CACHE.clear()
+        names = _INCOMING_NAMES_CACHE[names_key] = (data[_INCOMING_FIELDS_END:name_end].decode('utf-8'),
+                                                    _target_name(target_kind, data[name_end:]))
+    ip_text = _IP_TEXT_CACHE.get(ip) or _ip_text(ip)
+    return message_id, ip_text, port, names[0], timestamp, num_packets, encoding, target_kind, names[1]
+
+
+_HEARTBEAT_PACKET = _header(HEARTBEAT) # Sempre igual: montado uma vez
+
+# Tabelas do protocolo binário, por tipo: campos -> bytes e bytes -> campos
+_BINARY_ENCODERS = {
+    HELLO: _encode_hello,
+    WELCOME: lambda options: _header(WELCOME) + format_options(options).encode('utf-8'),
+    BYE: lambda: _header(BYE),
+    UPLOAD_START: _encode_upload_start,
+    INCOMING: _encode_incoming,
+    NOTIFY: lambda text: _header(NOTIFY) + text.encode('utf-8'),
+    STATS: lambda prometheus: _header(STATS) + STATS_STRUCT.pack(1 if prometheus else 0),
+    JOIN: lambda room: _header(JOIN) + _short_field(room),
+    LEAVE: lambda room: _header(LEAVE) + _short_field(room),
+    HEARTBEAT: lambda: _HEARTBEAT_PACKET,
+    HISTORY: lambda room, since_id: _header(HISTORY) + HISTORY_STRUCT.pack(since_id) + _short_field(room),
+}
+_BINARY_DECODERS = {
+    HELLO: _decode_hello,
+    WELCOME: lambda data: (parse_options(data[CONTROL_HEADER_SIZE:].decode('utf-8')),),
+    BYE: lambda data: (),
+    UPLOAD_START: _decode_upload_start,
+    INCOMING: _decode_incoming,
+    NOTIFY: lambda data: (data[CONTROL_HEADER_SIZE:].decode('utf-8'),),
+    STATS: lambda data: (STATS_STRUCT.unpack_from(data, CONTROL_HEADER_SIZE)[0] == 1,),
+    JOIN: lambda data: (data[CONTROL_HEADER_SIZE:].decode('utf-8'),),
+    LEAVE: lambda data: (data[CONTROL_HEADER_SIZE:].decode('utf-8'),),
+    HEARTBEAT: lambda data: (),
+    HISTORY: lambda data: (data[_HISTORY_FIELDS_END:].decode('utf-8'), HISTORY_STRUCT.unpack_from(data, CONTROL_HEADER_SIZE)[0]),
+}
+
+
+def decode_control(data):
+    """Decodifica uma mensagem de controle binária em (tipo, campos); levanta ValueError se ela for inválida."""
+    if len(data) < CONTROL_HEADER_SIZE:
+        raise ValueError("mensagem de controle truncada")
+    if data[1] != PROTOCOL_VERSION:
+        raise ValueError(f"versão de protocolo {data[1]} não suportada")
+    message_type = data[2]
+    decoder = _BINARY_DECODERS.get(message_type)
+    if decoder is None:
+        raise ValueError(f"tipo de mensagem de controle desconhecido: {message_type}")
+    try:
+        return message_type, decoder(data)
+    except (struct.error, OSError) as e: # Mensagem curta demais para o layout do tipo, ou IPv4 inválido
+        raise ValueError(f"mensagem de controle malformada: {e}") from None
+
+
+# Protocolo de texto (compatibilidade)
+#
+# Há duas gerações de clientes de texto. Os atuais (--text-protocol) usam os mesmos fragmentos com
+# cabeçalho do protocolo binário, levam o id da mensagem em MSG_UPLOAD_START/MSG_INCOMING e sempre
+# mandam a opção 'framed=1' no CMD:HI. Os anteriores ao cabeçalho nos fragmentos mandam um CMD:HI
+# sem opções e 'MSG_UPLOAD_START:<n>' seguido dos n pedaços do conteúdo, em ordem e sem cabeçalho,
+# e recebem da mesma forma 'MSG_INCOMING:<ip>:<porta>:<usuário>:<horário>:<n>' e os n pedaços,
+# lidos com recvfrom(1024 + 256).
+LEGACY_MAX_BUFF = 1024 # Tamanho fixo dos pedaços enviados aos clientes anteriores ao cabeçalho nos fragmentos
+LEGACY_MESSAGE_ID = 0  # Id dado aos uploads desses clientes na remontagem (eles têm um upload por vez)
+
+
+def frame_fragment(message_id, seq, total, payload):
+    """Fragmento com cabeçalho a partir de um pedaço sem cabeçalho (de um cliente antigo), para a remontagem."""
+    return FRAGMENT_HEADER.pack(FRAGMENT_MARKER, message_id, seq, total) + payload
+
+
+def build_legacy_packets(content_bytes, ip, port, username, timestamp):
+    """Cabeçalho MSG_INCOMING (sem id) e pedaços sem cabeçalho de uma mensagem, para clientes anteriores ao
+    cabeçalho nos fragmentos; eles juntam os pedaços na ordem de chegada."""
+    content_view = memoryview(content_bytes)
+    total = packet_count(len(content_view), LEGACY_MAX_BUFF)
+    header = f"MSG_INCOMING:{ip}:{port}:{username}:{format_timestamp(timestamp)}:{total}".encode('utf-8')
+    return [header] + [bytes(content_view[seq * LEGACY_MAX_BUFF:(seq + 1) * LEGACY_MAX_BUFF]) for seq in range(total)]
+
+
+def _text_plain(encoding, target_kind, target):
+    if encoding != ENCODING_NONE:
+        raise ValueError("o protocolo de texto não transporta conteúdo comprimido")
+    if target_kind != TARGET_ROOM or target != DEFAULT_ROOM:
+        raise ValueError(f"o protocolo de texto só conhece a sala '{DEFAULT_ROOM}'")
+
+
+def _text_upload_start(message_id, num_packets, encoding=ENCODING_NONE, target_kind=TARGET_ROOM, target=DEFAULT_ROOM):
+    _text_plain(encoding, target_kind, target)
+    return f"MSG_UPLOAD_START:{message_id}:{num_packets}"
+
+
+def _text_incoming(message_id, ip, port, username, timestamp, num_packets, encoding=ENCODING_NONE, target_kind=TARGET_ROOM,
+                   target=DEFAULT_ROOM):
+    _text_plain(encoding, target_kind, target)
+    return f"MSG_INCOMING:{message_id}:{ip}:{port}:{username}:{format_timestamp(timestamp)}:{num_packets}"
+
+
+_TEXT_ENCODERS = {
+    HELLO: lambda username, options: f"CMD:HI:{username}" + format_options(options or {}),
+    WELCOME: lambda options: "CMD:WELCOME" + format_options(options),
+    BYE: lambda: "CMD:BYE",
+    UPLOAD_START: _text_upload_start,
+    INCOMING: _text_incoming,
+    NOTIFY: lambda text: f"NOTIFY:{text}",
+    STATS: lambda prometheus: "CMD:STATS:prometheus" if prometheus else "CMD:STATS",
+}
+
+
+def encode_control(message_type, *fields, text=False):
+    """Codifica uma mensagem de controle no protocolo binário ou, com `text`, no protocolo de texto antigo.
+
+    Levanta ValueError se a mensagem não existe no protocolo de texto (ex: JOIN).
+    """
+    if text:
+        encoder = _TEXT_ENCODERS.get(message_type)
+        if encoder is None:
+            raise ValueError(f"tipo de mensagem {message_type} não existe no protocolo de texto")
+        return encoder(*fields).encode('utf-8')
+    return _BINARY_ENCODERS[message_type](*fields)
+
+
+def _parse_text_upload_start(body):
+    # "<id>:<num_packets>", ou só "<num_packets>" dos clientes anteriores ao cabeçalho nos fragmentos (id None)
+    message_id, _, num_packets = body.rpartition(':')
+    return int(message_id) if message_id else None, int(num_packets), ENCODING_NONE, TARGET_ROOM, DEFAULT_ROOM
+
+
+def _parse_text_incoming(body):
+    # "<id>:<ip>:<porta>:<usuário>:<HH:MM:SS DD/MM/YYYY>:<num_packets>"; o timestamp tem dois ':',
+    # então o nome (que pode conter ':') é separado a partir do fim
+    message_id, ip, port, rest = body.split(':', 3)
+    rest, _, num_packets = rest.rpartition(':')
+    fields = rest.rsplit(':', 3)
+    if len(fields) == 4:
+        username, timestamp = fields[0], ":".join(fields[1:])
+    else: # Timestamp em outro formato (sem ':')
+        username, timestamp = rest.split(':', 1)
+    return int(message_id), ip, int(port), username, timestamp, int(num_packets), ENCODING_NONE, TARGET_ROOM, DEFAULT_ROOM
+
+
+# Prefixo do comando de texto -> (tipo, interpretação do restante em campos)
+_TEXT_DECODERS = (
+    ("CMD:HI:", HELLO, parse_hello),
+    ("MSG_UPLOAD_START:", UPLOAD_START, _parse_text_upload_start),
+    ("MSG_INCOMING:", INCOMING, _parse_text_incoming),
+    ("NOTIFY:", NOTIFY, lambda body: (body,)),
+    ("CMD:WELCOME", WELCOME, lambda body: (parse_options(body),)),
+    ("CMD:BYE", BYE, lambda body: ()),
+    ("CMD:STATS", STATS, lambda body: (body == ":prometheus",)),
+)
+
+
+def decode_text_control(message_str):
+    """Traduz um comando do protocolo de texto para (tipo, campos); levanta ValueError se for desconhecido."""
+    for prefix, message_type, parse in _TEXT_DECODERS:
+        if message_str.startswith(prefix):
+            return message_type, parse(message_str[len(prefix):])
+    raise ValueError(f"comando desconhecido: '{message_str}'")
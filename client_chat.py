@@ -1,226 +1,296 @@
 # client_chat.py
 import socket as skt
-import os
-import math
-import time
+import selectors
+import sys
 import threading
-import tempfile
+import time
+
+from chat_config import add_network_arguments, datagram_size, set_socket_buffers
+from chat_protocol import COMPRESSION_CODECS, DEFAULT_ROOM, MAX_DATAGRAM_SIZE
+from client_core import ClientSession, Notification, stream_chunks
+from pacing import DEFAULT_PACING, pacing_argument, parse_pacing
+from reliability import RELIABILITY_TICK
 
 MAX_BUFF_SIZE = 1024
 SERVER_HOST = '127.0.0.1'
 SERVER_PORT = 7070
 CLIENT_HOST = '0.0.0.0'
 
-def get_packet_amount(file_path, max_buff):
-    """Calcula o número total de pacotes necessários para enviar um arquivo."""
-    if not os.path.exists(file_path): return 0
-    fsize = os.stat(file_path).st_size
-    total_packs = math.ceil(fsize / max_buff)
-    return total_packs
+# Consulta do path MTU (Linux; o módulo socket não exporta estas constantes)
+IP_MTU_DISCOVER = 10
+IP_PMTUDISC_DO = 2 # Não fragmenta: o kernel passa a acompanhar o MTU do caminho
+IP_MTU = 14
+IPV4_UDP_OVERHEAD = 28 # Cabeçalhos IPv4 (20) + UDP (8)
+
 
-def create_temp_txt_file(message_content):
-    """Cria um arquivo .txt temporário com o conteúdo da mensagem e retorna seu nome."""
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".txt", mode="w", encoding="utf-8")
-    temp_file.write(message_content)
-    temp_file.close()
-    return temp_file.name
+def probe_path_mtu(host, port):
+    """Retorna o maior datagrama UDP que cabe no caminho até (host, port), ou None se não for possível descobrir.
+
+    Usa o MTU que o kernel associa à rota (interface e, se já houver, o PMTU aprendido por ICMP);
+    nenhum pacote é enviado ao servidor.
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    probe_sckt = skt.socket(skt.AF_INET, skt.SOCK_DGRAM)
+    try:
+        probe_sckt.setsockopt(skt.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+        probe_sckt.connect((host, port))
+        path_mtu = probe_sckt.getsockopt(skt.IPPROTO_IP, IP_MTU)
+    except OSError:
+        return None
+    finally:
+        probe_sckt.close()
+    return min(MAX_DATAGRAM_SIZE, path_mtu - IPV4_UDP_OVERHEAD)
 
 
 class UDPClient():
-    """Representa o cliente de chat UDP."""
-    def __init__(self, server_host, server_port, max_buff, client_bind_port=0):
+    """Cliente de chat UDP para o terminal.
+
+    O protocolo fica no ClientSession (client_core.py); esta classe só cuida do socket, da thread
+    de recebimento e do console. Para bots e ferramentas sem terminal, veja async_client_chat.py.
+    """
+    def __init__(self, server_host, server_port, max_buff, client_bind_port=0, reliable=False, pacing=None,
+                 request_max_buff=None, mtu_probe=False, text_protocol=False, compression=None, rcvbuf=None, sndbuf=None):
         """Inicializa o cliente UDP, configura o socket e variáveis de estado."""
         self.sckt = skt.socket(skt.AF_INET, skt.SOCK_DGRAM)
+        set_socket_buffers(self.sckt, rcvbuf, sndbuf) # None mantém o padrão do sistema
         try:
             self.sckt.bind((CLIENT_HOST, client_bind_port))
         except OSError as e:
             print(f"[CLIENT_ERROR] Bind error: {e}. Tente uma porta diferente ou 0 para escolha do OS.")
             raise
-            
+
         self.client_ip, self.client_port = self.sckt.getsockname()
         print(f"[CLIENT] Bound to {self.client_ip}:{self.client_port}")
 
-        self.sckt.settimeout(1.0) # Timeout para operações de socket (recvfrom)
-        
         if self.sckt is None: # Verificação adicional
             raise Exception("Socket not available.")
-        
+
         self.server_address = (server_host, server_port) # Endereço do servidor
-        self.MAX_BUFF = max_buff # Tamanho máximo do buffer para pacotes
-        self.username = None # Nome do usuário no chat
+        # Tamanho de datagrama pedido no CMD:HI: explícito ou descoberto pelo path MTU
+        if mtu_probe:
+            request_max_buff = probe_path_mtu(server_host, server_port) or request_max_buff
+        # Controle de taxa dos envios ao servidor (ex: 'aimd', 'fixed:5000'); None envia sem pausas
+        rate_controller_factory = parse_pacing(pacing)
+        rate_controller = rate_controller_factory() if rate_controller_factory is not None else None
+        # Estado de protocolo (sem E/S); o nome de usuário é definido em run()
+        self.session = ClientSession(None, max_buff, reliable=reliable, rate_controller=rate_controller,
+                                     request_max_buff=request_max_buff, text_protocol=text_protocol, compression=compression)
+
         self.stop_event = threading.Event() # Sinaliza para threads encerrarem
         self.prompt_lock = threading.Lock() # Sincroniza acesso ao console para o prompt
+        self.session_lock = threading.Lock() # O envio (thread principal) e o recebimento (outra thread) compartilham a sessão
+        self.current_room = DEFAULT_ROOM # Sala das mensagens digitadas (trocada por '/join <sala>')
+        # Acorda a thread de recebimento (para acompanhar os timeouts de um upload confiável, ou no encerramento)
+        self._wakeup_recv, self._wakeup_send = skt.socketpair()
+
+    @property
+    def username(self):
+        return self.session.username
+
+    @username.setter
+    def username(self, username):
+        self.session.username = username
 
-        self.receiving_message_data = {} # Armazena dados de mensagens fragmentadas em recebimento
+    @property
+    def MAX_BUFF(self):
+        return self.session.max_buff
 
-    def send_message_file(self, message_content):
-        """Converte uma mensagem em um arquivo .txt, fragmenta e envia ao servidor."""
-        temp_file_path = None
+    @property
+    def reliable_sender(self):
+        return self.session.reliable_sender
+
+    def send_message(self, message, room=None, user=None):
+        """Codifica a mensagem direto em memória, fragmenta (fatias de memoryview) e envia ao servidor, para a
+        sala atual (ou `room`) ou, com `user`, como mensagem privada."""
         try:
-            if not message_content.strip(): # Não envia mensagens vazias
+            content_bytes = message.encode('utf-8') if isinstance(message, str) else message
+            if not content_bytes.strip(): # Não envia mensagens vazias
                 return
+            with self.session_lock:
+                packets = self.session.upload(content_bytes, room or self.current_room, user)
+                paced = self.session.paced
+            self._send_upload(packets, paced)
+        except Exception as e:
+            self._display_error(f"Error sending message: {e}")
 
-            temp_file_path = create_temp_txt_file(message_content)
-            num_packets = get_packet_amount(temp_file_path, self.MAX_BUFF)
-
-            # Garante que arquivos pequenos (que gerariam 0 pacotes) sejam enviados como 1 pacote
-            if num_packets == 0 and os.path.exists(temp_file_path) and os.stat(temp_file_path).st_size > 0:
-                 num_packets = 1
-            elif num_packets == 0: # Se o arquivo realmente estiver vazio ou erro
-                 if temp_file_path and os.path.exists(temp_file_path): os.remove(temp_file_path)
-                 return
-
-            # Informa ao servidor o início do upload da mensagem e o número de pacotes
-            start_msg_upload = f"MSG_UPLOAD_START:{num_packets}"
-            self.sckt.sendto(start_msg_upload.encode('utf-8'), self.server_address)
-            time.sleep(0.001) # Pequena pausa
-
-            # Envia os fragmentos do arquivo
-            with open(temp_file_path, 'rb') as f:
-                for _ in range(num_packets):
-                    chunk = f.read(self.MAX_BUFF)
-                    if not chunk: break # Segurança
-                    self.sckt.sendto(chunk, self.server_address)
-                    time.sleep(0.001) # Pequena pausa
+    def send_stream(self, source, total_size=None, room=None, user=None):
+        """Envia um conteúdo grande (arquivo binário aberto ou iterador de blocos) sem carregá-lo inteiro na memória."""
+        chunks, total_size = stream_chunks(source, total_size)
+        try:
+            with self.session_lock:
+                packets = self.session.upload_stream(chunks, total_size, room or self.current_room, user)
+                paced = self.session.paced
+            self._send_upload(packets, paced)
+        except Exception as e:
+            self._display_error(f"Error sending stream: {e}")
+
+    def _send_upload(self, packets, paced):
+        """Envia os datagramas de um upload, esperando as fichas do controlador de taxa se `paced`."""
+        if self.session.reliable_sender is not None: # A thread de recebimento passa a acompanhar os timeouts
+            self._wakeup_send.send(b"\0")
+        if not paced:
+            self._send_to_server(packets)
+            return
+        rate_controller = self.session.rate_controller
+        for packet in packets:
+            wait = rate_controller.reserve(time.monotonic())
+            if wait > 0:
+                time.sleep(wait)
+            self.sckt.sendto(packet, self.server_address)
+
+    def _send_to_server(self, packets):
+        """Envia uma sequência de datagramas ao servidor."""
+        for packet in packets:
+            self.sckt.sendto(packet, self.server_address)
+
+    def send_hello(self):
+        """Envia o comando de conexão (Hello) com as opções pedidas por este cliente."""
+        self.sckt.sendto(self.session.hello(), self.server_address)
+
+    def join_room(self, room):
+        """Entra em uma sala, que passa a ser a sala atual das mensagens digitadas, e pede as mensagens anteriores dela
+        (se o servidor guarda histórico)."""
+        try:
+            with self.session_lock:
+                packets = [self.session.join(room)]
+                if self.session.supports_history:
+                    packets.append(self.session.history(room))
+            self._send_to_server(packets)
+            self.current_room = room
+        except Exception as e:
+            self._display_error(f"Error joining room: {e}")
+
+    def request_history(self, room=None):
+        """Pede ao servidor as mensagens da sala (por padrão, a atual) posteriores à última recebida."""
+        room = room or self.current_room
+        if not self.session.supports_history:
+            self._display_error("O servidor não guarda histórico.")
+            return
+        try:
+            with self.session_lock:
+                packet = self.session.history(room)
+            self.sckt.sendto(packet, self.server_address)
+        except Exception as e:
+            self._display_error(f"Error requesting history: {e}")
+
+    def leave_room(self, room):
+        """Sai de uma sala; se era a sala atual, volta para a sala padrão."""
+        try:
+            with self.session_lock:
+                packet = self.session.leave(room)
+            self.sckt.sendto(packet, self.server_address)
+            if self.current_room == room:
+                self.current_room = DEFAULT_ROOM
         except Exception as e:
-            with self.prompt_lock: # Protege a impressão de erro
-                print("\r" + " " * 80 + "\r", end="") # Limpa a linha do prompt
-                print(f"[CLIENT_ERROR] Error sending message file: {e}")
-                self._display_prompt() # Reexibe o prompt
-        finally:
-            # Garante a remoção do arquivo temporário
-            if temp_file_path and os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
+            self._display_error(f"Error leaving room: {e}")
 
     def _display_prompt(self):
         """Exibe o prompt de input '>' se o cliente não estiver parando."""
         if not self.stop_event.is_set():
             print("> ", end="", flush=True)
 
+    def _display_line(self, text):
+        """Exibe uma linha no console, limpando e reexibindo o prompt."""
+        with self.prompt_lock:
+            print("\r" + " " * 80 + "\r", end="") # Limpa prompt
+            print(text)
+            self._display_prompt() # Reexibe prompt
+
+    def _display_error(self, text):
+        self._display_line(f"[CLIENT_ERROR] {text}")
+
+    def _display_chat_message(self, message):
+        """Exibe uma mensagem de chat remontada (ChatMessage) no padrão do chat (com a sala, fora da sala padrão)."""
+        prefix = "[privado] " if message.direct else "" if message.room == DEFAULT_ROOM else f"[#{message.room}] "
+        self._display_line(f"{prefix}{message.ip}:{message.port}/~{message.username}: {message.text} {message.timestamp}")
+
+    def _display_notification(self, notification):
+        self._display_line(notification.text)
+
     def _handle_incoming_server_data(self, data):
-        """Processa dados recebidos do servidor (notificações, cabeçalhos de msg, fragmentos de msg)."""
-        # Prioriza o tratamento de fragmentos de dados se uma mensagem estiver sendo recebida
-        if 'expected_packets' in self.receiving_message_data and \
-           self.receiving_message_data['expected_packets'] > 0 and \
-           len(self.receiving_message_data.get('parts', [])) < self.receiving_message_data['expected_packets']:
-            
-            self.receiving_message_data['parts'].append(data) # Adiciona o fragmento
-
-            # Se todos os fragmentos foram recebidos, remonta e exibe a mensagem
-            if len(self.receiving_message_data['parts']) == self.receiving_message_data['expected_packets']:
-                with self.prompt_lock:
-                    print("\r" + " " * 80 + "\r", end="") # Limpa prompt
-                    full_content_bytes = b"".join(self.receiving_message_data['parts'])
-                    message_text = ""
-                    try:
-                        message_text = full_content_bytes.decode('utf-8')
-                    except UnicodeDecodeError: # Fallback de decodificação
-                        message_text = full_content_bytes.decode('latin-1', errors='replace')
-                    
-                    h = self.receiving_message_data['header_info'] # Pega informações do cabeçalho
-                    # Formata e exibe a mensagem no padrão do chat
-                    display_msg = f"{h['ip']}:{h['port']}/~{h['username']}: {message_text} {h['timestamp']}"
-                    print(display_msg)
-                    self.receiving_message_data = {} # Reseta para a próxima mensagem
-                    self._display_prompt() # Reexibe prompt
-            return # Retorna após processar o fragmento
-
-        # Se não era um fragmento esperado, tenta decodificar como string (para comandos/cabeçalhos)
+        """Processa um datagrama do servidor: a sessão interpreta, o console exibe."""
+        with self.session_lock:
+            try:
+                events = self.session.receive(data)
+            finally: # ACKs saem mesmo se o datagrama for inválido
+                outgoing = self.session.take_outgoing()
+                self._send_to_server(outgoing)
+        for event in events:
+            if isinstance(event, Notification):
+                self._display_notification(event)
+            else:
+                self._display_chat_message(event)
+
+    def _service_timers(self):
+        """Executa as tarefas periódicas da sessão; retorna True se há uploads confiáveis em trânsito."""
+        with self.session_lock:
+            self.session.poll()
+            self._send_to_server(self.session.take_outgoing())
+            return self.session.has_pending()
+
+    def receive_messages(self):
+        """Loop executado em uma thread para receber mensagens do servidor continuamente.
+
+        Sem uploads confiáveis em trânsito, a thread só acorda quando chega um datagrama ou na hora do
+        próximo heartbeat.
+        """
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.sckt, selectors.EVENT_READ)
+            selector.register(self._wakeup_recv, selectors.EVENT_READ)
+            timers_busy = False
+            while not self.stop_event.is_set(): # Continua enquanto o cliente estiver ativo
+                try:
+                    with self.session_lock: # Ocioso, só acorda para o próximo heartbeat (se o servidor os pediu)
+                        idle_wait = self.session.next_timer_delay()
+                    for key, _ in selector.select(RELIABILITY_TICK if timers_busy else idle_wait):
+                        if key.fileobj is self._wakeup_recv:
+                            self._wakeup_recv.recv(4096)
+                            continue
+                        # Recebe dados do servidor (buffer do maior datagrama possível: nada é truncado)
+                        data, server_addr_recv = self.sckt.recvfrom(MAX_DATAGRAM_SIZE)
+                        # Verifica se a mensagem veio do servidor esperado
+                        if server_addr_recv == self.server_address:
+                            try:
+                                self._handle_incoming_server_data(data) # Processa os dados recebidos
+                            except ValueError as e: # Datagrama inválido ou malformado
+                                self._display_error(str(e))
+                    timers_busy = self._service_timers()
+                except ConnectionResetError:
+                    self._display_error("Erro de conexão com o servidor (reset).")
+                except OSError as e: # Ex: socket fechado durante o recvfrom
+                    if self.stop_event.is_set(): break
+                    self._display_error(f"Erro de socket em receive_messages: {e}")
+                    break # Sai do loop de recebimento se o socket tiver problemas
+                except Exception as e:
+                    self._display_error(f"Erro geral em receive_messages: {e}")
+
+    def _send_file_command(self, file_path):
+        """Trata o comando '/file <caminho>' do terminal, enviando o arquivo em fluxo."""
         try:
-            message_str = data.decode('utf-8')
-
-            with self.prompt_lock: # Sincroniza acesso ao console
-                print("\r" + " " * 80 + "\r", end="")
-
-                if message_str.startswith("NOTIFY:"): # Processa notificações do servidor
-                    print(f"{message_str.split(':', 1)[1]}")
-                
-                elif message_str.startswith("MSG_INCOMING:"): # Processa cabeçalho de mensagem
-                    content_part = message_str[len("MSG_INCOMING:"):]
-                    try:
-                        # Dá parse no cabeçalho para obter as informações da mensagem
-                        parts_temp = content_part.rsplit(':', 1)
-                        if len(parts_temp) != 2:
-                            raise ValueError("MSG_INCOMING: Não foi possível isolar num_packets.")
-                        
-                        num_packets_str = parts_temp[1]
-                        num_packets = int(num_packets_str)
-
-                        before_num_packets = parts_temp[0]
-                        fields_before_timestamp = before_num_packets.split(':', 3)
-                        if len(fields_before_timestamp) == 4:
-                            header_info = {
-                                'ip': fields_before_timestamp[0],
-                                'port': fields_before_timestamp[1],
-                                'username': fields_before_timestamp[2],
-                                'timestamp': fields_before_timestamp[3],
-                            }
-                            # Prepara para receber os fragmentos da mensagem
-                            self.receiving_message_data = {
-                                'header_info': header_info,
-                                'parts': [],
-                                'expected_packets': num_packets
-                            }
-                        else: # Erro de formatação no cabeçalho
-                            print(f"[CLIENT_ERROR] Malformed MSG_INCOMING (campos antes do timestamp): '{before_num_packets}'")
-                            self.receiving_message_data = {}
-                            
-                    except ValueError as e: # Erro ao converter num_packets ou no parse
-                         print(f"[CLIENT_ERROR] Erro ao parsear MSG_INCOMING ('{content_part}'): {e}")
-                         self.receiving_message_data = {}
-                    except IndexError: # Erro de formatação (faltando partes)
-                         print(f"[CLIENT_ERROR] Malformed MSG_INCOMING (IndexError ao parsear): '{content_part}'")
-                         self.receiving_message_data = {}
-                else: # A string foi decodificada, mas não é em um formato conhecido
-                    print(f"\n--- DEBUG CLIENT UNEXPECTED STRING (after explicit binary check) ---")
-                    print(f"String decodificada: '{message_str}'")
-                    print(f"Dados brutos originais (primeiros 50 bytes): {data[:50]}")
-                    print(f"Estado atual de receiving_message_data: {self.receiving_message_data}")
-                    print(f"--- FIM DEBUG ---")
-                    print(f"[FROM_SERVER_UNEXPECTED_STRING]: {message_str}")
-              
-                self._display_prompt() 
-
-        except UnicodeDecodeError: # Falhou ao decodificar como string
-            with self.prompt_lock:
-                print("\r" + " " * 80 + "\r", end="") # Limpa prompt
-                print(f"[CLIENT_ERROR] Recebeu dados binários que não são parte de uma mensagem esperada (estado: {self.receiving_message_data}). Dados (primeiros 50): {data[:50]}")
-                self._display_prompt() # Reexibe prompt
-        
-        except Exception as e: # Captura outras exceções
+            with open(file_path, 'rb') as f:
+                self.send_stream(f)
+        except OSError as e:
             with self.prompt_lock:
-                print("\r" + " " * 80 + "\r", end="") # Limpa prompt
-                print(f"[CLIENT_ERROR] Erro em _handle_incoming_server_data: {e}")
-                self._display_prompt() # Reexibe prompt
+                print(f"[CLIENT_ERROR] Não foi possível abrir '{file_path}': {e}")
 
-    def receive_messages(self):
-        """Loop executado em uma thread para receber mensagens do servidor continuamente."""
-        while not self.stop_event.is_set(): # Continua enquanto o cliente estiver ativo
-            try:
-                # Recebe dados do servidor (buffer um pouco maior para cabeçalhos)
-                data, server_addr_recv = self.sckt.recvfrom(self.MAX_BUFF + 256) 
-                # Verifica se a mensagem veio do servidor esperado
-                if server_addr_recv == self.server_address:
-                    self._handle_incoming_server_data(data) # Processa os dados recebidos
-            except skt.timeout:
-                continue
-            except ConnectionResetError:
-                with self.prompt_lock:
-                    print("\r" + " " * 80 + "\r", end="")
-                    print("[CLIENT_ERROR] Erro de conexão com o servidor (reset).")
-                    self._display_prompt()
-            except OSError as e: # Ex: socket fechado durante o recvfrom
-                 if self.stop_event.is_set(): break 
-                 with self.prompt_lock:
-                    print("\r" + " " * 80 + "\r", end="")
-                    print(f"[CLIENT_ERROR] Erro de socket em receive_messages: {e}")
-                    self._display_prompt()
-                 break # Sai do loop de recebimento se o socket tiver problemas
-            except Exception as e: 
-                with self.prompt_lock:
-                    print("\r" + " " * 80 + "\r", end="")
-                    print(f"[CLIENT_ERROR] Erro geral em receive_messages: {e}")
-                    self._display_prompt()
+    def _room_command(self, user_input):
+        """Trata os comandos '/join <sala>', '/leave <sala>', '/history [sala]' e '/msg <usuário> <texto>' do terminal."""
+        command, _, argument = user_input.strip().partition(" ")
+        argument = argument.strip()
+        if command == "/history":
+            self.request_history(argument or None)
+            return
+        if command == "/msg":
+            user, _, text = argument.partition(" ")
+            if user and text.strip():
+                self.send_message(text, user=user)
+                return
+        elif argument:
+            (self.join_room if command == "/join" else self.leave_room)(argument)
+            return
+        with self.prompt_lock:
+            print("[CLIENT_ERROR] Uso: /join <sala>, /leave <sala>, /history [sala] ou /msg <usuário> <texto>")
 
     def run(self):
         """Inicia o cliente: ele pega nome de usuário, conecta ao servidor e gerencia loops de envio/recebimento."""
@@ -230,15 +300,16 @@ class UDPClient():
             return
 
         # Envia comando de conexão para o servidor
-        connect_cmd = f"CMD:HI:{self.username}"
-        self.sckt.sendto(connect_cmd.encode('utf-8'), self.server_address)
+        self.send_hello()
 
         print("[CLIENT] Escutando por mensagens do servidor...")
         # Inicia thread para receber mensagens do servidor
         receiver_thread = threading.Thread(target=self.receive_messages, daemon=True)
         receiver_thread.start()
 
-        print(f"Conectado como {self.username}. Digite sua mensagem ou 'bye' para sair.")
+        print(f"Conectado como {self.username}. Digite sua mensagem, '/file <caminho>' para enviar um arquivo, "
+              f"'/join <sala>' e '/leave <sala>' para trocar de sala, '/history [sala]' para as mensagens anteriores, "
+              f"'/msg <usuário> <texto>' para uma mensagem privada ou 'bye' para sair.")
         self._display_prompt() # Exibe o prompt inicial
 
         try:
@@ -248,29 +319,34 @@ class UDPClient():
 
                 if self.stop_event.is_set(): break # Verifica se deve parar após o input
 
-                with self.prompt_lock: 
-                    if user_input.strip().lower() == "bye":
-                        bye_cmd = "CMD:BYE"
-                        self.sckt.sendto(bye_cmd.encode('utf-8'), self.server_address)
-                        print("Desconectando...") 
+                if user_input.strip().lower() == "bye":
+                    with self.prompt_lock:
+                        self.sckt.sendto(self.session.bye(), self.server_address)
+                        print("Desconectando...")
                         self.stop_event.set() # Para as threads
-                        break
-                    elif user_input.strip(): # Se não for 'bye' e não for vazio, envia como mensagem
-                        self.send_message_file(user_input)
-                    
-                    if not self.stop_event.is_set() and user_input.strip().lower() != "bye":
+                    break
+                # O envio acontece fora do prompt_lock: em caso de erro, ele mesmo adquire o lock para avisar
+                elif user_input.startswith("/file "): # Envia o conteúdo de um arquivo como mensagem
+                    self._send_file_command(user_input[len("/file "):].strip())
+                elif user_input.split(" ", 1)[0] in ("/join", "/leave", "/history", "/msg"): # Salas, histórico e mensagens privadas
+                    self._room_command(user_input)
+                elif user_input.strip(): # Se não for 'bye' e não for vazio, envia como mensagem
+                    self.send_message(user_input)
+
+                with self.prompt_lock:
+                    if not self.stop_event.is_set():
                         self._display_prompt()
-        
+
         except KeyboardInterrupt: # Trata Ctrl+C
             with self.prompt_lock:
                 print("\nDesconectando por interrupção do usuário (Ctrl+C)...")
                 if self.username and not self.stop_event.is_set(): # Envia 'bye' se estava conectado
-                    bye_cmd = "CMD:BYE"
-                    self.sckt.sendto(bye_cmd.encode('utf-8'), self.server_address)
+                    self.sckt.sendto(self.session.bye(), self.server_address)
                 self.stop_event.set() # Sinaliza para threads pararem
         finally: # Bloco de limpeza executado sempre ao sair do try
             self.stop_event.set() # Garante que está setado para todas as threads
             print("[CLIENT] Encerrando...")
+            self._wakeup_send.send(b"\0") # Acorda a thread de recebimento para ela ver o stop_event
             if receiver_thread.is_alive(): # Espera a thread de recebimento finalizar
                  receiver_thread.join(timeout=1.0)
             self.close() # Fecha o socket do cliente
@@ -280,20 +356,43 @@ class UDPClient():
         """Fecha o socket do cliente de forma segura."""
         if self.sckt: # Verifica se o socket ainda existe
             try:
+                self.stop_event.set()
+                self._wakeup_send.send(b"\0") # Uma thread de recebimento bloqueada acorda e encerra
                 self.sckt.close()
+                self._wakeup_send.close()
+                self._wakeup_recv.close()
             except Exception as e: # Para quando encontrar possíveis erros ao fechar
                 print(f"[CLIENT_WARN] Erro ao fechar socket: {e}")
             finally:
                 self.sckt = None # Define como None para evitar uso posterior
 
 
-if __name__ == '__main__':
+def main(argv=None):
+    """Ponto de entrada do cliente (`python client_chat.py` ou o comando `chat-client` do pacote instalado)."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Cliente de Chat UDP.")
+    add_network_arguments(parser, SERVER_HOST, SERVER_PORT, MAX_BUFF_SIZE, 'SERVER', "Endereço do servidor")
+    parser.add_argument('--reliable', action='store_true', help="Pede entrega confiável (ACK/NACK com retransmissão) ao servidor")
+    parser.add_argument('--pacing', type=pacing_argument, default=DEFAULT_PACING, help=f"Controle de taxa dos envios: none, fixed:<pacotes/s>, aimd ou aimd:<inicial>:<máxima> (padrão: {DEFAULT_PACING}). O AIMD se ajusta com os ACKs da entrega confiável; sem --reliable vira uma taxa fixa de ~10 MB/s (entrega completa em loopback); use fixed:/none para mais vazão, aceitando perdas")
+    parser.add_argument('--max-buff', type=datagram_size, default=None, help="Tamanho de datagrama pedido ao servidor (ex: 1472 em LAN, 65507 em loopback)")
+    parser.add_argument('--mtu-probe', action='store_true', help="Pede o maior datagrama que cabe no MTU do caminho até o servidor")
+    parser.add_argument('--text-protocol', action='store_true', help="Usa o protocolo de texto antigo (para servidores antigos)")
+    parser.add_argument('--compress', choices=sorted(COMPRESSION_CODECS), default=None,
+                        help="Comprime as mensagens grandes com este codec, se o servidor aceitar")
+    args = parser.parse_args(argv)
+
     client_bind_port_arg = 0 # Deixa o OS escolher a porta por padrão
     try:
         # Cria e inicia a instância do cliente
-        client = UDPClient(SERVER_HOST, SERVER_PORT, MAX_BUFF_SIZE, client_bind_port=client_bind_port_arg)
+        client = UDPClient(args.host, args.port, args.buffer_size, client_bind_port=client_bind_port_arg, reliable=args.reliable,
+                           pacing=args.pacing, request_max_buff=args.max_buff, mtu_probe=args.mtu_probe,
+                           text_protocol=args.text_protocol, compression=args.compress, rcvbuf=args.rcvbuf, sndbuf=args.sndbuf)
         client.run()
     except OSError as e:
         print(f"[CLIENT_FATAL_ERROR] Não foi possível iniciar o cliente devido a um erro de OS (ex: bind): {e}")
     except Exception as e:
-        print(f"[CLIENT_FATAL_ERROR] Erro inesperado ao iniciar o cliente: {e}")
\ No newline at end of file
+        print(f"[CLIENT_FATAL_ERROR] Erro inesperado ao iniciar o cliente: {e}")
+
+
+if __name__ == '__main__':
+    main()
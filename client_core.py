@@ -0,0 +1,342 @@
+# client_core.py
+# Núcleo do cliente de chat, sem E/S: monta os datagramas a enviar e interpreta os recebidos.
+#
+# O ClientSession não abre sockets, não imprime e não usa locks; quem o usa (o terminal em
+# client_chat.py, o AsyncChatClient em async_client_chat.py, bots e geradores de carga) entrega
+# os datagramas recebidos a receive(), que devolve os eventos (mensagens e notificações), e envia
+# os datagramas que o núcleo produz (uploads, ACKs e retransmissões da entrega confiável).
+import io
+import itertools
+import os
+import time
+from collections import deque, namedtuple
+
+from chat_protocol import (BYE, COMPRESSION_CODECS, COMPRESSION_THRESHOLD, DEFAULT_ROOM, ENCODING_NONE, HEARTBEAT, HELLO, HISTORY, INCOMING,
+                           JOIN, LEAVE, MESSAGE_ID_MODULO, NOTIFY, TARGET_ROOM, TARGET_USER, UPLOAD_START, WELCOME,
+                           MessageReassembler, build_fragments, compress_payload,
+                           decode_control, decode_text_control, decompress_payload, encode_control, format_compress_option,
+                           format_timestamp, fragment_payload_size, is_control, is_fragment, iter_stream_fragments,
+                           packet_count, parse_compress_option)
+from reliability import RELIABILITY_TICK, AckTracker, ReliableSender, ack_every_for_window, is_ack, window_for_datagram
+
+RECEIVE_IDLE_TIMEOUT = 30.0 # Segundos sem fragmentos até descartar uma mensagem incompleta recebida
+STREAM_READ_SIZE = 64 * 1024 # Tamanho dos blocos lidos de arquivos enviados em fluxo
+DELIVERED_IDS_PER_ROOM = 2048 # Ids já entregues lembrados por sala, para descartar a mesma mensagem vinda de novo
+
+
+def decode_text(content_bytes):
+    """Decodifica o conteúdo de uma mensagem como UTF-8, com fallback para latin-1."""
+    try:
+        return content_bytes.decode('utf-8')
+    except UnicodeDecodeError:
+        return content_bytes.decode('latin-1', errors='replace')
+
+
+def get_remaining_size(file_obj):
+    """Retorna quantos bytes ainda faltam ler de um arquivo aberto (da posição atual até o fim)."""
+    try:
+        return os.fstat(file_obj.fileno()).st_size - file_obj.tell()
+    except (AttributeError, OSError, io.UnsupportedOperation): # Ex: BytesIO, que não tem descritor de arquivo
+        position = file_obj.tell()
+        end = file_obj.seek(0, io.SEEK_END)
+        file_obj.seek(position)
+        return end - position
+
+
+def stream_chunks(source, total_size=None):
+    """Normaliza a origem de um envio em fluxo: retorna (iterador de blocos, tamanho total).
+
+    `source` pode ser um arquivo aberto em modo binário (o tamanho é descoberto a partir da
+    posição atual) ou um iterador de blocos de bytes, caso em que `total_size` é obrigatório.
+    """
+    if hasattr(source, 'read'):
+        if total_size is None:
+            total_size = get_remaining_size(source)
+        return iter(lambda: source.read(STREAM_READ_SIZE), b""), total_size
+    if total_size is None:
+        raise ValueError("total_size é obrigatório ao enviar um iterador de blocos.")
+    return source, total_size
+
+
+class ChatMessage(namedtuple('ChatMessage', 'ip port username timestamp content room direct message_id',
+                             defaults=(DEFAULT_ROOM, False, None))):
+    """Mensagem de chat recebida: remetente original, horário do servidor, conteúdo em bytes, a sala (ou, com
+    `direct`, mensagem privada) e o id dado pelo servidor (usado para pedir o histórico a partir dela)."""
+    __slots__ = ()
+
+    @property
+    def text(self):
+        return decode_text(self.content)
+
+
+class Notification(namedtuple('Notification', 'text')):
+    """Notificação do servidor (ex: entrada ou saída de um usuário)."""
+    __slots__ = ()
+
+
+class ClientSession:
+    """Estado de protocolo de um cliente: ids das mensagens, remontagem, opções negociadas e entrega confiável."""
+    def __init__(self, username, max_buff, reliable=False, rate_controller=None, request_max_buff=None, text_protocol=False,
+                 compression=None, compression_threshold=COMPRESSION_THRESHOLD):
+        self.username = username
+        self.text_protocol = text_protocol # Fala o protocolo de texto antigo (para servidores antigos)
+        self.max_buff = max_buff # Tamanho dos datagramas enviados (até o servidor aceitar outro no CMD:WELCOME)
+        self.request_max_buff = request_max_buff # Tamanho de datagrama pedido no CMD:HI
+        self.reliable = reliable # Entrega confiável pedida no CMD:HI (ativada quando o servidor aceita)
+        self.rate_controller = rate_controller
+        # Codec pedido no HELLO para comprimir os uploads ('zlib' ou 'lzma'; só no protocolo binário)
+        if compression is not None and compression not in COMPRESSION_CODECS:
+            raise ValueError(f"codec de compressão indisponível: {compression}")
+        self.compression = None if text_protocol else compression
+        self.compression_threshold = compression_threshold # Mensagens menores saem sem compressão
+        self.upload_encoding = ENCODING_NONE # Encoding dos uploads, quando o servidor aceita o codec no WELCOME
+        self.welcomed = False # O servidor já respondeu ao CMD:HI com CMD:WELCOME
+        self.reliable_sender = None # ReliableSender para os uploads ao servidor
+        self.ack_tracker = None # AckTracker para as mensagens recebidas do servidor
+        # Mensagens fragmentadas em recebimento, remontadas por id (em qualquer ordem)
+        self.reassembler = MessageReassembler(idle_timeout=RECEIVE_IDLE_TIMEOUT)
+        self._message_ids = itertools.count(1) # Ids das mensagens enviadas por este cliente
+        self.rooms = {DEFAULT_ROOM} # Salas em que o cliente entrou (a padrão, ao conectar)
+        self.heartbeat_interval = None # Intervalo dos HEARTBEATs pedido pelo servidor no WELCOME (None: não envia)
+        self._next_heartbeat = None
+        self.supports_history = False # O servidor aceitou pedidos de histórico (HISTORY) no WELCOME
+        self.last_message_ids = {} # {sala: maior id de mensagem recebido}, o ponto de partida dos pedidos de histórico
+        # {sala: (set, deque) dos últimos ids entregues}: uma mensagem pode chegar pela sala e de novo no histórico
+        # pedido logo depois; as do histórico têm ids menores que as já recebidas, então a comparação é por id exato
+        self._delivered_ids = {}
+        self._next_reliability_check = 0.0
+        self.outgoing = [] # ACKs e retransmissões produzidos pelo núcleo, à espera da camada de E/S
+        # Tratamento de cada tipo de mensagem de controle do servidor (dos dois protocolos); retornam a lista de eventos
+        self._control_handlers = {INCOMING: self._on_incoming, NOTIFY: self._on_notify, WELCOME: self._on_welcome}
+
+    def hello(self):
+        """Datagrama de conexão (HELLO) com as opções pedidas por este cliente."""
+        options = {}
+        if self.request_max_buff:
+            options['max_buff'] = str(self.request_max_buff)
+        if self.reliable:
+            options['reliable'] = '1'
+        if not self.text_protocol: # Dá sinal de vida quando ocioso, para o servidor não o considerar desconectado
+            options['heartbeat'] = '1'
+            options['history'] = '1' # Poder pedir as mensagens anteriores das salas
+        else: # Diferencia este cliente dos de texto anteriores ao cabeçalho nos fragmentos, que não mandam opções
+            options['framed'] = '1'
+        if self.compression: # O preferido primeiro; o cliente descomprime qualquer um dos disponíveis
+            preferred = COMPRESSION_CODECS[self.compression]
+            options['compress'] = format_compress_option([preferred] + [encoding for encoding in COMPRESSION_CODECS.values()
+                                                                        if encoding != preferred])
+        return encode_control(HELLO, self.username, options, text=self.text_protocol)
+
+    def expects_welcome(self):
+        """True se o servidor responde ao HELLO com WELCOME: sempre no protocolo binário; no de texto, só se foram pedidas
+        opções negociadas (a 'framed' sozinha não conta: servidores de texto antigos a ignoram sem responder)."""
+        return not self.text_protocol or bool(self.request_max_buff or self.reliable or self.compression)
+
+    def bye(self):
+        """Datagrama de desconexão (BYE)."""
+        return encode_control(BYE, text=self.text_protocol)
+
+    def join(self, room):
+        """Datagrama de entrada em uma sala (JOIN); levanta ValueError no protocolo de texto."""
+        packet = encode_control(JOIN, room, text=self.text_protocol)
+        self.rooms.add(room)
+        return packet
+
+    def leave(self, room):
+        """Datagrama de saída de uma sala (LEAVE); levanta ValueError no protocolo de texto."""
+        packet = encode_control(LEAVE, room, text=self.text_protocol)
+        self.rooms.discard(room)
+        return packet
+
+    def history(self, room=DEFAULT_ROOM, since_id=None):
+        """Datagrama de pedido do histórico da sala (HISTORY): as mensagens com id maior que `since_id` (por padrão, a
+        última recebida na sala; 0 pede todas as guardadas). Levanta ValueError no protocolo de texto."""
+        if since_id is None:
+            since_id = self.last_message_ids.get(room, 0)
+        return encode_control(HISTORY, room, since_id, text=self.text_protocol)
+
+    @property
+    def paced(self):
+        """True se os uploads devem respeitar o controlador de taxa na camada de E/S.
+
+        Com a entrega confiável, o próprio ReliableSender só libera pacotes quando há fichas.
+        """
+        return self.rate_controller is not None and self.reliable_sender is None
+
+    def upload(self, content_bytes, room=DEFAULT_ROOM, user=None):
+        """Prepara o upload de uma mensagem para uma sala (ou, com `user`, privada); retorna os datagramas que
+        podem sair agora.
+
+        Com compressão negociada, mensagens a partir de `compression_threshold` bytes saem comprimidas
+        (se ficarem menores).
+        """
+        message_id = next(self._message_ids) % MESSAGE_ID_MODULO
+        encoding = self.upload_encoding
+        if encoding != ENCODING_NONE:
+            if len(content_bytes) >= self.compression_threshold:
+                compressed = compress_payload(content_bytes, encoding)
+                if len(compressed) < len(content_bytes):
+                    content_bytes = compressed
+                else: # Conteúdo que não comprime (ex: já comprimido)
+                    encoding = ENCODING_NONE
+            else:
+                encoding = ENCODING_NONE
+        # Cada fragmento leva (id, índice, total), então a ordem de chegada não importa
+        fragments = build_fragments(content_bytes, message_id, fragment_payload_size(self.max_buff))
+        return self._upload(message_id, fragments, len(fragments), encoding, room, user)
+
+    def upload_stream(self, chunks, total_size, room=DEFAULT_ROOM, user=None):
+        """Prepara o upload de um conteúdo lido em blocos; os fragmentos são gerados à medida que são enviados.
+
+        O número de fragmentos vai no cabeçalho, antes da leitura, então envios em fluxo não são comprimidos.
+        """
+        payload_size = fragment_payload_size(self.max_buff)
+        message_id = next(self._message_ids) % MESSAGE_ID_MODULO
+        fragments = iter_stream_fragments(chunks, message_id, total_size, payload_size)
+        return self._upload(message_id, fragments, packet_count(total_size, payload_size), ENCODING_NONE, room, user)
+
+    def _upload(self, message_id, fragments, num_packets, encoding, room, user):
+        # Cabeçalho que informa ao servidor o início do upload da mensagem: id, número de pacotes, compressão e destino
+        target_kind, target = (TARGET_ROOM, room) if user is None else (TARGET_USER, user)
+        header_packet = encode_control(UPLOAD_START, message_id, num_packets, encoding, target_kind, target,
+                                       text=self.text_protocol)
+        if self.reliable_sender is not None: # A janela decide o que sai agora; o resto sai com os ACKs
+            self.reliable_sender.enqueue(message_id, header_packet, fragments, num_packets)
+            return self.reliable_sender.poll()
+        return itertools.chain((header_packet,), fragments)
+
+    def take_outgoing(self):
+        """Retorna (e esvazia) os datagramas que o núcleo produziu para o servidor."""
+        packets, self.outgoing = self.outgoing, []
+        return packets
+
+    def has_pending(self):
+        """True se há uploads confiáveis em trânsito (poll() precisa rodar a cada RELIABILITY_TICK)."""
+        return self.reliable_sender is not None and self.reliable_sender.has_pending()
+
+    def poll(self, now=None):
+        """Tarefas periódicas: retransmissões vencidas e heartbeats (em outgoing) e descarte de mensagens incompletas ociosas."""
+        now = time.monotonic() if now is None else now
+        if self._next_heartbeat is not None and now >= self._next_heartbeat:
+            self._next_heartbeat = now + self.heartbeat_interval
+            self.outgoing.append(encode_control(HEARTBEAT))
+        if self.reliable_sender is not None and now >= self._next_reliability_check:
+            self._next_reliability_check = now + RELIABILITY_TICK # No máximo uma vez por RELIABILITY_TICK
+            if self.reliable_sender.has_pending():
+                self.outgoing.extend(self.reliable_sender.poll(now))
+        for _, message_id in self.reassembler.expire(now):
+            if self.ack_tracker is not None:
+                self.ack_tracker.forget(message_id)
+
+    def _on_welcome(self, options):
+        """Aplica as opções aceitas pelo servidor no WELCOME."""
+        self.welcomed = True
+        self._delivered_ids.clear() # Nova sessão: um servidor reiniciado pode repetir os ids
+        if 'max_buff' in options: # Tamanho de datagrama negociado passa a valer para os próximos envios
+            try:
+                self.max_buff = int(options['max_buff'])
+            except ValueError:
+                pass
+        if self.reliable and options.get('reliable') == '1' and self.reliable_sender is None:
+            window = window_for_datagram(self.max_buff)
+            self.reliable_sender = ReliableSender(window=window, rate_controller=self.rate_controller)
+            self.ack_tracker = AckTracker(ack_every=ack_every_for_window(window))
+        if self.rate_controller is not None and self.reliable_sender is None: # Uploads sem ACKs: o AIMD não tem sinais
+            self.rate_controller.without_feedback(self.max_buff)
+        if self.compression and 'compress' in options: # Primeiro codec aceito pelo servidor (o pedido, se ele tiver)
+            accepted = parse_compress_option(options['compress'])
+            self.upload_encoding = accepted[0] if accepted else ENCODING_NONE
+        if 'heartbeat' in options and not self.text_protocol:
+            try:
+                interval = float(options['heartbeat'])
+            except ValueError:
+                interval = 0.0
+            if interval > 0:
+                self.heartbeat_interval = interval
+                self._next_heartbeat = time.monotonic() + interval
+        self.supports_history = options.get('history') == '1' and not self.text_protocol
+        return []
+
+    def next_timer_delay(self, now=None):
+        """Segundos até o próximo heartbeat (None se o servidor não os pediu): quanto a E/S ociosa pode esperar."""
+        if self._next_heartbeat is None:
+            return None
+        now = time.monotonic() if now is None else now
+        return max(0.0, self._next_heartbeat - now)
+
+    def _on_notify(self, text):
+        return [Notification(text)]
+
+    def receive(self, data):
+        """Interpreta um datagrama do servidor; retorna a lista de eventos (ChatMessage/Notification) que ele completa.
+
+        ACKs e retransmissões pedidas pelo servidor vão para `outgoing`. Datagramas inválidos levantam ValueError.
+        """
+        # Fragmentos de mensagem são identificados pelo cabeçalho binário, sem tentar decodificar
+        if is_fragment(data):
+            ack_tracker = self.ack_tracker
+            if ack_tracker is not None: # Confirma (ou pede o que falta) ao servidor
+                already_delivered = ack_tracker.is_delivered(data)
+                ack = ack_tracker.on_fragment(data)
+                if ack is not None:
+                    self.outgoing.append(ack)
+                if already_delivered: # Retransmissão tardia de mensagem já entregue
+                    return []
+            # Todos os fragmentos vêm do servidor e só trazem o id: no modo --workers, cada worker numera as
+            # mensagens em uma classe de resto própria (server_workers.py), então o id basta como chave
+            completed = self.reassembler.add_fragment(None, data)
+            return [] if completed is None else self._chat_message(*completed)
+
+        # ACKs do servidor para os uploads confiáveis deste cliente
+        if is_ack(data):
+            if self.reliable_sender is not None:
+                self.outgoing.extend(self.reliable_sender.on_ack(data))
+            return []
+
+        # Comandos e cabeçalhos: protocolo binário ou, de servidores antigos, de texto
+        if is_control(data):
+            message_type, fields = decode_control(data)
+        else:
+            try:
+                message_type, fields = decode_text_control(data.decode('utf-8'))
+            except UnicodeDecodeError:
+                raise ValueError(f"dados binários que não são fragmento nem comando (primeiros 50 bytes: {bytes(data[:50])})")
+        handler = self._control_handlers.get(message_type)
+        if handler is None:
+            raise ValueError(f"mensagem inesperada do servidor: tipo {message_type} {fields}")
+        return handler(*fields)
+
+    def _on_incoming(self, message_id, ip, port, username, timestamp, num_packets, encoding, target_kind, target):
+        """Trata o cabeçalho de uma mensagem retransmitida pelo servidor (INCOMING)."""
+        header_info = {'ip': ip, 'port': port, 'username': username, 'timestamp': format_timestamp(timestamp),
+                       'encoding': encoding, 'room': target if target_kind == TARGET_ROOM else None,
+                       'direct': target_kind == TARGET_USER, 'message_id': message_id}
+        ack_tracker = self.ack_tracker
+        if ack_tracker is not None:
+            already_delivered = ack_tracker.is_delivered_id(message_id)
+            self.outgoing.append(ack_tracker.on_header(message_id, num_packets))
+            if already_delivered: # Cabeçalho retransmitido de mensagem já entregue
+                return []
+        # Registra os metadados; se os fragmentos já chegaram, a mensagem fica completa
+        completed = self.reassembler.set_header(None, message_id, num_packets, header_info)
+        return [] if completed is None else self._chat_message(*completed)
+
+    def _chat_message(self, header_info, content):
+        """Lista com a ChatMessage completada, ou vazia se a mensagem da sala já tinha sido entregue."""
+        room, message_id = header_info['room'], header_info.get('message_id')
+        if room is not None and message_id: # Servidores de texto antigos não numeram as mensagens
+            delivered = self._delivered_ids.get(room)
+            if delivered is None:
+                delivered = self._delivered_ids[room] = (set(), deque())
+            ids, order = delivered
+            if message_id in ids:
+                return []
+            ids.add(message_id)
+            order.append(message_id)
+            if len(order) > DELIVERED_IDS_PER_ROOM:
+                ids.discard(order.popleft())
+        content = decompress_payload(content, header_info['encoding']) # ValueError se o conteúdo comprimido for inválido
+        if room is not None and message_id is not None and message_id > self.last_message_ids.get(room, 0):
+            self.last_message_ids[room] = message_id
+        return [ChatMessage(header_info['ip'], header_info['port'], header_info['username'], header_info['timestamp'], content,
+                            room, header_info['direct'], message_id)]
@@ -0,0 +1,268 @@
+# history.py
+# Histórico das salas: as últimas mensagens de cada sala, guardadas já codificadas (cabeçalho de
+# entrega e fragmentos), para o servidor reenviá-las a quem entra ou volta sem montar nada de novo.
+# A memória é limitada por sala (mensagens e bytes) e no total; opcionalmente, as mensagens que
+# saem da memória vão para um log em disco (só acréscimos), lido com mmap nos pedidos antigos.
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_right
+from collections import deque, namedtuple
+
+HISTORY_MAX_MESSAGES = 200                  # Mensagens guardadas por sala (0 desativa o histórico)
+HISTORY_MAX_BYTES = 4 * 1024 * 1024         # Bytes (pacotes codificados) guardados por sala
+HISTORY_MAX_TOTAL_BYTES = 64 * 1024 * 1024  # Bytes guardados em memória somando todas as salas
+HISTORY_LOG_MAX_BYTES = 256 * 1024 * 1024   # Tamanho máximo do log em disco (cheio, ele recomeça vazio)
+
+# Registro do log: tamanho do registro, id da mensagem, tamanho do nome da sala, número de pacotes;
+# seguem o nome da sala e cada pacote (tamanho + bytes)
+LOG_RECORD = struct.Struct("!IIBI")
+LOG_PACKET = struct.Struct("!I")
+
+
+class HistoryEntry(namedtuple('HistoryEntry', 'message_id packets size')):
+    """Mensagem guardada: id, pacotes prontos para envio (cabeçalho + fragmentos) e tamanho em bytes."""
+    __slots__ = ()
+
+
+class HistoryLog:
+    """Log de mensagens em disco, só com acréscimos, lido com mmap.
+
+    O índice (ids e posições, por sala) fica em memória em arrays compactos e é reconstruído ao
+    abrir um log existente, então o histórico sobrevive a um reinício do servidor.
+    """
+    def __init__(self, path, max_bytes=HISTORY_LOG_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.file = open(path, 'a+b')
+        self.size = self.file.seek(0, os.SEEK_END)
+        self.index = {} # {sala: (array de ids, array de posições no arquivo)}
+        self.last_message_id = 0
+        self.messages = 0
+        self._map = None # mmap do arquivo; refeito quando o arquivo cresce além dele
+        self._rebuild_index()
+
+    def _rebuild_index(self):
+        """Lê os registros de um log existente; um registro incompleto no final (queda no meio da escrita) é descartado."""
+        view = self._view()
+        offset = 0
+        while offset + LOG_RECORD.size <= self.size:
+            record_size, message_id, room_size, _ = LOG_RECORD.unpack_from(view, offset)
+            if record_size < LOG_RECORD.size + room_size or offset + record_size > self.size:
+                break
+            room = bytes(view[offset + LOG_RECORD.size : offset + LOG_RECORD.size + room_size]).decode('utf-8')
+            self._index_record(room, message_id, offset)
+            offset += record_size
+        if offset != self.size:
+            self._truncate(offset)
+
+    def _index_record(self, room, message_id, offset):
+        ids_offsets = self.index.get(room)
+        if ids_offsets is None:
+            ids_offsets = self.index[room] = (array('I'), array('Q'))
+        ids_offsets[0].append(message_id)
+        ids_offsets[1].append(offset)
+        self.last_message_id = max(self.last_message_id, message_id)
+        self.messages += 1
+
+    def _view(self):
+        """mmap (somente leitura) cobrindo o arquivo inteiro; refeito só quando o arquivo cresceu."""
+        if self._map is None or len(self._map) < self.size:
+            self._unmap()
+            self.file.flush()
+            self._map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        return self._map
+
+    def _unmap(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._map = None
+
+    def _truncate(self, size):
+        self._unmap()
+        self.file.truncate(size)
+        self.size = size
+
+    def append(self, room, message_id, packets):
+        """Acrescenta uma mensagem ao final do log (recomeçando-o vazio se ele passaria de max_bytes)."""
+        room_bytes = room.encode('utf-8')
+        record_size = LOG_RECORD.size + len(room_bytes) + sum(LOG_PACKET.size + len(packet) for packet in packets)
+        if record_size > self.max_bytes:
+            return
+        if self.size + record_size > self.max_bytes: # Log cheio: descarta de uma vez o histórico mais antigo
+            self._truncate(0)
+            self.index.clear()
+            self.messages = 0
+        parts = [LOG_RECORD.pack(record_size, message_id, len(room_bytes), len(packets)), room_bytes]
+        for packet in packets:
+            parts.append(LOG_PACKET.pack(len(packet)))
+            parts.append(packet)
+        self.file.write(b"".join(parts))
+        self._index_record(room, message_id, self.size)
+        self.size += record_size
+
+    def since(self, room, message_id):
+        """Pacotes das mensagens da sala com id maior que `message_id`, da mais antiga para a mais nova."""
+        ids_offsets = self.index.get(room)
+        if ids_offsets is None:
+            return []
+        ids, offsets = ids_offsets
+        return [self._read(offset).packets for offset in offsets[bisect_right(ids, message_id):]]
+
+    def after(self, room, message_id):
+        """A primeira mensagem da sala com id maior que `message_id` (HistoryEntry), ou None."""
+        ids_offsets = self.index.get(room)
+        if ids_offsets is None:
+            return None
+        ids, offsets = ids_offsets
+        position = bisect_right(ids, message_id)
+        return self._read(offsets[position]) if position < len(ids) else None
+
+    def ids(self, room):
+        """Ids das mensagens da sala no log, em ordem crescente."""
+        ids_offsets = self.index.get(room)
+        return ids_offsets[0] if ids_offsets is not None else ()
+
+    def _read(self, offset):
+        """Lê o registro que começa em `offset` como HistoryEntry."""
+        view = self._view()
+        _, message_id, room_size, num_packets = LOG_RECORD.unpack_from(view, offset)
+        position = offset + LOG_RECORD.size + room_size
+        packets = []
+        for _ in range(num_packets):
+            (packet_size,) = LOG_PACKET.unpack_from(view, position)
+            position += LOG_PACKET.size
+            packets.append(view[position : position + packet_size]) # Cópia: o mmap pode ser refeito depois
+            position += packet_size
+        return HistoryEntry(message_id, packets, sum(map(len, packets)))
+
+    def close(self):
+        self._unmap()
+        self.file.close()
+
+
+class MessageHistory:
+    """Histórico em memória das salas (anel por sala), com limite de mensagens e de bytes.
+
+    Guardar uma mensagem custa O(1) amortizado; um pedido de histórico percorre só as mensagens
+    devolvidas. As mensagens que saem do anel vão para o HistoryLog, se houver.
+    """
+    def __init__(self, max_messages=HISTORY_MAX_MESSAGES, max_bytes=HISTORY_MAX_BYTES, max_total_bytes=HISTORY_MAX_TOTAL_BYTES,
+                 log_path=None, log_max_bytes=HISTORY_LOG_MAX_BYTES):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.rooms = {} # {sala: deque de HistoryEntry, da mais antiga para a mais nova}
+        self.room_bytes = {} # {sala: bytes guardados}
+        self.total_bytes = 0
+        self.messages = 0
+        self.order = deque() # (sala, id) na ordem de chegada, para o limite total (com entradas já descartadas)
+        self.evicted = 0
+        self.log = HistoryLog(log_path, log_max_bytes) if log_path else None
+
+    @property
+    def last_message_id(self):
+        """Maior id guardado no log (0 sem log): o servidor continua a numeração a partir dele."""
+        return self.log.last_message_id if self.log is not None else 0
+
+    def add(self, room, message_id, packets):
+        """Guarda os pacotes de uma mensagem da sala, descartando as mais antigas se passar dos limites."""
+        entry = HistoryEntry(message_id, packets, sum(map(len, packets)))
+        entries = self.rooms.get(room)
+        if entries is None:
+            entries = self.rooms[room] = deque()
+            self.room_bytes[room] = 0
+        entries.append(entry)
+        self.room_bytes[room] += entry.size
+        self.total_bytes += entry.size
+        self.messages += 1
+        self.order.append((room, message_id))
+        # Uma mensagem maior que o limite da sala sai logo em seguida, depois das mais antigas (a ordem do log se mantém)
+        while room in self.rooms and (len(entries) > self.max_messages or self.room_bytes[room] > self.max_bytes):
+            self._evict(room)
+        while self.total_bytes > self.max_total_bytes and self.order:
+            oldest_room, oldest_id = self.order.popleft()
+            oldest = self.rooms.get(oldest_room)
+            if oldest and oldest[0].message_id == oldest_id:
+                self._evict(oldest_room)
+        if len(self.order) > 2 * self.messages + 64: # Muitas entradas já descartadas pelos limites das salas
+            self.order = deque(key for key in self.order if self._contains(*key))
+
+    def _contains(self, room, message_id):
+        entries = self.rooms.get(room)
+        return bool(entries) and entries[0].message_id <= message_id
+
+    def _evict(self, room):
+        """Tira a mensagem mais antiga da sala da memória (para o log, se houver)."""
+        entries = self.rooms[room]
+        entry = entries.popleft()
+        self.room_bytes[room] -= entry.size
+        self.total_bytes -= entry.size
+        self.messages -= 1
+        self.evicted += 1
+        if self.log is not None:
+            self.log.append(room, entry.message_id, entry.packets)
+        if not entries:
+            del self.rooms[room]
+            del self.room_bytes[room]
+
+    def since(self, room, message_id=0):
+        """Pacotes das mensagens da sala com id maior que `message_id` (do log e da memória), da mais antiga para a mais nova."""
+        messages = self.log.since(room, message_id) if self.log is not None else []
+        recent = []
+        for entry in reversed(self.rooms.get(room, ())): # Os pedidos costumam ser das últimas mensagens
+            if entry.message_id <= message_id:
+                break
+            recent.append(entry.packets)
+        recent.reverse()
+        return messages + recent
+
+    def after(self, room, message_id):
+        """A primeira mensagem da sala com id maior que `message_id` (HistoryEntry, do log ou da memória), ou None.
+
+        Um reenvio longo pede uma mensagem de cada vez, a partir da última enviada: nada fica copiado à espera,
+        e as mensagens que saem da memória para o log nesse meio tempo continuam sendo encontradas.
+        """
+        if self.log is not None: # O log só tem mensagens mais antigas que as da memória
+            entry = self.log.after(room, message_id)
+            if entry is not None:
+                return entry
+        for entry in self.rooms.get(room, ()):
+            if entry.message_id > message_id:
+                return entry
+        return None
+
+    def last_id(self, room):
+        """Id da mensagem mais recente da sala (0 se não há nenhuma)."""
+        entries = self.rooms.get(room)
+        if entries:
+            return entries[-1].message_id
+        ids = self.log.ids(room) if self.log is not None else ()
+        return ids[-1] if ids else 0
+
+    def replay_start(self, room, message_id, max_messages):
+        """Id a partir do qual (exclusive) um pedido desde `message_id` traz no máximo as `max_messages` mais recentes."""
+        entries = self.rooms.get(room, ())
+        if max_messages < len(entries):
+            return max(message_id, entries[len(entries) - max_messages - 1].message_id)
+        ids = self.log.ids(room) if self.log is not None else ()
+        from_log = max_messages - len(entries) # Quantas das mais recentes do log ainda cabem
+        if from_log < len(ids):
+            return max(message_id, ids[len(ids) - from_log - 1])
+        return message_id
+
+    def stats(self):
+        stats = {'rooms': len(self.rooms), 'messages': self.messages, 'bytes': self.total_bytes, 'evicted': self.evicted}
+        if self.log is not None:
+            stats['log_messages'] = self.log.messages
+            stats['log_bytes'] = self.log.size
+        return stats
+
+    def close(self):
+        """Fecha o log, gravando antes nele o que está em memória (o histórico sobrevive ao reinício)."""
+        if self.log is not None:
+            for room in list(self.rooms):
+                while room in self.rooms:
+                    self._evict(room)
+            self.log.close()
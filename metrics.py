@@ -0,0 +1,254 @@
+# metrics.py
+# Instrumentação do servidor: contadores, histogramas de latência e um perfil amostral opcional.
+#
+# As métricas são atualizadas pela mesma thread (ou loop de eventos) que atende os datagramas,
+# então não usam locks; no modo --workers cada processo tem as suas. Os histogramas seguem a
+# ideia do HdrHistogram: buckets log-lineares (2^HISTOGRAM_SUB_BUCKET_BITS por potência de 2),
+# com erro relativo limitado, memória pequena e registro O(1) só com operações inteiras.
+import socket as skt
+import time
+
+HISTOGRAM_SUB_BUCKET_BITS = 5        # 32 buckets por potência de 2: erro relativo de no máximo ~3%
+SUMMARY_PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+PROFILE_SAMPLE_EVERY = 100           # O perfil amostral grava 1 de cada N medições de cada trecho
+STATS_QUERY_TIMEOUT = 2.0            # Segundos esperando a resposta de um CMD:STATS
+
+# Contadores do servidor: (atributo, nome Prometheus, descrição)
+COUNTERS = (
+    ('packets_in', 'packets_received_total', "Datagramas recebidos"),
+    ('bytes_in', 'bytes_received_total', "Bytes recebidos"),
+    ('packets_out', 'packets_sent_total', "Datagramas enviados"),
+    ('bytes_out', 'bytes_sent_total', "Bytes enviados"),
+    ('messages_relayed', 'messages_relayed_total', "Mensagens remontadas e retransmitidas para a sala"),
+    ('messages_compressed', 'messages_compressed_total', "Mensagens retransmitidas que chegaram comprimidas"),
+    ('messages_decompressed', 'messages_decompressed_total', "Mensagens comprimidas que o servidor precisou descomprimir"),
+    ('send_errors', 'send_errors_total', "Erros ao enviar para clientes"),
+    ('dropped_packets', 'dropped_packets_total', "Pacotes descartados por fila de envio cheia"),
+    ('slow_consumers_disconnected', 'slow_consumers_disconnected_total', "Clientes desconectados por fila de envio cheia"),
+    ('clients_expired', 'clients_expired_total', "Clientes removidos por falta de sinal de vida (heartbeat)"),
+    ('history_messages_replayed', 'history_messages_replayed_total', "Mensagens reenviadas a partir do histórico das salas"),
+)
+
+# Trechos cronometrados: (nome, descrição)
+TIMED_SECTIONS = (
+    ('handle', "Tratamento de um datagrama recebido (handle_client_message)"),
+    ('fanout', "Retransmissão de uma mensagem para toda a sala"),
+    ('broadcast', "Envio de uma notificação para toda a sala (broadcast_to_clients)"),
+    ('send_file', "Envio de uma mensagem para um destinatário (send_file_content_to_client)"),
+    ('timers', "Tarefas periódicas (retransmissões, pacing e expiração de uploads e de clientes)"),
+    ('flush', "Envio de um lote de datagramas enfileirados (E/S em lote)"),
+)
+
+
+class LatencyHistogram:
+    """Histograma log-linear de inteiros (ex: microssegundos), no estilo do HdrHistogram.
+
+    Valores até 2 x 2^sub_bucket_bits são exatos; acima disso, cada potência de 2 é dividida em
+    2^sub_bucket_bits buckets, então os percentis têm erro relativo de no máximo 1/2^sub_bucket_bits.
+    """
+    def __init__(self, sub_bucket_bits=HISTOGRAM_SUB_BUCKET_BITS):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.linear_limit = 2 << sub_bucket_bits # Abaixo disso, um bucket por valor
+        self.counts = [0] * self.linear_limit # Cresce conforme aparecem valores maiores
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def _index(self, value):
+        if value < self.linear_limit:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits - 1
+        return (shift << self.sub_bucket_bits) + (value >> shift)
+
+    def _highest_equivalent(self, index):
+        """Maior valor que cai no bucket `index`."""
+        if index < self.linear_limit:
+            return index
+        shift = (index >> self.sub_bucket_bits) - 1
+        return ((index - (shift << self.sub_bucket_bits) + 1) << shift) - 1
+
+    def record(self, value):
+        """Registra um valor inteiro não negativo."""
+        index = self._index(value)
+        counts = self.counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """Valor abaixo do qual estão `percent`% das medições (0 se não houver nenhuma)."""
+        if not self.count:
+            return 0
+        target = max(1, -(-self.count * percent // 100)) # Arredonda para cima
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return min(self._highest_equivalent(index), self.max)
+        return self.max
+
+    def summary(self):
+        """Resumo do histograma: contagem, soma, média, percentis e máximo."""
+        summary = {'count': self.count, 'sum': self.total,
+                   'mean': round(self.total / self.count, 1) if self.count else 0.0}
+        for percent in SUMMARY_PERCENTILES:
+            summary[f"p{percent:g}"] = self.percentile(percent)
+        summary['max'] = self.max
+        return summary
+
+
+class SamplingProfiler:
+    """Grava em arquivo 1 de cada `every` medições de cada trecho cronometrado.
+
+    Cada linha tem 'timestamp trecho microssegundos', fácil de agregar depois (ex: com awk).
+    """
+    def __init__(self, path, every=PROFILE_SAMPLE_EVERY):
+        self.file = open(path, 'a', encoding='utf-8')
+        self.every = every
+        self.seen = {} # {trecho: medições vistas}
+
+    def sample(self, section, elapsed_us):
+        seen = self.seen.get(section, 0) + 1
+        self.seen[section] = seen
+        if seen % self.every == 0:
+            self.file.write(f"{time.time():.6f} {section} {elapsed_us}\n")
+
+    def close(self):
+        self.file.close()
+
+
+class ServerMetrics:
+    """Contadores e histogramas de latência (em microssegundos) de um servidor."""
+    def __init__(self, profile_path=None):
+        self.started = time.monotonic()
+        for attribute, _, _ in COUNTERS:
+            setattr(self, attribute, 0)
+        self.latency = {section: LatencyHistogram() for section, _ in TIMED_SECTIONS}
+        self.peer_send_errors = {} # {(ip, port): erros de envio} dos clientes conectados
+        self.peer_dropped_packets = {} # {(ip, port): pacotes descartados por fila cheia} dos clientes conectados
+        # Gancho opcional: qualquer objeto com sample(trecho, microssegundos)
+        self.profiler = SamplingProfiler(profile_path) if profile_path else None
+
+    def observe(self, section, start_ns):
+        """Registra o tempo decorrido desde `start_ns` (de time.perf_counter_ns) no histograma do trecho."""
+        elapsed_us = (time.perf_counter_ns() - start_ns) // 1000
+        self.latency[section].record(elapsed_us)
+        if self.profiler is not None:
+            self.profiler.sample(section, elapsed_us)
+
+    def record_send_error(self, client_address):
+        """Conta um erro de envio para um cliente."""
+        self.send_errors += 1
+        self.peer_send_errors[client_address] = self.peer_send_errors.get(client_address, 0) + 1
+
+    def record_drop(self, client_address, packets):
+        """Conta pacotes descartados por fila de envio cheia de um cliente."""
+        self.dropped_packets += packets
+        self.peer_dropped_packets[client_address] = self.peer_dropped_packets.get(client_address, 0) + packets
+
+    def forget_peer(self, client_address):
+        """Descarta os contadores de um cliente que saiu."""
+        self.peer_send_errors.pop(client_address, None)
+        self.peer_dropped_packets.pop(client_address, None)
+
+    def snapshot(self):
+        """Valores atuais: contadores, médias por segundo desde o início e resumo das latências."""
+        uptime = time.monotonic() - self.started
+        counters = {attribute: getattr(self, attribute) for attribute, _, _ in COUNTERS}
+        return {
+            'uptime_seconds': round(uptime, 3),
+            'counters': counters,
+            'rates_per_second': {attribute: round(value / uptime, 1) if uptime > 0 else 0.0
+                                 for attribute, value in counters.items()},
+            'latency_us': {section: histogram.summary() for section, histogram in self.latency.items()},
+        }
+
+    def close(self):
+        if self.profiler is not None:
+            self.profiler.close()
+
+
+def _prometheus_metric(lines, name, metric_type, help_text, samples):
+    """Acrescenta uma métrica no formato texto do Prometheus; `samples` é uma lista de (sufixo+rótulos, valor)."""
+    lines.append(f"# HELP chat_{name} {help_text}.")
+    lines.append(f"# TYPE chat_{name} {metric_type}")
+    for suffix, value in samples:
+        lines.append(f"chat_{name}{suffix} {value}")
+
+
+def format_prometheus(stats, include_peers=True):
+    """Converte o resultado de UDPServer.stats() para o formato texto do Prometheus."""
+    lines = []
+    metrics = stats['metrics']
+    _prometheus_metric(lines, 'uptime_seconds', 'gauge', "Segundos desde o início do servidor", [("", metrics['uptime_seconds'])])
+    _prometheus_metric(lines, 'clients', 'gauge', "Clientes conectados", [("", stats['clients'])])
+    _prometheus_metric(lines, 'rooms', 'gauge', "Salas com pelo menos um membro", [("", stats['rooms'])])
+    for attribute, name, help_text in COUNTERS:
+        _prometheus_metric(lines, name, 'counter', help_text, [("", metrics['counters'][attribute])])
+
+    reassembly = stats['reassembly']
+    _prometheus_metric(lines, 'reassembly_messages', 'gauge', "Uploads incompletos em remontagem", [("", reassembly['messages'])])
+    _prometheus_metric(lines, 'reassembly_buffered_bytes', 'gauge', "Bytes reservados pela remontagem", [("", reassembly['buffered_bytes'])])
+    _prometheus_metric(lines, 'reassembly_evicted_total', 'counter', "Uploads descartados por inatividade", [("", reassembly['evicted'])])
+    _prometheus_metric(lines, 'reassembly_rejected_total', 'counter', "Uploads recusados por limite de memória", [("", reassembly['rejected'])])
+
+    history = stats.get('history')
+    if history is not None:
+        _prometheus_metric(lines, 'history_messages', 'gauge', "Mensagens do histórico guardadas em memória", [("", history['messages'])])
+        _prometheus_metric(lines, 'history_bytes', 'gauge', "Bytes do histórico guardados em memória", [("", history['bytes'])])
+        _prometheus_metric(lines, 'history_evicted_total', 'counter', "Mensagens que saíram da memória do histórico",
+                           [("", history['evicted'])])
+        if 'log_bytes' in history:
+            _prometheus_metric(lines, 'history_log_bytes', 'gauge', "Tamanho do log do histórico em disco", [("", history['log_bytes'])])
+
+    for section, help_text in TIMED_SECTIONS: # Latências como summary (segundos)
+        summary = metrics['latency_us'][section]
+        samples = [(f'{{quantile="{percent / 100:g}"}}', summary[f"p{percent:g}"] / 1e6) for percent in SUMMARY_PERCENTILES]
+        samples += [("_sum", summary['sum'] / 1e6), ("_count", summary['count'])]
+        _prometheus_metric(lines, f"{section}_latency_seconds", 'summary', help_text, samples)
+
+    if include_peers:
+        peers = stats['peers']
+        _prometheus_metric(lines, 'peer_queued_packets', 'gauge', "Pacotes na fila de envio de cada cliente",
+                           [(f'{{peer="{peer}"}}', info['queued_packets']) for peer, info in peers.items()])
+        _prometheus_metric(lines, 'peer_send_errors_total', 'counter', "Erros de envio de cada cliente",
+                           [(f'{{peer="{peer}"}}', info['send_errors']) for peer, info in peers.items()])
+        _prometheus_metric(lines, 'peer_dropped_packets_total', 'counter', "Pacotes de cada cliente descartados por fila cheia",
+                           [(f'{{peer="{peer}"}}', info['dropped_packets']) for peer, info in peers.items()])
+        _prometheus_metric(lines, 'peer_idle_seconds', 'gauge', "Segundos desde o último datagrama de cada cliente com heartbeat",
+                           [(f'{{peer="{peer}"}}', info['idle_seconds']) for peer, info in peers.items()
+                            if info.get('idle_seconds') is not None])
+    return "\n".join(lines) + "\n"
+
+
+def query_stats(host, port, prometheus=False, timeout=STATS_QUERY_TIMEOUT):
+    """Pede as métricas a um servidor local com CMD:STATS; retorna o texto Prometheus ou o dicionário."""
+    import json # Só a consulta usa JSON; o servidor não paga a importação ao iniciar
+    with skt.socket(skt.AF_INET, skt.SOCK_DGRAM) as sckt:
+        sckt.settimeout(timeout)
+        sckt.sendto(b"CMD:STATS:prometheus" if prometheus else b"CMD:STATS", (host, port))
+        while True:
+            data, _ = sckt.recvfrom(65535)
+            if data.startswith(b"CMD:STATS\n"):
+                body = data[len(b"CMD:STATS\n"):].decode('utf-8')
+                return body if prometheus else json.loads(body)
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    from chat_config import env_default
+    parser = argparse.ArgumentParser(description="Consulta as métricas de um servidor de chat local (CMD:STATS).")
+    parser.add_argument('--host', default='127.0.0.1', help="Endereço do servidor (precisa ser local)")
+    parser.add_argument('--port', type=int, default=env_default('PORT', 7070), help="Porta do servidor (ambiente: CHAT_PORT)")
+    parser.add_argument('--prometheus', action='store_true', help="Formato texto do Prometheus em vez de JSON")
+    args = parser.parse_args()
+    try:
+        result = query_stats(args.host, args.port, args.prometheus)
+    except skt.timeout:
+        raise SystemExit(f"Sem resposta de {args.host}:{args.port} (o servidor só responde a clientes locais).")
+    print(result if args.prometheus else json.dumps(result, indent=2, ensure_ascii=False), end="" if args.prometheus else "\n")
@@ -0,0 +1,173 @@
+# pacing.py
+# Controle de taxa (pacing) por destinatário, no lugar da pausa fixa de 1 ms por pacote.
+#
+# Cada controlador é um token bucket cuja taxa (pacotes/s) pode ser fixa ou ajustada por
+# AIMD: aumento aditivo a cada RTT sem perdas e redução multiplicativa quando a camada
+# confiável detecta perda (retransmissão) ou quando o RTT suavizado fica bem acima do mínimo
+# medido (fila se formando no caminho). Sem a entrega confiável não há sinais de perda/RTT: para esses
+# destinatários o AIMD vira uma taxa fixa derivada do tamanho dos datagramas (FEEDBACKLESS_BYTE_RATE),
+# que só evita as rajadas que estouram buffers, em vez de ficar preso na taxa inicial.
+import math
+import time
+
+DEFAULT_INITIAL_RATE = 2000.0   # Pacotes/s iniciais do AIMD (o dobro do antigo limite de ~1000 pacotes/s)
+DEFAULT_MIN_RATE = 100.0
+DEFAULT_MAX_RATE = 200000.0
+DEFAULT_INCREASE = 500.0        # Pacotes/s somados a cada RTT sem perdas
+DEFAULT_DECREASE = 0.5          # Fator aplicado à taxa em caso de perda
+DELAY_DECREASE = 0.85           # Fator aplicado quando o RTT indica fila crescendo
+QUEUE_DELAY_THRESHOLD = 0.05    # RTT suavizado acima do mínimo por mais que isso (s) indica fila
+MIN_ADJUST_INTERVAL = 0.01      # Intervalo mínimo entre ajustes da taxa, mesmo com RTT menor (ex: loopback)
+BURST_SECONDS = 0.02            # O bucket acumula no máximo ~20 ms de pacotes (rajada)
+MIN_BURST = 16
+# Teto da rajada, qualquer que seja a taxa: a 20000 pacotes/s, 20 ms seriam 400 pacotes de uma vez, mais do que
+# cabe no buffer de recepção padrão de um socket UDP (~200 KB no Linux, ~90 datagramas de 1 KB)
+MAX_BURST = 64
+DEFAULT_PACING = "aimd"         # Configuração usada quando a linha de comando não escolhe outra
+# Taxa (bytes/s) do AIMD para destinatários sem entrega confiável. No loopback, um receptor em Python entrega
+# 100% das mensagens até ~10 MB/s; acima disso ele não acompanha e o kernel descarta o que não cabe no buffer
+# (benchmarks/bench_loss.py: 94% a 16 MB/s, 52% a 32 MB/s). Quem precisa de mais vazão sem a entrega confiável
+# pode usar --pacing fixed:<pps> ou none, aceitando as perdas.
+FEEDBACKLESS_BYTE_RATE = 10 * 1024 * 1024
+
+
+class RateController:
+    """Token bucket com taxa fixa; base para os controladores adaptativos."""
+    name = "fixed"
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.tokens = self._burst()
+        self.last_refill = time.monotonic()
+
+    def _burst(self):
+        return min(MAX_BURST, max(MIN_BURST, self.rate * BURST_SECONDS))
+
+    def _refill(self, now):
+        if now > self.last_refill:
+            self.tokens = min(self._burst(), self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+
+    def try_send(self, now):
+        """Consome uma ficha se houver; retorna False se o pacote deve esperar."""
+        self._refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def reserve(self, now):
+        """Consome uma ficha (podendo ficar devendo) e retorna quantos segundos esperar antes de enviar."""
+        self._refill(now)
+        self.tokens -= 1.0
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def wait_time(self, now):
+        """Segundos até haver uma ficha disponível."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / self.rate
+
+    def without_feedback(self, datagram_size):
+        """O destinatário não usa a entrega confiável, então nenhum sinal de perda ou RTT virá (a taxa fixa não muda)."""
+
+    # Sinais da camada confiável (ignorados pela taxa fixa)
+    def on_ack(self, packets, now):
+        pass
+
+    def on_loss(self, now):
+        pass
+
+    def on_rtt(self, rtt, now):
+        pass
+
+
+class AimdRateController(RateController):
+    """Taxa ajustada por AIMD a partir dos sinais de perda e RTT da camada confiável."""
+    name = "aimd"
+
+    def __init__(self, initial_rate=DEFAULT_INITIAL_RATE, min_rate=DEFAULT_MIN_RATE, max_rate=DEFAULT_MAX_RATE,
+                 increase=DEFAULT_INCREASE, decrease=DEFAULT_DECREASE):
+        super().__init__(initial_rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.srtt = None
+        self.min_rtt = None
+        self.last_increase = self.last_decrease = time.monotonic()
+
+    def _round_trip(self):
+        return max(self.srtt, MIN_ADJUST_INTERVAL) if self.srtt is not None else 0.1
+
+    def without_feedback(self, datagram_size):
+        """Sem sinais, o AIMD ficaria para sempre na taxa inicial: passa à taxa de FEEDBACKLESS_BYTE_RATE bytes/s
+        para datagramas de `datagram_size` bytes (dentro dos limites configurados)."""
+        self.rate = min(self.max_rate, max(self.min_rate, FEEDBACKLESS_BYTE_RATE / datagram_size))
+        self.tokens = min(self.tokens, self._burst())
+
+    def on_ack(self, packets, now):
+        """Aumento aditivo: no máximo uma vez por RTT."""
+        if now - self.last_increase >= self._round_trip():
+            self.rate = min(self.max_rate, self.rate + self.increase)
+            self.last_increase = now
+
+    def _decrease(self, factor, now):
+        """Redução multiplicativa: no máximo uma vez por RTT (uma rajada de perdas conta como um evento)."""
+        if now - self.last_decrease >= self._round_trip():
+            self.rate = max(self.min_rate, self.rate * factor)
+            self.tokens = min(self.tokens, self._burst())
+            self.last_decrease = self.last_increase = now
+
+    def on_loss(self, now):
+        self._decrease(self.decrease, now)
+
+    def on_rtt(self, rtt, now):
+        self.srtt = rtt if self.srtt is None else 0.875 * self.srtt + 0.125 * rtt
+        self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+        if self.srtt > self.min_rtt + QUEUE_DELAY_THRESHOLD: # Atraso bem acima do mínimo: fila se formando
+            self._decrease(DELAY_DECREASE, now)
+
+
+def _parse_rate(text, spec):
+    """Converte uma taxa da configuração de pacing; precisa ser um número finito e positivo."""
+    try:
+        rate = float(text)
+    except ValueError:
+        rate = math.nan
+    if not 0 < rate < math.inf: # Também rejeita nan
+        raise ValueError(f"Taxa de pacing inválida em '{spec}': '{text}' (use um número de pacotes/s maior que zero)")
+    return rate
+
+
+def parse_pacing(spec):
+    """Interpreta a configuração de pacing e retorna uma fábrica de controladores (ou None para desligar).
+
+    Formatos aceitos: 'none', 'fixed:<pacotes/s>', 'aimd' ou 'aimd:<inicial>:<máxima>'. Taxas que não
+    são números positivos, ou uma taxa inicial acima da máxima, levantam ValueError.
+    """
+    if spec is None or spec == "none":
+        return None
+    name, _, args = spec.partition(":")
+    values = [_parse_rate(v, spec) for v in args.split(":")] if args else []
+    if name == "fixed" and len(values) == 1:
+        return lambda: RateController(values[0])
+    if name == "aimd" and len(values) in (0, 2):
+        if values:
+            initial_rate, max_rate = values
+            if initial_rate > max_rate:
+                raise ValueError(f"Configuração de pacing inválida: '{spec}' (a taxa inicial passa da máxima)")
+            # O piso padrão fica acima de taxas baixas (ex: aimd:50:80); a redução levaria a taxa acima da máxima
+            return lambda: AimdRateController(initial_rate=initial_rate, min_rate=min(DEFAULT_MIN_RATE, initial_rate),
+                                              max_rate=max_rate)
+        return AimdRateController
+    raise ValueError(f"Configuração de pacing inválida: '{spec}' (use none, fixed:<pps>, aimd ou aimd:<inicial>:<máxima>)")
+
+
+def pacing_argument(spec):
+    """`type` do argparse para --pacing: valida a configuração na leitura da linha de comando e a devolve como texto."""
+    import argparse
+    try:
+        parse_pacing(spec)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from None
+    return spec
@@ -0,0 +1,339 @@
+# reliability.py
+# Camada opcional de entrega confiável (repetição seletiva) sobre os fragmentos do chat_protocol.
+#
+# O remetente mantém uma janela deslizante de fragmentos não confirmados e retransmite por
+# timeout (RTO adaptativo, calculado a partir do RTT medido) ou imediatamente quando o
+# destinatário pede (NACK). O destinatário responde com pacotes ACK contendo:
+#   - se o cabeçalho de texto da mensagem já chegou;
+#   - quantos fragmentos consecutivos (a partir do 0) já chegaram (ACK cumulativo);
+#   - até onde já recebeu algo e quais índices estão faltando nesse intervalo (NACKs seletivos).
+import struct
+import time
+from collections import OrderedDict
+
+from chat_protocol import FRAGMENT_HEADER
+
+# Pacote de ACK: marcador 0xFD (inválido em UTF-8), id da mensagem, flags, ACK cumulativo,
+# limite superior recebido e quantidade de NACKs; seguido de um u32 por índice faltante.
+ACK_MARKER = 0xFD
+ACK_HEADER = struct.Struct("!BIBIIH")
+ACK_HEADER_SIZE = ACK_HEADER.size
+ACK_FLAG_HEADER = 0x01 # O cabeçalho de texto da mensagem já foi recebido
+MAX_NACKS_PER_ACK = 64
+
+HEADER_SEQ = -1 # Índice usado internamente para o cabeçalho de texto da mensagem
+
+DEFAULT_WINDOW = 64          # Fragmentos em trânsito (não confirmados) por destinatário
+WINDOW_BYTES = 128 * 1024    # Limite em bytes da janela: cabe no buffer de recepção padrão do Linux (~208 KB)
+ACK_EVERY = 8                # O destinatário confirma a cada N fragmentos novos (ou antes, se houver buraco)
+MIN_RTO = 0.02               # Limites do timeout de retransmissão, em segundos
+MAX_RTO = 2.0
+INITIAL_RTO = 0.2
+MAX_RETRIES = 8              # Tentativas por pacote antes de desistir da mensagem
+RELIABILITY_TICK = 0.01      # Intervalo com que os servidores/clientes verificam timeouts
+
+
+def window_for_datagram(max_buff):
+    """Tamanho da janela (em pacotes) para datagramas de `max_buff` bytes, respeitando WINDOW_BYTES."""
+    return max(2, min(DEFAULT_WINDOW, WINDOW_BYTES // max_buff))
+
+
+def ack_every_for_window(window):
+    """Frequência de ACKs do destinatário: ao menos duas vezes por janela, para o remetente nunca ficar parado esperando."""
+    return min(ACK_EVERY, max(1, window // 2))
+
+
+def is_ack(data):
+    """Indica se o datagrama é um pacote de ACK da camada confiável."""
+    return len(data) >= ACK_HEADER_SIZE and data[0] == ACK_MARKER
+
+
+def encode_ack(message_id, header_received, cumulative, upto, nacks):
+    """Monta um pacote de ACK (os NACKs são limitados a MAX_NACKS_PER_ACK)."""
+    nacks = nacks[:MAX_NACKS_PER_ACK]
+    flags = ACK_FLAG_HEADER if header_received else 0
+    return ACK_HEADER.pack(ACK_MARKER, message_id, flags, cumulative, upto, len(nacks)) + struct.pack(f"!{len(nacks)}I", *nacks)
+
+
+def decode_ack(data):
+    """Decodifica um pacote de ACK em (message_id, header_received, cumulative, upto, nacks)."""
+    _, message_id, flags, cumulative, upto, nack_count = ACK_HEADER.unpack_from(data)
+    nacks = struct.unpack_from(f"!{nack_count}I", data, ACK_HEADER_SIZE)
+    return message_id, bool(flags & ACK_FLAG_HEADER), cumulative, upto, nacks
+
+
+class RttEstimator:
+    """Estimativa de RTT e do timeout de retransmissão (RTO) no estilo da RFC 6298."""
+    def __init__(self, initial_rto=INITIAL_RTO, min_rto=MIN_RTO, max_rto=MAX_RTO):
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+
+    def sample(self, rtt):
+        """Incorpora uma nova medida de RTT (em segundos)."""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(self.max_rto, max(self.min_rto, self.srtt + 4 * self.rttvar))
+
+
+class ReliableSender:
+    """Envio com janela deslizante e repetição seletiva para um único destinatário.
+
+    Não faz I/O: os métodos devolvem as listas de datagramas que devem ser enviados agora.
+    Se houver um controlador de taxa (pacing.RateController), os pacotes novos só são liberados
+    quando ele tem fichas (assim o timer de cada pacote começa quando ele realmente sai) e ele
+    recebe os sinais de confirmação, perda (retransmissões) e RTT medidos aqui.
+    """
+    def __init__(self, window=DEFAULT_WINDOW, max_retries=MAX_RETRIES, rate_controller=None):
+        self.window = window
+        self.max_retries = max_retries
+        self.rtt = RttEstimator()
+        self.rate_controller = rate_controller
+        # {message_id: {'header': bytes, 'source': iterador de fragmentos, 'unacked': {seq: pacote}, 'total': N,
+        #               'acked': bytearray, 'base': N, 'pending': N, 'header_acked': bool, 'next_seq': N}}
+        self.messages = OrderedDict()
+        self.inflight = {} # {(message_id, seq): [enviado_em, tentativas]}
+        self.completed = 0 # Mensagens totalmente confirmadas
+        self.failed = 0 # Mensagens abandonadas após MAX_RETRIES
+        self.retransmissions = 0
+
+    def enqueue(self, message_id, header_packet, fragments, total):
+        """Adiciona uma mensagem (cabeçalho de texto + `total` fragmentos já enquadrados) à fila de envio.
+
+        `fragments` pode ser uma lista ou um iterador: os fragmentos só são gerados quando cabem
+        na janela e são liberados assim que confirmados, então a memória usada fica limitada à janela.
+        Uma mensagem com o id de outra ainda pendente (ex: a mesma mensagem vinda da sala e do histórico)
+        é ignorada: substituí-la perderia os pacotes em trânsito da primeira. Retorna False nesse caso.
+        """
+        if message_id in self.messages:
+            return False
+        self.messages[message_id] = {
+            'header': header_packet,
+            'source': iter(fragments),
+            'unacked': {}, # Fragmentos enviados e ainda não confirmados (para retransmissão)
+            'total': total,
+            'acked': bytearray(total),
+            'base': 0, # Primeiro índice ainda não confirmado
+            'pending': total,
+            'header_acked': False,
+            'next_seq': HEADER_SEQ, # O cabeçalho é o primeiro "pacote" da mensagem
+        }
+        return True
+
+    def has_pending(self):
+        return bool(self.messages)
+
+    def next_deadline(self):
+        """Instante em que o próximo timeout de retransmissão vence (None se não houver nada em trânsito)."""
+        if not self.inflight:
+            return None
+        rto = self.rtt.rto
+        return min(sent_at + rto * (2 ** retries) for sent_at, retries in self.inflight.values())
+
+    def _packet(self, message_id, seq):
+        state = self.messages[message_id]
+        return state['header'] if seq == HEADER_SEQ else state['unacked'][seq]
+
+    def poll(self, now=None):
+        """Retorna os pacotes a enviar agora: retransmissões vencidas e novos pacotes que cabem na janela."""
+        now = time.monotonic() if now is None else now
+        packets = []
+        rto = self.rtt.rto
+        rate_controller = self.rate_controller
+
+        # Retransmissões por timeout (com backoff exponencial por pacote)
+        for key, entry in list(self.inflight.items()):
+            if key not in self.inflight: # Mensagem abandonada neste mesmo laço
+                continue
+            sent_at, retries = entry
+            if now - sent_at < rto * (2 ** retries):
+                continue
+            if retries >= self.max_retries: # Desiste da mensagem inteira
+                self._drop_message(key[0])
+                self.failed += 1
+                continue
+            entry[0] = now
+            entry[1] = retries + 1
+            self.retransmissions += 1
+            if rate_controller is not None:
+                rate_controller.on_loss(now)
+                rate_controller.reserve(now) # Retransmissões também contam na taxa
+            packets.append(self._packet(*key))
+
+        # Pacotes novos, em ordem, enquanto houver espaço na janela (e fichas no controlador de taxa)
+        exhausted = []
+        paced_out = False
+        for message_id, state in self.messages.items():
+            while len(self.inflight) < self.window and state['next_seq'] < state['total']:
+                if rate_controller is not None and not rate_controller.try_send(now):
+                    paced_out = True
+                    break
+                seq = state['next_seq']
+                if seq != HEADER_SEQ:
+                    fragment = next(state['source'], None)
+                    if fragment is None: # A fonte terminou antes do total anunciado
+                        exhausted.append(message_id)
+                        break
+                    state['unacked'][seq] = fragment
+                state['next_seq'] += 1
+                self.inflight[(message_id, seq)] = [now, 0]
+                packets.append(self._packet(message_id, seq))
+            if paced_out or len(self.inflight) >= self.window:
+                break
+        for message_id in exhausted:
+            self._drop_message(message_id)
+            self.failed += 1
+        return packets
+
+    def _drop_message(self, message_id):
+        """Remove uma mensagem e todos os seus pacotes em trânsito."""
+        state = self.messages.pop(message_id, None)
+        if state is None:
+            return
+        self.inflight.pop((message_id, HEADER_SEQ), None)
+        for seq in state['unacked']:
+            self.inflight.pop((message_id, seq), None)
+
+    def _acknowledge(self, message_id, seq, now):
+        """Marca um pacote como confirmado, usando-o como amostra de RTT se não foi retransmitido (Karn)."""
+        entry = self.inflight.pop((message_id, seq), None)
+        if entry is not None and entry[1] == 0:
+            self.rtt.sample(now - entry[0])
+            if self.rate_controller is not None:
+                self.rate_controller.on_rtt(now - entry[0], now)
+
+    def on_ack(self, ack_packet, now=None):
+        """Processa um ACK recebido; retorna os pacotes a retransmitir imediatamente (NACKs) e os novos da janela."""
+        now = time.monotonic() if now is None else now
+        message_id, header_received, cumulative, upto, nacks = decode_ack(ack_packet)
+        state = self.messages.get(message_id)
+        if state is None: # ACK atrasado de mensagem já concluída ou abandonada
+            return []
+
+        if header_received and not state['header_acked']:
+            state['header_acked'] = True
+            self._acknowledge(message_id, HEADER_SEQ, now)
+
+        acked = state['acked']
+        upto = min(upto, len(acked))
+        missing = set(nacks)
+        newly_acked = 0
+        for seq in range(state['base'], upto): # Tudo até `upto` que não está nos NACKs foi recebido
+            if not acked[seq] and (seq < cumulative or seq not in missing):
+                acked[seq] = 1
+                state['pending'] -= 1
+                state['unacked'].pop(seq, None) # Libera o fragmento confirmado
+                self._acknowledge(message_id, seq, now)
+                newly_acked += 1
+        if newly_acked and self.rate_controller is not None:
+            self.rate_controller.on_ack(newly_acked, now)
+        while state['base'] < len(acked) and acked[state['base']]:
+            state['base'] += 1
+
+        packets = []
+        if state['pending'] == 0 and state['header_acked']: # Mensagem entregue por completo
+            del self.messages[message_id]
+            self.completed += 1
+        else:
+            # Retransmissão rápida dos índices pedidos que ainda não foram reenviados neste RTT
+            resend = [seq for seq in nacks if seq in state['unacked']]
+            if state['pending'] == 0 and not state['header_acked']:
+                resend.append(HEADER_SEQ) # Todos os fragmentos chegaram, mas o cabeçalho não
+            for seq in resend:
+                entry = self.inflight.get((message_id, seq))
+                if entry is not None and now - entry[0] >= self.rtt.rto / 2:
+                    entry[0] = now
+                    entry[1] += 1
+                    self.retransmissions += 1
+                    if self.rate_controller is not None:
+                        self.rate_controller.reserve(now)
+                    packets.append(self._packet(message_id, seq))
+            if nacks and self.rate_controller is not None:
+                self.rate_controller.on_loss(now)
+        packets.extend(self.poll(now))
+        return packets
+
+
+class AckTracker:
+    """Lado receptor: acompanha os fragmentos recebidos de um remetente e gera os ACKs/NACKs."""
+    def __init__(self, ack_every=ACK_EVERY, remember_completed=256):
+        self.ack_every = ack_every
+        self.messages = {} # {message_id: {'received': bytearray, 'count': N, 'cumulative': N, 'upto': N, 'header': bool, 'unacked': N}}
+        self.completed = OrderedDict() # Ids concluídos recentemente, para reconfirmar retransmissões tardias
+        self.remember_completed = remember_completed
+
+    def _state(self, message_id, total):
+        state = self.messages.get(message_id)
+        if state is None:
+            state = self.messages[message_id] = {
+                'received': bytearray(total), 'count': 0, 'cumulative': 0, 'upto': 0, 'header': False, 'unacked': 0,
+            }
+        return state
+
+    def _ack(self, message_id, state):
+        """Gera o ACK do estado atual da mensagem (e a encerra se estiver completa)."""
+        state['unacked'] = 0
+        received = state['received']
+        nacks = [seq for seq in range(state['cumulative'], state['upto']) if not received[seq]]
+        packet = encode_ack(message_id, state['header'], state['cumulative'], state['upto'], nacks)
+        if state['header'] and state['count'] == len(received):
+            del self.messages[message_id]
+            self.completed[message_id] = len(received)
+            if len(self.completed) > self.remember_completed:
+                self.completed.popitem(last=False)
+        return packet
+
+    def _completed_ack(self, message_id):
+        """ACK completo para uma mensagem já entregue (o ACK anterior pode ter se perdido)."""
+        total = self.completed[message_id]
+        return encode_ack(message_id, True, total, total, [])
+
+    def is_delivered_id(self, message_id):
+        """Indica se a mensagem já foi entregue por completo (retransmissões dela são duplicatas)."""
+        return message_id in self.completed
+
+    def is_delivered(self, fragment):
+        """Indica se o fragmento pertence a uma mensagem já entregue por completo."""
+        return FRAGMENT_HEADER.unpack_from(fragment)[1] in self.completed
+
+    def on_header(self, message_id, total):
+        """Registra a chegada do cabeçalho de texto; retorna o ACK a enviar."""
+        if message_id in self.completed:
+            return self._completed_ack(message_id)
+        state = self._state(message_id, total)
+        state['header'] = True
+        return self._ack(message_id, state)
+
+    def on_fragment(self, data):
+        """Registra a chegada de um fragmento; retorna o ACK a enviar agora, ou None para adiar."""
+        _, message_id, seq, total = FRAGMENT_HEADER.unpack_from(data)
+        if message_id in self.completed:
+            return self._completed_ack(message_id)
+        state = self._state(message_id, total)
+        received = state['received']
+        if seq >= len(received):
+            return None
+        if received[seq]: # Duplicata: o remetente não viu nosso ACK, então confirma de novo
+            return self._ack(message_id, state)
+
+        received[seq] = 1
+        state['count'] += 1
+        state['unacked'] += 1
+        gap = seq > state['upto'] # Chegou fora de ordem: há índices faltando antes dele
+        state['upto'] = max(state['upto'], seq + 1)
+        while state['cumulative'] < len(received) and received[state['cumulative']]:
+            state['cumulative'] += 1
+
+        if gap or state['unacked'] >= self.ack_every or state['count'] == len(received):
+            return self._ack(message_id, state)
+        return None
+
+    def forget(self, message_id):
+        """Descarta o acompanhamento de uma mensagem (ex: descartada pelo remontador)."""
+        self.messages.pop(message_id, None)
@@ -0,0 +1,89 @@
+# send_queue.py
+# Filas de saída por destinatário, com limite de pacotes e política para quando enchem.
+#
+# O servidor não envia mais tudo de uma vez, destinatário após destinatário, dentro do
+# tratamento do datagrama recebido: cada cliente tem a sua fila, e o loop as esvazia em
+# rodadas, no máximo SEND_BURST_PACKETS pacotes de cada cliente por rodada (respeitando o
+# pacing, se houver). Um destinatário lento (pacing baixo) ou com muito a receber (ex: uma
+# mensagem grande ou o histórico de uma sala) não atrasa os outros nem a recepção.
+#
+# As entradas da fila são as sequências de pacotes de cada envio (ex: cabeçalho e fragmentos de
+# uma mensagem), então o descarte é sempre de mensagens inteiras: nenhum fragmento solto fica
+# esperando no cliente até expirar.
+from collections import deque
+
+SEND_QUEUE_MAX_PACKETS = 4096 # Pacotes pendentes por destinatário
+SEND_BURST_PACKETS = 64       # Pacotes enviados a cada destinatário por rodada
+
+# Políticas para a fila cheia
+DROP_OLDEST = 'drop-oldest'  # Descarta as mensagens mais antigas ainda não iniciadas (o cliente recebe as recentes)
+DROP_NEWEST = 'drop-newest'  # Descarta a mensagem que não coube
+DISCONNECT = 'disconnect'    # Descarta a mensagem que não coube e desconecta o cliente (consumidor lento)
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+
+
+class SendQueue:
+    """Fila de saída de um destinatário: sequências de pacotes, com limite no total de pacotes.
+
+    Uma sequência maior que o limite só entra com a fila vazia (uma mensagem grande nunca é
+    recusada só pelo tamanho).
+    """
+    __slots__ = ('entries', 'packets', 'max_packets', 'policy', '_head')
+
+    def __init__(self, max_packets=SEND_QUEUE_MAX_PACKETS, policy=DROP_NEWEST):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"política de fila inválida: '{policy}' (use {', '.join(OVERFLOW_POLICIES)})")
+        self.entries = deque() # Listas de pacotes; a primeira pode já ter sido enviada em parte
+        self.packets = 0
+        self.max_packets = max_packets
+        self.policy = policy
+        self._head = 0 # Pacotes já enviados da primeira entrada
+
+    def __len__(self):
+        return self.packets
+
+    def push(self, packets):
+        """Enfileira uma sequência de pacotes; retorna quantos pacotes foram descartados para respeitar o limite."""
+        if not isinstance(packets, list):
+            packets = list(packets)
+        if not packets:
+            return 0
+        dropped = 0
+        if self.packets + len(packets) > self.max_packets and self.packets:
+            if self.policy != DROP_OLDEST:
+                return len(packets)
+            entries = self.entries
+            # A primeira entrada, se já começou a sair, é mantida: descartar o resto dela deixaria a mensagem incompleta
+            keep_head = 1 if self._head else 0
+            while len(entries) > keep_head and self.packets + len(packets) > self.max_packets:
+                entry = entries[keep_head]
+                del entries[keep_head]
+                self.packets -= len(entry)
+                dropped += len(entry)
+            if self.packets + len(packets) > self.max_packets and self.packets:
+                return dropped + len(packets)
+        self.entries.append(packets)
+        self.packets += len(packets)
+        return dropped
+
+    def pop(self, max_packets):
+        """Retira até `max_packets` pacotes do começo da fila, na ordem."""
+        packets = []
+        entries = self.entries
+        while entries and max_packets > 0:
+            entry = entries[0]
+            end = min(len(entry), self._head + max_packets)
+            packets.extend(entry[self._head:end])
+            max_packets -= end - self._head
+            if end == len(entry):
+                entries.popleft()
+                self._head = 0
+            else:
+                self._head = end
+        self.packets -= len(packets)
+        return packets
+
+    def clear(self):
+        self.entries.clear()
+        self.packets = 0
+        self._head = 0
@@ -1,214 +1,1161 @@
 # server_chat.py
 import socket as skt
-import math 
+import contextlib
+import itertools
 import time
-from datetime import datetime # Para timestamps
 import os 
 
+from batch_io import BatchSocketIO, batch_io_supported
+from chat_config import add_network_arguments, datagram_size, env_default, positive_count, set_socket_buffers
+from chat_protocol import (BYE, DEFAULT_ROOM, ENCODING_NONE, FRAGMENT_HEADER_SIZE, HEARTBEAT, HELLO, HISTORY, INCOMING, JOIN, LEAVE,
+                           LEGACY_MESSAGE_ID, MAX_DATAGRAM_SIZE, MAX_SHORT_FIELD, MESSAGE_ID_MODULO, MIN_DATAGRAM_SIZE, NOTIFY,
+                           STATS, TARGET_ROOM, TARGET_USER, UPLOAD_START, WELCOME, MessageReassembler, build_fragments,
+                           build_legacy_packets, decode_control, decode_text_control, decompress_payload, encode_control,
+                           format_compress_option, format_timestamp, fragment_message_id, fragment_payload_size, frame_fragment,
+                           is_control, is_fragment, parse_compress_option)
+from history import HISTORY_LOG_MAX_BYTES, HISTORY_MAX_BYTES, HISTORY_MAX_MESSAGES, HISTORY_MAX_TOTAL_BYTES, MessageHistory
+from metrics import ServerMetrics, format_prometheus
+from pacing import DEFAULT_PACING, pacing_argument, parse_pacing
+from reliability import RELIABILITY_TICK, AckTracker, ReliableSender, ack_every_for_window, is_ack, window_for_datagram
+from send_queue import DISCONNECT, DROP_NEWEST, OVERFLOW_POLICIES, SEND_BURST_PACKETS, SEND_QUEUE_MAX_PACKETS, SendQueue
+from timer_wheel import TimerWheel
+
 # Constantes Globais
-MAX_BUFF_SIZE = 1024       # Tamanho máximo do buffer para pacotes UDP
+MAX_BUFF_SIZE = 1024       # Tamanho dos datagramas enviados a clientes que não negociam outro no CMD:HI
 SERVER_HOST = '0.0.0.0'    # Endereço IP para o servidor escutar (0.0.0.0 = todas as interfaces disponíveis)
 SERVER_PORT = 7070         # Porta na qual o servidor vai escutar
+LEGACY_FORMAT = 'legacy'   # Formato (_text_format) dos clientes de texto anteriores ao cabeçalho nos fragmentos
+
+# Limites da remontagem de uploads (a mensagem inteira fica no servidor até chegar o último fragmento)
+REASSEMBLY_MAX_CLIENT_BYTES = 64 * 1024 * 1024   # Memória máxima por cliente
+REASSEMBLY_MAX_TOTAL_BYTES = 256 * 1024 * 1024   # Memória máxima no servidor todo
+REASSEMBLY_IDLE_TIMEOUT = 30.0                   # Segundos sem fragmentos até descartar um upload incompleto
+
+# Sinal de vida (negociado no HELLO): clientes sem nenhum datagrama por CLIENT_TIMEOUT segundos são removidos;
+# os que não negociaram o heartbeat, por IDLE_CLIENT_TIMEOUT segundos
+HEARTBEAT_INTERVAL = 10.0     # Intervalo dos HEARTBEATs pedido aos clientes (informado no WELCOME)
+CLIENT_TIMEOUT = 35.0         # Três heartbeats perdidos, com folga
+IDLE_CLIENT_TIMEOUT = 1800.0  # Sem heartbeat (protocolo de texto, clientes legados...): só quem fica 30 min sem nenhum datagrama
+LIVENESS_RESOLUTION = 1.0     # Resolução da roda de timers dos clientes (segundos)
+LEAVE_NOTIFY_MAX_NAMES = 20   # Nomes listados em uma notificação de saída em lote (o resto vira "e mais N")
+
+# Histórico das salas (history.py): os limites de memória ficam em MessageHistory
+HISTORY_REPLAY_BURST_PACKETS = 256 # Pacotes de histórico enviados a cada cliente por iteração do loop
+HISTORY_REPLAY_MAX_MESSAGES = 1000 # Mensagens reenviadas por pedido de histórico (as mais recentes)
+
+ADMIN_HOSTS = ('127.0.0.1', '::1') # Origens aceitas para comandos administrativos (CMD:STATS)
 
 def get_current_timestamp():
     """Retorna o timestamp atual formatado como string (HH:MM:SS DD/MM/YYYY)."""
-    return datetime.now().strftime("%H:%M:%S %d/%m/%Y")
+    return format_timestamp(time.time()) # Formatado uma vez por segundo (cache em format_timestamp)
+
+class MessageContent:
+    """Conteúdo de uma mensagem remontada, como o remetente o enviou (talvez comprimido).
+
+    A versão descomprimida, usada no log e para clientes que não negociaram o codec, só é
+    calculada se alguém a pedir, e no máximo uma vez.
+    """
+    __slots__ = ('data', 'encoding', '_plain', '_error')
+
+    def __init__(self, data, encoding=ENCODING_NONE):
+        self.data = data
+        self.encoding = encoding
+        self._plain = data if encoding == ENCODING_NONE else None
+        self._error = None
+
+    def plain(self):
+        """Conteúdo descomprimido; levanta ValueError se o conteúdo comprimido for inválido."""
+        if self._plain is None:
+            if self._error is None:
+                try:
+                    self._plain = decompress_payload(self.data, self.encoding, REASSEMBLY_MAX_CLIENT_BYTES)
+                except ValueError as e:
+                    self._error = e
+            if self._error is not None:
+                raise self._error
+        return self._plain
+
+    @property
+    def decompressed(self):
+        """True se o conteúdo já está disponível descomprimido (sem custo para plain())."""
+        return self._plain is not None
+
 
 class UDPServer:
     """Representa o servidor de chat UDP que gerencia clientes e retransmite mensagens."""
-    def __init__(self, host, port, max_buff):
-        """Inicializa o servidor UDP, faz o bind do socket e configura variáveis de estado."""
+    def __init__(self, host, port, max_buff, reuse_port=False, pacing=None, max_datagram=MAX_DATAGRAM_SIZE, profile_path=None,
+                 batch_io=True, rcvbuf=None, sndbuf=None):
+        """Inicializa o servidor UDP, faz o bind do socket e configura variáveis de estado.
+
+        Com `batch_io` (e suporte da plataforma), os datagramas são recebidos e enviados em lote
+        (batch_io.py); senão, um recvfrom e um sendto por datagrama. `rcvbuf`/`sndbuf` ajustam
+        SO_RCVBUF/SO_SNDBUF do socket (None mantém o padrão do sistema).
+        """
         self.sckt = skt.socket(skt.AF_INET, skt.SOCK_DGRAM) # Cria socket UDP
+        set_socket_buffers(self.sckt, rcvbuf, sndbuf)
+        if reuse_port: # Vários processos na mesma porta; o kernel distribui os datagramas por origem
+            self.sckt.setsockopt(skt.SOL_SOCKET, skt.SO_REUSEPORT, 1)
         self.sckt.bind((host, port)) # Associa o socket ao endereço e porta especificados
         print(f"Servidor de Chat IF975 iniciado em {host}:{port}")
         print("Aguardando conexões...")
         
         if self.sckt is None: # Verificação adicional de segurança para o socket
             raise Exception("Socket not available.")
-        
-        self.MAX_BUFF = max_buff # Tamanho máximo do buffer para pacotes
+
+        self._init_state(max_buff, pacing, max_datagram, profile_path)
+        if batch_io and batch_io_supported(self.sckt):
+            self.io = BatchSocketIO(self.sckt)
+
+    def _init_state(self, max_buff, pacing=None, max_datagram=MAX_DATAGRAM_SIZE, profile_path=None):
+        """Inicializa o estado da sala (clientes e uploads em andamento), independente do socket usado."""
+        self.MAX_BUFF = max_buff # Tamanho padrão dos datagramas enviados aos clientes
+        self.max_datagram = max_datagram # Maior tamanho de datagrama aceito na negociação do CMD:HI
         self.clients = {}  # Dicionário para armazenar clientes conectados: {(ip, port): username}
-        # Dicionário para armazenar partes de arquivos de mensagens sendo recebidas de clientes:
-        # {(ip, port): {'username': 'nome', 'parts': [], 'total_packets': N, 'file_id': M, 'ready_for_data': True/False}}
-        self.incoming_file_parts = {} 
+        # Índices das salas: cada mensagem só percorre os membros da sala de destino
+        self.rooms = {} # {sala: set de (ip, port) dos membros}; salas vazias são removidas
+        self.client_rooms = {} # {(ip, port): set das salas do cliente}
+        self.usernames = {} # {username: (ip, port)} para mensagens privadas (o último a entrar com o nome)
+        self.client_max_buff = {} # {(ip, port): tamanho de datagrama negociado}, só para quem negociou
+        self.text_clients = set() # Clientes antigos, que falam o protocolo de texto (CMD:HI, MSG_INCOMING...)
+        # Os mais antigos, anteriores ao cabeçalho nos fragmentos (CMD:HI sem opções): pedaços sem cabeçalho, em ordem
+        self.legacy_clients = set()
+        self.legacy_uploads = {} # {(ip, port): [índice do próximo pedaço, total]} do upload em andamento
+        # Compressão (negociada no HELLO): {(ip, port): encodings que o cliente descomprime}
+        self.supports_compression = True
+        self.client_encodings = {}
+        self.chat_log = True # Loga as mensagens da sala no console (descomprimindo as comprimidas)
+        # Tratamento de cada tipo de mensagem de controle recebida (dos dois protocolos)
+        self._control_handlers = {HELLO: self._on_hello, BYE: self._on_bye, STATS: self._on_stats,
+                                  UPLOAD_START: self._on_upload_start, JOIN: self._on_join, LEAVE: self._on_leave,
+                                  HEARTBEAT: self._on_heartbeat, HISTORY: self._on_history}
+        # Sinal de vida: qualquer datagrama atualiza last_seen; a roda de timers só guarda um prazo por cliente e,
+        # quando ele vence, confere last_seen (e reagenda) em vez de ser reagendada a cada datagrama
+        self.supports_heartbeat = True
+        self.heartbeat_interval = HEARTBEAT_INTERVAL
+        self.client_timeout = CLIENT_TIMEOUT
+        self.idle_client_timeout = IDLE_CLIENT_TIMEOUT
+        self.last_seen = {} # {(ip, port): time.monotonic() do último datagrama}
+        self.silent_clients = set() # Clientes sem heartbeat: expiram na mesma roda, com idle_client_timeout
+        self.liveness_wheel = TimerWheel(resolution=LIVENESS_RESOLUTION)
+        # Mensagens sendo recebidas de clientes, remontadas por (endereço do cliente, id da mensagem)
+        self.incoming_file_parts = MessageReassembler(max_sender_bytes=REASSEMBLY_MAX_CLIENT_BYTES,
+                                                      max_total_bytes=REASSEMBLY_MAX_TOTAL_BYTES,
+                                                      idle_timeout=REASSEMBLY_IDLE_TIMEOUT)
+        self._message_ids = itertools.count(1) # Ids das mensagens retransmitidas pelo servidor
+        # Histórico das salas (negociado no HELLO): as mensagens ficam guardadas já codificadas e são reenviadas,
+        # aos poucos (HISTORY_REPLAY_BURST_PACKETS por iteração do loop), a quem pede com HISTORY
+        self.history = None
+        self.history_replays = {} # {(ip, port): {sala: [último id reenviado, último id a reenviar]}}
+        # {(ip, port): {sala: id mais recente da sala quando o cliente entrou nela}}: o primeiro pedido de histórico
+        # depois da entrada para aí, porque as mensagens seguintes já foram entregues ao cliente pela sala
+        self.history_marks = {}
+        self.set_history(MessageHistory())
+        # Entrega confiável (opcional, negociada no CMD:HI): estado por cliente que a pediu
+        self.supports_reliable = True
+        self.reliable_senders = {} # {(ip, port): ReliableSender} para as mensagens enviadas ao cliente
+        self.ack_trackers = {} # {(ip, port): AckTracker} para os uploads recebidos do cliente
+        self._next_reliability_check = 0.0
+        # Pacing por destinatário (ex: 'aimd', 'fixed:5000'); None envia tudo imediatamente
+        self.rate_controller_factory = parse_pacing(pacing)
+        self.rate_controllers = {} # {(ip, port): RateController}
+        # Filas de saída por destinatário (send_queue.py), esvaziadas em rodadas por service_send_queues()
+        self.send_queue_limit = SEND_QUEUE_MAX_PACKETS
+        self.overflow_policy = DROP_NEWEST
+        self.outbound_queues = {} # {(ip, port): SendQueue}, só enquanto há pacotes esperando
+        self._slow_consumers = set() # Clientes a desconectar por fila cheia (política DISCONNECT)
+        self._last_client_address = None # Último endereço recebido (usado ao tratar ConnectionResetError)
+        # Contadores e latências (expostos por CMD:STATS); com profile_path, também um perfil amostral em arquivo
+        self.metrics = ServerMetrics(profile_path)
+        self.io = None # BatchSocketIO quando a E/S é em lote
+        self._defer_flush = False # Dentro de um lote: os envios esperam o flush_sends() do final
 
-    def _log_server_chat_message(self, ip, port, username, message_text, timestamp):
-        """Imprime uma mensagem de chat formatada no console do servidor."""
-        print(f"{ip}:{port}/~{username}: {message_text} {timestamp}")
+    def _log_server_chat_message(self, ip, port, username, message_text, timestamp, target=""):
+        """Imprime uma mensagem de chat formatada no console do servidor (com a sala ou o destinatário, se houver)."""
+        prefix = f"[{target}] " if target else ""
+        print(f"{prefix}{ip}:{port}/~{username}: {message_text} {timestamp}")
 
     def _log_server_notification(self, notification_text):
         """Imprime uma notificação (ex: entrada/saída de usuário) no console do servidor."""
         print(notification_text)
 
-    def broadcast_to_clients(self, message_bytes, sender_address=None):
-        """Envia uma mensagem em bytes para todos os clientes conectados, exceto o remetente (opcional)."""
-        # Itera sobre uma cópia da lista de chaves para permitir modificação segura de self.clients durante a iteração (embora não ocorra aqui)
-        for client_addr in list(self.clients.keys()): 
+    def _encode_for(self, client_address, message_type, *fields):
+        """Codifica uma mensagem de controle no protocolo falado pelo cliente."""
+        return encode_control(message_type, *fields, text=client_address in self.text_clients)
+
+    def _text_format(self, client_address):
+        """Formato das mensagens para o cliente: False (binário), True (texto) ou LEGACY_FORMAT (texto sem cabeçalho nos fragmentos)."""
+        if client_address not in self.text_clients:
+            return False
+        return LEGACY_FORMAT if client_address in self.legacy_clients else True
+
+    def _notify_client(self, client_address, text):
+        """Envia uma notificação (NOTIFY) só para um cliente (ex: erro no destino de uma mensagem)."""
+        self._send_packets((self._encode_for(client_address, NOTIFY, text),), client_address)
+
+    def broadcast_to_clients(self, message_type, *fields, sender_address=None, room=None):
+        """Envia uma mensagem de controle (ex: NOTIFY) para os membros de uma sala (ou, sem `room`, para todos os
+        clientes conectados), exceto o remetente (opcional)."""
+        start = time.perf_counter_ns()
+        # Codificada uma vez por protocolo
+        encoded = {False: encode_control(message_type, *fields), True: encode_control(message_type, *fields, text=True)}
+        text_clients = self.text_clients
+        recipients = self.clients if room is None else self.rooms.get(room, ())
+        for client_addr in recipients: # Os envios não alteram a sala, então não é preciso copiar os membros
             if client_addr != sender_address: # Não envia de volta para o remetente da notificação
                 try:
-                    self.sckt.sendto(message_bytes, client_addr)
+                    self._send_packets((encoded[client_addr in text_clients],), client_addr)
                 except Exception as e: # Captura erros ao enviar para um cliente específico
                     print(f"[DEBUG_SERVER] Error broadcasting to {client_addr}: {e}")
+                    self.metrics.record_send_error(client_addr)
+        self.metrics.observe('broadcast', start)
 
-    def send_file_content_to_client(self, target_client_addr, content_bytes, original_sender_info_tuple):
-        """Envia o conteúdo de um arquivo (mensagem) fragmentado para um cliente específico."""
+    def _send_packets(self, packets, target_client_addr):
+        """Envia uma sequência de datagramas para um cliente (ponto único de saída do servidor).
+
+        Sai imediatamente só uma rodada (SEND_BURST_PACKETS, ou o que o controlador de taxa do
+        cliente permite); o resto espera na fila de saída dele, limitada, e é enviado por
+        service_send_queues(). Clientes confiáveis não usam a fila: a janela do ReliableSender
+        deles já limita o que está pendente.
+        """
+        if target_client_addr in self.reliable_senders:
+            self._transmit(packets, target_client_addr)
+            return
+        queue = self.outbound_queues.get(target_client_addr)
+        if queue is None:
+            if target_client_addr not in self.rate_controllers and len(packets) <= SEND_BURST_PACKETS:
+                self._transmit(packets, target_client_addr) # Caso mais comum: nada esperando e cabe em uma rodada
+                return
+            queue = self.outbound_queues[target_client_addr] = SendQueue(self.send_queue_limit, self.overflow_policy)
+        dropped = queue.push(packets)
+        if dropped:
+            self._on_queue_overflow(target_client_addr, dropped)
+        self._drain_send_queue(target_client_addr, queue, time.monotonic())
+
+    def _on_queue_overflow(self, target_client_addr, dropped):
+        """Conta os pacotes descartados por fila cheia e, com a política DISCONNECT, marca o cliente para remoção."""
+        self.metrics.record_drop(target_client_addr, dropped)
+        if self.overflow_policy == DISCONNECT and target_client_addr not in self._slow_consumers:
+            print(f"[DEBUG_SERVER] Fila de envio cheia para {target_client_addr}. Desconectando o cliente.")
+            self._slow_consumers.add(target_client_addr) # Removido em service_send_queues (pode estar no meio de um fan-out)
+
+    def _transmit(self, packets, target_client_addr):
+        """Envia datagramas a um cliente: direto no socket ou, com E/S em lote, pela fila de saída."""
+        if self.io is not None:
+            sent_packets, sent_bytes = self.io.queue(packets, target_client_addr)
+            if not self._defer_flush: # Fora de um lote (ex: chamada direta): envia já
+                self.flush_sends()
+        else:
+            sendto = self.sckt.sendto
+            sent_packets = sent_bytes = 0
+            for packet in packets:
+                sendto(packet, target_client_addr)
+                sent_packets += 1
+                sent_bytes += len(packet)
+        self.metrics.packets_out += sent_packets
+        self.metrics.bytes_out += sent_bytes
+
+    def flush_sends(self):
+        """Envia os datagramas enfileirados pela E/S em lote, registrando os destinos que falharem."""
+        if self.io is None or not self.io.outbox:
+            return
+        start = time.perf_counter_ns()
+        for client_addr, e in self.io.flush():
+            print(f"[DEBUG_SERVER] Erro ao enviar para {client_addr}: {e}")
+            self.metrics.record_send_error(client_addr)
+            self.outbound_queues.pop(client_addr, None) # Destino com erro (ex: inalcançável): não insiste no que falta
+        self.metrics.observe('flush', start)
+
+    @contextlib.contextmanager
+    def _batched_sends(self):
+        """Junta os envios feitos dentro do bloco em um único flush_sends() no final."""
+        self._defer_flush = True
+        try:
+            yield
+        finally:
+            self._defer_flush = False
+            self.flush_sends()
+
+    def _drain_send_queue(self, target_client_addr, queue, now):
+        """Envia uma rodada da fila do cliente: até SEND_BURST_PACKETS pacotes, enquanto houver fichas no controlador."""
+        budget = min(SEND_BURST_PACKETS, len(queue))
+        rate_controller = self.rate_controllers.get(target_client_addr)
+        if rate_controller is not None:
+            allowed = 0
+            while allowed < budget and rate_controller.try_send(now):
+                allowed += 1
+            budget = allowed
+        packets = queue.pop(budget)
+        if not queue:
+            del self.outbound_queues[target_client_addr]
+        if packets:
+            self._transmit(packets, target_client_addr)
+
+    def set_history(self, history):
+        """Troca o histórico das salas (um MessageHistory, ou None para desativá-lo), fechando o anterior.
+
+        Os ids das mensagens continuam depois do último guardado no log, para que os pedidos de
+        histórico de clientes que voltam continuem valendo após um reinício do servidor.
+        """
+        if self.history is not None:
+            self.history.close()
+        self.history = history
+        self.history_replays.clear()
+        self.history_marks.clear()
+        if history is not None and history.last_message_id:
+            self._message_ids = itertools.count(history.last_message_id + 1)
+
+    def set_send_queue(self, max_packets=SEND_QUEUE_MAX_PACKETS, policy=DROP_NEWEST):
+        """Configura o limite das filas de saída (pacotes por cliente) e a política quando enchem (send_queue.py).
+
+        Vale para as filas criadas depois da chamada; levanta ValueError se a política não existir.
+        """
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"política de fila inválida: '{policy}' (use {', '.join(OVERFLOW_POLICIES)})")
+        self.send_queue_limit = max_packets
+        self.overflow_policy = policy
+
+    def _build_file_packets(self, content_bytes, original_sender_info_tuple, max_buff=None, text_protocol=False,
+                            encoding=ENCODING_NONE, target_kind=TARGET_ROOM, target=DEFAULT_ROOM, message_id=None, timestamp=None):
+        """Monta uma única vez o cabeçalho de entrega (INCOMING) e os fragmentos da mensagem, prontos para envio."""
         # original_sender_info_tuple = (ip_original, porta_original, username_original)
-        
-        # Calcula o número de pacotes necessários
-        num_packets = math.ceil(len(content_bytes) / self.MAX_BUFF)
-        timestamp_for_clients = get_current_timestamp() # Timestamp para a mensagem retransmitida
-        
-        # Cria o cabeçalho da mensagem que informa ao cliente sobre a mensagem chegando
-        header_msg_str = f"MSG_INCOMING:{original_sender_info_tuple[0]}:{original_sender_info_tuple[1]}:{original_sender_info_tuple[2]}:{timestamp_for_clients}:{num_packets}"
-        
+
+        if text_protocol == LEGACY_FORMAT: # Cliente anterior ao cabeçalho nos fragmentos (sem ids nem compressão)
+            return build_legacy_packets(content_bytes, *original_sender_info_tuple, int(time.time()) if timestamp is None else timestamp)
+        if message_id is None:
+            message_id = next(self._message_ids) % MESSAGE_ID_MODULO
+
+        # Fragmentos com cabeçalho binário (id, índice, total); montados uma vez e compartilhados pelos destinatários
+        fragments = build_fragments(content_bytes, message_id, fragment_payload_size(max_buff or self.MAX_BUFF))
+
+        # Cabeçalho que informa ao cliente sobre a mensagem chegando (com o horário do servidor)
+        header = encode_control(INCOMING, message_id, *original_sender_info_tuple, int(time.time()) if timestamp is None else timestamp,
+                                len(fragments), encoding, target_kind, target, text=text_protocol)
+        return [header] + fragments
+
+    def send_file_content_to_client(self, target_client_addr, content_bytes, original_sender_info_tuple, packets=None,
+                                    encoding=ENCODING_NONE, target_kind=TARGET_ROOM, target=DEFAULT_ROOM):
+        """Envia o conteúdo de um arquivo (mensagem) fragmentado para um cliente específico."""
+        start = time.perf_counter_ns()
+        if packets is None: # Sem pacotes pré-montados, monta apenas para este destinatário
+            packets = self._build_file_packets(content_bytes, original_sender_info_tuple,
+                                               self.client_max_buff.get(target_client_addr),
+                                               self._text_format(target_client_addr), encoding, target_kind, target)
+
         try:
-            # Envia o cabeçalho
-            self.sckt.sendto(header_msg_str.encode('utf-8'), target_client_addr)
-            time.sleep(0.001)
-
-            # Envia os fragmentos do conteúdo do arquivo
-            for i in range(num_packets):
-                chunk = content_bytes[i * self.MAX_BUFF : (i + 1) * self.MAX_BUFF]
-                
-                self.sckt.sendto(chunk, target_client_addr)
-                time.sleep(0.001) # Pequena pausa entre fragmentos
+            reliable_sender = self.reliable_senders.get(target_client_addr)
+            if reliable_sender is not None: # Cliente confiável: a janela decide o que sai agora
+                reliable_sender.enqueue(fragment_message_id(packets[1]), packets[0], packets[1:], len(packets) - 1)
+                packets = reliable_sender.poll()
+            # Envia o cabeçalho seguido dos fragmentos, sem pausas fixas entre os pacotes
+            self._send_packets(packets, target_client_addr)
         except Exception as e:
             print(f"[DEBUG_SERVER] Error in send_file_content_to_client to {target_client_addr}: {e}")
+            self.metrics.record_send_error(target_client_addr)
+        self.metrics.observe('send_file', start)
+
+    def broadcast_file_content(self, content, original_sender_info_tuple, sender_address=None, room=DEFAULT_ROOM):
+        """Retransmite uma mensagem para os membros da sala (exceto o remetente), codificando-a uma única vez
+        para cada tamanho de datagrama negociado (protocolo e compressão) na sala. O custo depende só do
+        tamanho da sala, não do número de clientes conectados.
+
+        `content` são os bytes da mensagem ou um MessageContent: conteúdo comprimido vai como está para
+        quem negociou o codec, e descomprimido (uma vez) para os demais. Com histórico, a mensagem é
+        guardada no formato padrão (MAX_BUFF, binário, compressão original), com o mesmo id para todos.
+        """
+        start = time.perf_counter_ns()
+        if not isinstance(content, MessageContent):
+            content = MessageContent(content)
+        client_encodings = self.client_encodings
+        packets_by_format = {}
+        message_id = next(self._message_ids) % MESSAGE_ID_MODULO
+        timestamp = int(time.time())
+        for target_addr in self.rooms.get(room, ()):
+            if target_addr != sender_address: # Não envia de volta para o remetente original
+                encoding = content.encoding
+                if encoding != ENCODING_NONE and encoding not in client_encodings.get(target_addr, ()):
+                    encoding = ENCODING_NONE # Cliente sem o codec recebe o conteúdo descomprimido
+                packet_format = (self.client_max_buff.get(target_addr, self.MAX_BUFF), self._text_format(target_addr), encoding)
+                packets = packets_by_format.get(packet_format)
+                if packets is None:
+                    try:
+                        content_bytes = content.data if encoding == content.encoding else self._decompress_for_relay(content)
+                    except ValueError as e:
+                        print(f"[DEBUG_SERVER] Mensagem comprimida inválida não retransmitida para {target_addr}: {e}")
+                        continue
+                    packets = packets_by_format[packet_format] = self._build_file_packets(
+                        content_bytes, original_sender_info_tuple, *packet_format, TARGET_ROOM, room, message_id, timestamp)
+                self.send_file_content_to_client(target_addr, None, original_sender_info_tuple, packets=packets)
+        if self.history is not None:
+            packet_format = (self.MAX_BUFF, False, content.encoding)
+            packets = packets_by_format.get(packet_format) # Quase sempre já montado para algum membro
+            if packets is None:
+                packets = self._build_file_packets(content.data, original_sender_info_tuple, *packet_format, TARGET_ROOM, room,
+                                                   message_id, timestamp)
+            self.history.add(room, message_id, packets)
+        self.metrics.observe('fanout', start)
+
+    def send_direct_message(self, target_client_addr, content, original_sender_info_tuple):
+        """Entrega uma mensagem privada a um cliente (comprimida, se ele negociou o codec)."""
+        if not isinstance(content, MessageContent):
+            content = MessageContent(content)
+        encoding = content.encoding
+        if encoding != ENCODING_NONE and encoding not in self.client_encodings.get(target_client_addr, ()):
+            encoding = ENCODING_NONE
+        try:
+            content_bytes = content.data if encoding == content.encoding else self._decompress_for_relay(content)
+        except ValueError as e:
+            print(f"[DEBUG_SERVER] Mensagem comprimida inválida não entregue a {target_client_addr}: {e}")
+            return
+        self.send_file_content_to_client(target_client_addr, content_bytes, original_sender_info_tuple, encoding=encoding,
+                                         target_kind=TARGET_USER, target="")
+
+    def _decompress_for_relay(self, content):
+        """Conteúdo descomprimido de uma mensagem, contando as descompressões feitas pelo servidor."""
+        if not content.decompressed:
+            self.metrics.messages_decompressed += 1
+        return content.plain()
 
 
     def handle_client_message(self, data, client_address):
         """Processa dados recebidos de um cliente (comandos, cabeçalhos de upload, fragmentos de arquivo)."""
         client_ip, client_port = client_address # Desempacota o endereço do cliente
 
-        # Prioridade 1: Se estamos esperando fragmentos de arquivo deste cliente
-        if client_address in self.incoming_file_parts and \
-           self.incoming_file_parts[client_address].get('ready_for_data', False) and \
-           self.incoming_file_parts[client_address]['total_packets'] > 0:
-            
-            file_info = self.incoming_file_parts[client_address]
-            file_info['parts'].append(data) # Adiciona o fragmento (bytes)
-
-            # Se todos os fragmentos foram recebidos
-            if len(file_info['parts']) == file_info['total_packets']:
-                full_message_content_bytes = b"".join(file_info['parts']) # Remonta o arquivo
-                message_text_from_client = ""
-                try: # Tenta decodificar o conteúdo do arquivo como UTF-8
-                    message_text_from_client = full_message_content_bytes.decode('utf-8')
-                except UnicodeDecodeError: # Fallback se não for UTF-8 válido
-                    message_text_from_client = full_message_content_bytes.decode('latin-1', errors='replace')
-                    print(f"[DEBUG_SERVER] Mensagem de {client_address} decodificada com fallback (latin-1).")
-
-                original_sender_username = file_info['username'] # Pega o nome do remetente
-                del self.incoming_file_parts[client_address] # Limpa o buffer de recebimento para este arquivo
-
-                # Loga a mensagem no console do servidor
-                server_timestamp = get_current_timestamp()
-                self._log_server_chat_message(client_ip, client_port, original_sender_username, message_text_from_client, server_timestamp)
-                
-                # Retransmite a mensagem para os outros clientes
-                original_sender_info_tuple = (client_ip, client_port, original_sender_username)
-                for target_addr in list(self.clients.keys()):
-                    if target_addr != client_address: # Não envia de volta para o remetente original
-                        self.send_file_content_to_client(target_addr, full_message_content_bytes, original_sender_info_tuple)
+        # Prioridade 1: Fragmentos de mensagem (identificados pelo cabeçalho binário, sem tentar decodificar)
+        if is_fragment(data):
+            if client_address not in self.clients: # Só aceita fragmentos de clientes registrados
+                print(f"[DEBUG_SERVER] Fragmento de cliente não registrado {client_address}. Ignorando.")
+                return
+            ack_tracker = self.ack_trackers.get(client_address)
+            if ack_tracker is not None: # Upload confiável: confirma (ou pede o que falta) ao cliente
+                already_delivered = ack_tracker.is_delivered(data)
+                ack = ack_tracker.on_fragment(data)
+                if ack is not None:
+                    self._send_packets((ack,), client_address)
+                if already_delivered: # Retransmissão tardia de mensagem já entregue
+                    return
+            try:
+                completed = self.incoming_file_parts.add_fragment(client_address, data)
+            except ValueError as e: # Fragmento inválido ou mensagem acima do limite de memória
+                print(f"[DEBUG_SERVER] Fragmento inválido de {client_address}: {e}")
+                message_id = fragment_message_id(data)
+                if ack_tracker is not None and (client_address, message_id) not in self.incoming_file_parts.pending:
+                    ack_tracker.forget(message_id) # Mensagem descartada: não precisa mais acompanhá-la
+                return
+            if completed is not None:
+                self._relay_completed_message(client_address, *completed)
             return # Retorna após processar o fragmento
 
-        # Prioridade 2: Tenta decodificar como string para processar comandos ou cabeçalhos
-        try:
-            message_str = data.decode('utf-8')
-
-            if message_str.startswith("CMD:HI:"): # Comando de conexão
-                parts = message_str.split(':', 2)
-                username = parts[2]
-                self.clients[client_address] = username # Adiciona cliente à lista
-                self._log_server_notification(f"{username} entrou na sala.") # Log no servidor
-                # Notifica outros clientes
-                notification_for_clients = f"NOTIFY:{username} entrou na sala."
-                self.broadcast_to_clients(notification_for_clients.encode('utf-8'), sender_address=client_address)
-
-            elif message_str.startswith("CMD:BYE"): # Comando de desconexão
-                if client_address in self.clients:
-                    username = self.clients.pop(client_address) # Remove cliente
-                    self._log_server_notification(f"{username} saiu da sala.") # Log no servidor
-                    # Notifica outros clientes
-                    notification_for_clients = f"NOTIFY:{username} saiu da sala."
-                    self.broadcast_to_clients(notification_for_clients.encode('utf-8'))
-                if client_address in self.incoming_file_parts: # Limpa buffer de arquivo se houver
-                    del self.incoming_file_parts[client_address]
-
-            elif message_str.startswith("MSG_UPLOAD_START:"): # Cliente quer enviar um arquivo de mensagem
-                if client_address not in self.clients: # Verifica se o cliente está registrado
-                    print(f"[DEBUG_SERVER] Cliente não registrado {client_address} tentou MSG_UPLOAD_START. Ignorando.")
-                    return
-                
-                parts = message_str.split(':', 1) # Divide em "MSG_UPLOAD_START" e "<num_packets>"
-                if len(parts) == 2:
-                    try:
-                        num_packets = int(parts[1]) # Converte número de pacotes para inteiro
-                        username_for_file = self.clients[client_address] # Nome do usuário que está enviando
-                        
-                        # Prepara para receber os fragmentos do arquivo
-                        self.incoming_file_parts[client_address] = {
-                            'username': username_for_file,
-                            'parts': [],
-                            'total_packets': num_packets,
-                            'file_id': time.time(), # ID simples para o arquivo (timestamp)
-                            'ready_for_data': True # Sinaliza que está pronto para receber os bytes
-                        }
-                        # print(f"[DEBUG_SERVER] Esperando {num_packets} pacotes para msg de {username_for_file}@{client_address}.")
-                    except ValueError: # Se num_packets não for um inteiro válido
-                        print(f"[DEBUG_SERVER] MSG_UPLOAD_START de {client_address} com num_packets inválido: '{parts[1]}'")
-                else: # Se o formato do MSG_UPLOAD_START estiver incorreto
-                    print(f"[DEBUG_SERVER] MSG_UPLOAD_START malformado de {client_address}: '{message_str}'")
-
-
-            else: # String decodificada, mas não é um comando/cabeçalho conhecido
-                print(f"[DEBUG_SERVER] Recebido comando/string decodificado desconhecido de {client_address}: '{message_str}'")
+        # ACKs da camada confiável para mensagens que o servidor enviou a este cliente
+        if is_ack(data):
+            reliable_sender = self.reliable_senders.get(client_address)
+            if reliable_sender is not None:
+                self._send_packets(reliable_sender.on_ack(data), client_address)
+            return
+
+        # Cliente anterior ao cabeçalho nos fragmentos no meio de um upload: o datagrama é o próximo pedaço
+        legacy_upload = self.legacy_uploads.get(client_address)
+        if legacy_upload is not None:
+            self._on_legacy_fragment(client_address, legacy_upload, data)
+            return
 
+        # Prioridade 2: Comandos e cabeçalhos, no protocolo binário ou no de texto (clientes antigos)
+        text_protocol = not is_control(data)
+        try:
+            message_type, fields = decode_text_control(data.decode('utf-8')) if text_protocol else decode_control(data)
         except UnicodeDecodeError: # Se falhou ao decodificar como string E não era um fragmento esperado
             print(f"[DEBUG_SERVER] Recebida msg indecodificável de {client_address}, e não esperando partes de arquivo atualmente.")
+            return
+        except ValueError as e: # Comando desconhecido ou malformado
+            print(f"[DEBUG_SERVER] Mensagem de controle inválida de {client_address}: {e}")
+            return
+        handler = self._control_handlers.get(message_type)
+        if handler is None: # Mensagem válida, mas que só o servidor envia (ex: INCOMING)
+            print(f"[DEBUG_SERVER] Mensagem de controle inesperada de {client_address}: tipo {message_type}")
+            return
+        try:
+            handler(client_address, text_protocol, *fields)
         except Exception as e: # Captura outras exceções durante o processamento
             print(f"[DEBUG_SERVER] Erro ao processar mensagem de {client_address}: {e}")
 
+    def _on_hello(self, client_address, text_protocol, username, options):
+        """Comando de conexão: registra o cliente com as opções pedidas e o protocolo que ele fala."""
+        if text_protocol:
+            self.text_clients.add(client_address)
+        else:
+            self.text_clients.discard(client_address)
+        # Só os clientes de texto anteriores ao cabeçalho nos fragmentos mandam o CMD:HI sem nenhuma opção
+        if text_protocol and not options:
+            self.legacy_clients.add(client_address)
+        else:
+            self.legacy_clients.discard(client_address)
+        self.add_client(client_address, username, options)
 
-    def run(self):
-        """Loop principal do servidor que escuta por mensagens de clientes e as processa."""
-        while True: # Loop infinito para manter o servidor rodando
+    def _on_bye(self, client_address, text_protocol):
+        """Comando de desconexão."""
+        self.remove_client(client_address)
+
+    def _on_heartbeat(self, client_address, text_protocol):
+        """Sinal de vida de um cliente ocioso: last_seen já foi atualizado em _handle_datagram."""
+
+    def _on_stats(self, client_address, text_protocol, prometheus):
+        """Métricas do servidor (JSON ou texto Prometheus); respondidas sempre em texto."""
+        if client_address[0] not in ADMIN_HOSTS: # Canal administrativo: apenas a partir da própria máquina
+            print(f"[DEBUG_SERVER] CMD:STATS de origem não local {client_address}. Ignorando.")
+            return
+        self._send_packets((self._stats_reply(prometheus),), client_address)
+
+    def _on_join(self, client_address, text_protocol, room):
+        """Comando de entrada em uma sala."""
+        if client_address not in self.clients:
+            print(f"[DEBUG_SERVER] Cliente não registrado {client_address} tentou entrar na sala '{room}'. Ignorando.")
+            return
+        room = room.strip()
+        if not room or len(room.encode('utf-8')) > MAX_SHORT_FIELD:
+            self._notify_client(client_address, "Nome de sala inválido.")
+            return
+        self.join_room(client_address, room)
+
+    def _on_leave(self, client_address, text_protocol, room):
+        """Comando de saída de uma sala (o cliente continua conectado)."""
+        self.leave_room(client_address, room.strip())
+
+    def _on_history(self, client_address, text_protocol, room, since_id):
+        """Pedido das mensagens de uma sala com id maior que `since_id`: entram na fila de reenvio do cliente."""
+        if client_address not in self.clients:
+            print(f"[DEBUG_SERVER] Cliente não registrado {client_address} pediu histórico. Ignorando.")
+            return
+        room = room.strip() or DEFAULT_ROOM
+        if self.history is None:
+            self._notify_client(client_address, "Este servidor não guarda histórico.")
+            return
+        if client_address not in self.rooms.get(room, ()):
+            self._notify_client(client_address, f"Você não está na sala #{room}.")
+            return
+        # O reenvio não passa das HISTORY_REPLAY_MAX_MESSAGES mais recentes nem das que o cliente recebe pela sala: as
+        # que chegaram depois do pedido ou, no primeiro pedido após a entrada (se ele ainda não recebeu nenhuma mais
+        # nova), depois da entrada. As mensagens são lidas uma a uma em service_history.
+        mark = self.history_marks.get(client_address, {}).pop(room, None)
+        until_id = mark if mark is not None and since_id <= mark else self.history.last_id(room)
+        start_id = self.history.replay_start(room, since_id, HISTORY_REPLAY_MAX_MESSAGES)
+        if until_id <= start_id:
+            return
+        if start_id > since_id:
+            self._notify_client(client_address, f"Histórico de #{room}: reenviando só as últimas {HISTORY_REPLAY_MAX_MESSAGES} mensagens.")
+        self.history_replays.setdefault(client_address, {})[room] = [start_id, until_id] # Um novo pedido da sala substitui o anterior
+        self.service_history()
+
+    def _history_packets_for(self, client_address, packets):
+        """Pacotes guardados, como estão, se o cliente os aceita; senão, remontados com o datagrama e a compressão
+        dele (mesmo id e horário da mensagem original)."""
+        max_buff = self.client_max_buff.get(client_address, self.MAX_BUFF)
+        _, (message_id, ip, port, username, timestamp, _, encoding, target_kind, target) = decode_control(packets[0])
+        compatible_encoding = encoding == ENCODING_NONE or encoding in self.client_encodings.get(client_address, ())
+        if max_buff >= self.MAX_BUFF and compatible_encoding:
+            return packets
+        content_bytes = b"".join(fragment[FRAGMENT_HEADER_SIZE:] for fragment in packets[1:])
+        if not compatible_encoding:
+            content_bytes = decompress_payload(content_bytes, encoding, REASSEMBLY_MAX_CLIENT_BYTES)
+            encoding = ENCODING_NONE
+        return self._build_file_packets(content_bytes, (ip, port, username), max_buff, False, encoding, target_kind, target,
+                                        message_id, timestamp)
+
+    def _check_upload_target(self, client_address, target_kind, target):
+        """Confere o destino de um upload; avisa o remetente e retorna False se ele for inválido."""
+        if target_kind == TARGET_ROOM:
+            if client_address in self.rooms.get(target, ()):
+                return True
+            self._notify_client(client_address, f"Você não está na sala #{target}.")
+        elif target_kind == TARGET_USER:
+            target_addr = self.usernames.get(target)
+            if target_addr is None:
+                self._notify_client(client_address, f"Usuário {target} não está conectado.")
+            elif target_addr in self.text_clients: # O protocolo de texto não tem mensagens privadas
+                self._notify_client(client_address, f"{target} usa um cliente antigo, sem mensagens privadas.")
+            else:
+                return True
+        else:
+            print(f"[DEBUG_SERVER] MSG_UPLOAD_START de {client_address} com tipo de destino inválido ({target_kind}).")
+        return False
+
+    def _on_upload_start(self, client_address, text_protocol, message_id, num_packets, encoding, target_kind, target):
+        """Cliente quer enviar uma mensagem: registra o id e o número de fragmentos do upload."""
+        if client_address not in self.clients: # Verifica se o cliente está registrado
+            print(f"[DEBUG_SERVER] Cliente não registrado {client_address} tentou MSG_UPLOAD_START. Ignorando.")
+            return
+        if num_packets <= 0:
+            print(f"[DEBUG_SERVER] MSG_UPLOAD_START inválido de {client_address}: {num_packets} fragmentos")
+            return
+        if encoding != ENCODING_NONE and encoding not in self.client_encodings.get(client_address, ()):
+            print(f"[DEBUG_SERVER] MSG_UPLOAD_START de {client_address} com compressão não negociada ({encoding}). Ignorando.")
+            return
+        if not self._check_upload_target(client_address, target_kind, target):
+            return
+        if message_id is None: # 'MSG_UPLOAD_START:<n>': os próximos n datagramas do cliente são os pedaços, em ordem
+            self.incoming_file_parts.discard_sender(client_address) # Um upload anterior dele não vai mais terminar
+            self.legacy_uploads[client_address] = [0, num_packets]
+            message_id = LEGACY_MESSAGE_ID
+        # Remetente, compressão do conteúdo e destino (sala ou usuário)
+        meta = {'username': self.clients[client_address], 'encoding': encoding, 'target_kind': target_kind, 'target': target}
+        ack_tracker = self.ack_trackers.get(client_address)
+        if ack_tracker is not None:
+            already_delivered = ack_tracker.is_delivered_id(message_id)
+            self._send_packets((ack_tracker.on_header(message_id, num_packets),), client_address)
+            if already_delivered: # Cabeçalho retransmitido de mensagem já entregue
+                return
+        # Os fragmentos podem ter chegado antes do cabeçalho; nesse caso a mensagem já fica completa
+        try:
+            completed = self.incoming_file_parts.set_header(client_address, message_id, num_packets, meta)
+        except ValueError as e: # Upload acima do limite de memória
+            print(f"[DEBUG_SERVER] MSG_UPLOAD_START recusado de {client_address}: id {message_id} ({e})")
+            if ack_tracker is not None: # Mensagem descartada: não precisa mais acompanhá-la
+                ack_tracker.forget(message_id)
+            return
+        if completed is not None:
+            self._relay_completed_message(client_address, *completed)
+
+    def _on_legacy_fragment(self, client_address, legacy_upload, data):
+        """Pedaço sem cabeçalho de um cliente antigo: recebe o cabeçalho de fragmento com o próximo índice e vai para a remontagem."""
+        seq, total = legacy_upload
+        if seq + 1 < total:
+            legacy_upload[0] = seq + 1
+        else: # Último pedaço: os próximos datagramas do cliente voltam a ser comandos
+            del self.legacy_uploads[client_address]
+        if (client_address, LEGACY_MESSAGE_ID) not in self.incoming_file_parts.pending:
+            return # Upload recusado (limite de memória) ou expirado: o resto dele é descartado
+        try:
+            completed = self.incoming_file_parts.add_fragment(client_address, frame_fragment(LEGACY_MESSAGE_ID, seq, total, data))
+        except ValueError as e:
+            print(f"[DEBUG_SERVER] Fragmento inválido de {client_address}: {e}")
+            return
+        if completed is not None:
+            self._relay_completed_message(client_address, *completed)
+
+    def _relay_completed_message(self, client_address, meta, full_message_content_bytes):
+        """Retransmite uma mensagem recém-remontada para os outros clientes e a loga no console."""
+        client_ip, client_port = client_address
+        original_sender_username = meta['username'] # Pega o nome do remetente
+        content = MessageContent(full_message_content_bytes, meta.get('encoding', ENCODING_NONE))
+        self.metrics.messages_relayed += 1
+        if content.encoding != ENCODING_NONE:
+            self.metrics.messages_compressed += 1
+
+        # Retransmite a mensagem para a sala ou para o destinatário (o conteúdo comprimido segue como chegou)
+        original_sender_info_tuple = (client_ip, client_port, original_sender_username)
+        target = meta.get('target', DEFAULT_ROOM)
+        if meta.get('target_kind', TARGET_ROOM) == TARGET_USER:
+            target_addr = self.usernames.get(target)
+            if target_addr is None: # Saiu enquanto a mensagem era recebida
+                self._notify_client(client_address, f"Usuário {target} não está conectado.")
+                return
+            self.send_direct_message(target_addr, content, original_sender_info_tuple)
+            log_target = f"@{target}"
+        else:
+            self.broadcast_file_content(content, original_sender_info_tuple, sender_address=client_address, room=target)
+            log_target = "" if target == DEFAULT_ROOM else f"#{target}"
+
+        # Loga a mensagem no console do servidor; só aqui o servidor precisa do texto (e de descomprimi-lo)
+        if not self.chat_log:
+            return
+        try:
+            full_message_content_bytes = self._decompress_for_relay(content)
+        except ValueError as e:
+            print(f"[DEBUG_SERVER] Mensagem comprimida inválida de {client_address}: {e}")
+            return
+        message_text_from_client = ""
+        try: # Tenta decodificar o conteúdo do arquivo como UTF-8
+            message_text_from_client = full_message_content_bytes.decode('utf-8')
+        except UnicodeDecodeError: # Fallback se não for UTF-8 válido
+            message_text_from_client = full_message_content_bytes.decode('latin-1', errors='replace')
+            print(f"[DEBUG_SERVER] Mensagem de {client_address} decodificada com fallback (latin-1).")
+        server_timestamp = get_current_timestamp()
+        self._log_server_chat_message(client_ip, client_port, original_sender_username, message_text_from_client, server_timestamp,
+                                      log_target)
+
+    def add_client(self, client_address, username, options=None):
+        """Adiciona um cliente à sala, responde às opções pedidas no HELLO e notifica os demais.
+
+        Clientes do protocolo binário sempre recebem o WELCOME; os de texto, só se pediram opções.
+        """
+        self._register_client(client_address, username)
+        self._mark_history(client_address, DEFAULT_ROOM)
+        heartbeat = False
+        if self.rate_controller_factory is not None and client_address not in self.rate_controllers:
+            self.rate_controllers[client_address] = self.rate_controller_factory()
+        if options or client_address not in self.text_clients: # Responde com as opções aceitas
+            accepted = {}
+            if options and 'max_buff' in options: # Datagramas maiores (ex: MTU do caminho) reduzem o número de pacotes
+                try:
+                    requested = int(options['max_buff'])
+                except ValueError:
+                    requested = self.MAX_BUFF
+                max_buff = max(MIN_DATAGRAM_SIZE, min(requested, self.max_datagram))
+                self.client_max_buff[client_address] = max_buff
+                accepted['max_buff'] = str(max_buff)
+            if options and options.get('reliable') == '1' and self.supports_reliable:
+                # Janela e frequência de ACKs dependem do tamanho de datagrama negociado (o mesmo nos dois sentidos)
+                window = window_for_datagram(self.client_max_buff.get(client_address, self.MAX_BUFF))
+                self.reliable_senders[client_address] = ReliableSender(window=window, rate_controller=self.rate_controllers.get(client_address))
+                self.ack_trackers[client_address] = AckTracker(ack_every=ack_every_for_window(window))
+                accepted['reliable'] = '1'
+            if options and options.get('heartbeat') == '1' and self.supports_heartbeat and client_address not in self.text_clients:
+                heartbeat = True
+                self.silent_clients.discard(client_address)
+                self._watch_liveness(client_address, self.client_timeout)
+                accepted['heartbeat'] = f"{self.heartbeat_interval:g}" # Intervalo em que o cliente deve dar sinal de vida
+            if options and options.get('history') == '1' and self.history is not None and client_address not in self.text_clients:
+                accepted['history'] = '1' # O cliente pode pedir as mensagens anteriores das salas (HISTORY)
+            if options and 'compress' in options and self.supports_compression and client_address not in self.text_clients:
+                encodings = parse_compress_option(options['compress']) # Codecs que o cliente descomprime, disponíveis aqui
+                if encodings:
+                    self.client_encodings[client_address] = frozenset(encodings)
+                    accepted['compress'] = format_compress_option(encodings)
+            self._send_packets((self._encode_for(client_address, WELCOME, accepted),), client_address)
+        rate_controller = self.rate_controllers.get(client_address)
+        if rate_controller is not None and client_address not in self.reliable_senders: # Sem ACKs, o AIMD não tem sinais
+            rate_controller.without_feedback(self.client_max_buff.get(client_address, self.MAX_BUFF))
+        if not heartbeat:
+            # Sem heartbeat (protocolo de texto, clientes legados ou binários que não o pediram), um cliente ocioso não
+            # manda nada: só uma inatividade bem mais longa o remove, e nenhum ping é enviado (não saberiam responder)
+            self.silent_clients.add(client_address)
+            self._watch_liveness(client_address, self.idle_client_timeout)
+        self._log_server_notification(f"{username} entrou na sala.") # Log no servidor
+        # Notifica os outros membros da sala padrão
+        self.broadcast_to_clients(NOTIFY, f"{username} entrou na sala.", sender_address=client_address, room=DEFAULT_ROOM)
+
+    def _watch_liveness(self, client_address, timeout):
+        """Passa a expirar o cliente depois de `timeout` segundos sem nenhum datagrama (a partir de agora)."""
+        now = time.monotonic()
+        self.last_seen[client_address] = now
+        self.liveness_wheel.schedule(client_address, now + timeout)
+
+    def _register_client(self, client_address, username):
+        """Registra o cliente (nome, índice de nomes e sala padrão), sem notificações."""
+        previous = self.clients.get(client_address)
+        if previous is not None and previous != username and self.usernames.get(previous) == client_address:
+            del self.usernames[previous] # Novo HELLO com outro nome
+        self.clients[client_address] = username # Adiciona cliente à lista
+        self.usernames[username] = client_address
+        self._add_member(client_address, DEFAULT_ROOM)
+
+    def _unregister_client(self, client_address):
+        """Remove o cliente dos índices, sem notificações; retorna (nome, salas em que estava) ou None."""
+        username = self.clients.pop(client_address, None)
+        if username is None:
+            return None
+        if self.usernames.get(username) == client_address:
+            del self.usernames[username]
+        rooms = self.client_rooms.pop(client_address, set())
+        for room in rooms:
+            members = self.rooms.get(room)
+            if members is not None:
+                members.discard(client_address)
+                if not members:
+                    del self.rooms[room]
+        return username, rooms
+
+    def _add_member(self, client_address, room):
+        """Coloca o cliente na sala (só os índices); retorna False se ele já era membro."""
+        members = self.rooms.get(room)
+        if members is None:
+            members = self.rooms[room] = set()
+        elif client_address in members:
+            return False
+        members.add(client_address)
+        self.client_rooms.setdefault(client_address, set()).add(room)
+        return True
+
+    def _remove_member(self, client_address, room):
+        """Tira o cliente da sala (só os índices); retorna False se ele não era membro."""
+        members = self.rooms.get(room)
+        if members is None or client_address not in members:
+            return False
+        members.discard(client_address)
+        if not members:
+            del self.rooms[room]
+        self.client_rooms[client_address].discard(room)
+        return True
+
+    @staticmethod
+    def _room_label(room):
+        return "" if room == DEFAULT_ROOM else f"#{room}"
+
+    def _room_notification(self, username, action, room, reason=""):
+        """Texto da notificação de entrada/saída (a sala padrão mantém o texto de quando só havia uma sala)."""
+        if room == DEFAULT_ROOM:
+            return f"{username} {action} sala{reason}."
+        return f"{username} {action} sala {self._room_label(room)}{reason}."
+
+    def _leave_notification(self, usernames, room, reason=""):
+        """Notificação de saída de um ou de vários clientes da mesma sala (uma só, em lote)."""
+        if len(usernames) == 1:
+            return self._room_notification(usernames[0], "saiu da", room, reason)
+        names = ", ".join(usernames[:LEAVE_NOTIFY_MAX_NAMES])
+        if len(usernames) > LEAVE_NOTIFY_MAX_NAMES:
+            names += f" e mais {len(usernames) - LEAVE_NOTIFY_MAX_NAMES}"
+        return self._room_notification(names, "saíram da", room, reason)
+
+    def join_room(self, client_address, room):
+        """Coloca um cliente conectado em uma sala e notifica os membros; retorna False se ele já estava nela."""
+        if not self._add_member(client_address, room):
+            return False
+        self._mark_history(client_address, room)
+        notification = self._room_notification(self.clients[client_address], "entrou na", room)
+        self._log_server_notification(notification)
+        self.broadcast_to_clients(NOTIFY, notification, sender_address=client_address, room=room)
+        return True
+
+    def leave_room(self, client_address, room):
+        """Tira um cliente de uma sala e notifica os membros restantes; retorna False se ele não estava nela."""
+        if not self._remove_member(client_address, room):
+            return False
+        self.history_marks.get(client_address, {}).pop(room, None)
+        notification = self._room_notification(self.clients[client_address], "saiu da", room)
+        self._log_server_notification(notification)
+        self.broadcast_to_clients(NOTIFY, notification, room=room)
+        return True
+
+    def _mark_history(self, client_address, room):
+        """Guarda a mensagem mais recente da sala na entrada do cliente: o histórico pedido logo depois vai só até ela."""
+        if self.history is not None:
+            self.history_marks.setdefault(client_address, {})[room] = self.history.last_id(room)
+
+    def remove_client(self, client_address, reason=""):
+        """Remove um cliente do servidor, notifica as salas em que ele estava e descarta uploads pendentes dele."""
+        self.remove_clients((client_address,), reason)
+
+    def remove_clients(self, client_addresses, reason=""):
+        """Remove vários clientes de uma vez, com uma única notificação de saída por sala afetada."""
+        leaving = {} # {sala: [nomes dos que saíram]}
+        for client_address in client_addresses:
+            removed = self._unregister_client(client_address)
+            if removed is not None: # Notifica as salas se o cliente estava conectado
+                username, rooms = removed
+                for room in rooms:
+                    leaving.setdefault(room, []).append(username)
+            self._discard_client_state(client_address)
+        for room, usernames in leaving.items():
+            notification = self._leave_notification(usernames, room, reason)
+            self._log_server_notification(notification) # Log no servidor
+            self.broadcast_to_clients(NOTIFY, notification, room=room)
+
+    def _discard_client_state(self, client_address):
+        """Descarta todo o estado por cliente fora dos índices de nomes e salas (remontagem, entrega confiável,
+        controle de taxa, fila de saída, histórico, opções negociadas, métricas e verificação de atividade)."""
+        self.incoming_file_parts.discard_sender(client_address) # Limpa buffers de mensagens incompletas, se houver
+        self.reliable_senders.pop(client_address, None)
+        self.ack_trackers.pop(client_address, None)
+        self.rate_controllers.pop(client_address, None)
+        self.outbound_queues.pop(client_address, None)
+        self._slow_consumers.discard(client_address)
+        self.history_replays.pop(client_address, None)
+        self.history_marks.pop(client_address, None)
+        self.client_max_buff.pop(client_address, None)
+        self.text_clients.discard(client_address)
+        self.legacy_clients.discard(client_address)
+        self.legacy_uploads.pop(client_address, None)
+        self.client_encodings.pop(client_address, None)
+        self.metrics.forget_peer(client_address)
+        if self.last_seen.pop(client_address, None) is not None:
+            self.liveness_wheel.cancel(client_address)
+            self.silent_clients.discard(client_address)
+
+    def service_reliability(self):
+        """Retransmite pacotes cujo timeout venceu; retorna True se ainda há pacotes confiáveis em trânsito."""
+        if not self.reliable_senders:
+            return False
+        now = time.monotonic()
+        if now >= self._next_reliability_check: # Verifica no máximo uma vez por RELIABILITY_TICK
+            self._next_reliability_check = now + RELIABILITY_TICK
+            for client_addr, reliable_sender in list(self.reliable_senders.items()):
+                if reliable_sender.has_pending():
+                    try:
+                        self._send_packets(reliable_sender.poll(now), client_addr)
+                    except Exception as e:
+                        print(f"[DEBUG_SERVER] Erro ao retransmitir para {client_addr}: {e}")
+                        self.metrics.record_send_error(client_addr)
+        return any(reliable_sender.has_pending() for reliable_sender in self.reliable_senders.values())
+
+    def service_send_queues(self):
+        """Desconecta os consumidores lentos e envia mais uma rodada de cada fila de saída (um cliente por vez, no
+        máximo SEND_BURST_PACKETS pacotes de cada); retorna True se ainda há pacotes nas filas."""
+        if self._slow_consumers:
+            slow_consumers = list(self._slow_consumers)
+            self.metrics.slow_consumers_disconnected += len(slow_consumers)
+            self.remove_clients(slow_consumers, reason=" (fila de envio cheia)")
+            self._slow_consumers.clear()
+        if not self.outbound_queues:
+            return False
+        now = time.monotonic()
+        for client_addr, queue in list(self.outbound_queues.items()):
             try:
-                # Espera receber dados de algum cliente
-                data, client_address = self.sckt.recvfrom(self.MAX_BUFF)
-                # Processa a mensagem recebida
-                self.handle_client_message(data, client_address)
+                self._drain_send_queue(client_addr, queue, now)
+            except Exception as e:
+                print(f"[DEBUG_SERVER] Erro ao enviar fila de saída para {client_addr}: {e}")
+                self.metrics.record_send_error(client_addr)
+                self.outbound_queues.pop(client_addr, None)
+        return bool(self.outbound_queues)
 
-            except skt.timeout: # Se o socket tiver timeout
+    def service_history(self):
+        """Reenvia mais um trecho dos históricos pedidos (até HISTORY_REPLAY_BURST_PACKETS pacotes por cliente);
+        retorna True se ainda falta enviar algum."""
+        if not self.history_replays:
+            return False
+        for client_addr, replays in list(self.history_replays.items()):
+            budget = self._replay_budget(client_addr)
+            while replays and budget > 0:
+                room = next(iter(replays)) # Uma sala de cada vez, na ordem dos pedidos
+                cursor = replays[room]
+                entry = self.history.after(room, cursor[0])
+                if entry is None or entry.message_id > cursor[1]:
+                    del replays[room]
+                    continue
+                cursor[0] = entry.message_id
+                try:
+                    packets = self._history_packets_for(client_addr, entry.packets)
+                except ValueError as e:
+                    print(f"[DEBUG_SERVER] Mensagem do histórico inválida não reenviada para {client_addr}: {e}")
+                    continue
+                self.send_file_content_to_client(client_addr, None, None, packets=packets)
+                self.metrics.history_messages_replayed += 1
+                budget -= len(packets)
+            if not replays:
+                del self.history_replays[client_addr]
+        return bool(self.history_replays)
+
+    def _replay_budget(self, client_addr):
+        """Pacotes de histórico que ainda podem ir para o cliente agora: o reenvio espera a fila de saída dele andar."""
+        queued = len(self.outbound_queues.get(client_addr, ()))
+        return min(HISTORY_REPLAY_BURST_PACKETS - queued, self.send_queue_limit - queued)
+
+    def service_reassembly(self):
+        """Descarta os uploads incompletos sem atividade há mais de REASSEMBLY_IDLE_TIMEOUT."""
+        for client_addr, message_id in self.incoming_file_parts.expire():
+            print(f"[DEBUG_SERVER] Upload incompleto {message_id} de {client_addr} descartado por inatividade.")
+            ack_tracker = self.ack_trackers.get(client_addr)
+            if ack_tracker is not None:
+                ack_tracker.forget(message_id)
+
+    def service_liveness(self, now=None):
+        """Remove os clientes sem nenhum datagrama há mais de client_timeout (idle_client_timeout para os sem
+        heartbeat); só olha os prazos já vencidos na roda."""
+        if not self.last_seen:
+            return
+        now = time.monotonic() if now is None else now
+        last_seen, wheel, silent_clients = self.last_seen, self.liveness_wheel, self.silent_clients
+        expired = []
+        for client_address in wheel.expire(now):
+            seen = last_seen.get(client_address)
+            if seen is None:
                 continue
-            except ConnectionResetError: # Quando um cliente "desaparece"
-                print(f"[DEBUG_SERVER] Conexão resetada por {client_address}. Limpando.")
-                if client_address in self.clients: # Remove cliente se estava na lista
-                    username = self.clients.pop(client_address)
-                    self._log_server_notification(f"{username} saiu da sala (conexão perdida).")
-                    # Notifica outros clientes
-                    notification_for_clients = f"NOTIFY:{username} saiu da sala (conexão perdida)."
-                    self.broadcast_to_clients(notification_for_clients.encode('utf-8'))
-                if client_address in self.incoming_file_parts: # Limpa buffer de arquivo
-                    del self.incoming_file_parts[client_address]
-            except Exception as e: # Captura outras exceções no loop principal
-                print(f"[DEBUG_SERVER] Erro geral no loop run: {e}")
-                import traceback # Para debug mais detalhado
-                traceback.print_exc()
+            deadline = seen + (self.idle_client_timeout if client_address in silent_clients else self.client_timeout)
+            if deadline > now: # Deu sinal de vida desde o agendamento: reagenda a partir do último datagrama
+                wheel.schedule(client_address, deadline)
+            else:
+                expired.append(client_address)
+        if expired:
+            print(f"[DEBUG_SERVER] {len(expired)} cliente(s) sem sinal de vida no tempo limite. Removendo.")
+            self.metrics.clients_expired += len(expired)
+            self.remove_clients(expired, reason=" (tempo esgotado)")
+
+    def _idle_wait(self):
+        """Espera máxima por datagramas sem tarefas ativas: a resolução da roda, se há clientes conectados."""
+        return self.liveness_wheel.resolution if self.last_seen else None
+
+    def _next_wait(self, busy):
+        """Espera máxima do loop após as tarefas periódicas: nenhuma se alguma fila sem pacing ainda tem pacotes (a
+        próxima rodada não depende de fichas), RELIABILITY_TICK se há tarefas ativas, senão a espera ociosa."""
+        if self.outbound_queues and any(client_addr not in self.rate_controllers for client_addr in self.outbound_queues):
+            return 0
+        return RELIABILITY_TICK if busy else self._idle_wait()
+
+    def service_timers(self):
+        """Executa as tarefas periódicas (reenvio de histórico, retransmissões, filas de saída e expiração de uploads e
+        de clientes); retorna True se alguma ainda está ativa."""
+        start = time.perf_counter_ns()
+        self.service_reassembly()
+        self.service_liveness()
+        history_busy = self.service_history()
+        reliability_busy = self.service_reliability()
+        busy = self.service_send_queues() or reliability_busy or history_busy
+        self.metrics.observe('timers', start)
+        return busy
+
+    def stats(self):
+        """Estado atual do servidor: clientes (com taxa de envio, fila de saída, descartes e erros de cada um), memória da remontagem
+        e do histórico e métricas (contadores e latências)."""
+        peers = {}
+        now = time.monotonic()
+        for client_addr, username in self.clients.items():
+            rate_controller = self.rate_controllers.get(client_addr)
+            peers[f"{client_addr[0]}:{client_addr[1]}"] = {
+                'username': username,
+                'pacing': rate_controller.name if rate_controller is not None else None,
+                'rate_pps': round(rate_controller.rate, 1) if rate_controller is not None else None,
+                'queued_packets': len(self.outbound_queues.get(client_addr, ())),
+                'dropped_packets': self.metrics.peer_dropped_packets.get(client_addr, 0),
+                'reliable': client_addr in self.reliable_senders,
+                'send_errors': self.metrics.peer_send_errors.get(client_addr, 0),
+                'rooms': len(self.client_rooms.get(client_addr, ())),
+                'idle_seconds': round(now - self.last_seen[client_addr], 1) if client_addr in self.last_seen else None,
+                'history_queued': len(self.history_replays.get(client_addr, ())),
+            }
+        return {'clients': len(self.clients), 'rooms': len(self.rooms), 'peers': peers, 'reassembly': self.incoming_file_parts.stats(),
+                'history': self.history.stats() if self.history is not None else None, 'metrics': self.metrics.snapshot()}
+
+    def _stats_reply(self, prometheus=False):
+        """Monta a resposta a um CMD:STATS, omitindo os detalhes por cliente se ela não couber em um datagrama."""
+        import json # Só carregado na primeira consulta de métricas
+        stats = self.stats()
+        body = format_prometheus(stats) if prometheus else json.dumps(stats)
+        reply = ("CMD:STATS\n" + body).encode('utf-8')
+        if len(reply) > MAX_DATAGRAM_SIZE: # Sala muito grande
+            stats['peers'] = {}
+            stats['peers_omitted'] = True
+            body = format_prometheus(stats, include_peers=False) if prometheus else json.dumps(stats)
+            reply = ("CMD:STATS\n" + body).encode('utf-8')
+        return reply
+
+    def serve_one_datagram(self):
+        """Recebe um datagrama de algum cliente e o processa, tratando os erros de socket."""
+        try:
+            # Espera receber dados de algum cliente
+            data, client_address = self.sckt.recvfrom(MAX_DATAGRAM_SIZE) # Nunca trunca, qualquer que seja o tamanho negociado
+            self._last_client_address = client_address
+            # Processa a mensagem recebida
+            self._handle_datagram(data, client_address)
+
+        except (skt.timeout, BlockingIOError): # Se o socket tiver timeout (ou espera zero, com filas de saída pendentes)
+            return
+        except ConnectionResetError: # Quando um cliente "desaparece"
+            client_address = self._last_client_address # O erro se refere ao último endereço conhecido
+            print(f"[DEBUG_SERVER] Conexão resetada por {client_address}. Limpando.")
+            self.remove_client(client_address, reason=" (conexão perdida)")
+        except Exception as e: # Captura outras exceções no loop principal
+            print(f"[DEBUG_SERVER] Erro geral no loop run: {e}")
+            import traceback # Só carregado quando há um erro a detalhar
+            traceback.print_exc() # Para debug mais detalhado
+
+    def serve_datagram_batch(self, timeout=None):
+        """Com E/S em lote: espera até `timeout` segundos, processa todos os datagramas disponíveis
+        (até um lote) e envia as respostas de uma vez no final."""
+        try:
+            batch = self.io.receive(timeout)
+        except OSError as e:
+            print(f"[DEBUG_SERVER] Erro ao receber datagramas: {e}")
+            return
+        with self._batched_sends():
+            for data, client_address in batch:
+                self._last_client_address = client_address
+                try:
+                    self._handle_datagram(data, client_address)
+                except Exception as e: # Um datagrama ruim não descarta o resto do lote
+                    print(f"[DEBUG_SERVER] Erro geral no loop run: {e}")
+                    import traceback
+                    traceback.print_exc()
+
+    def _handle_datagram(self, data, client_address):
+        """Processa um datagrama recebido, contabilizando-o nas métricas."""
+        metrics = self.metrics
+        metrics.packets_in += 1
+        metrics.bytes_in += len(data)
+        if client_address in self.last_seen: # Qualquer datagrama conta como sinal de vida
+            self.last_seen[client_address] = time.monotonic()
+        start = time.perf_counter_ns()
+        self.handle_client_message(data, client_address)
+        metrics.observe('handle', start)
+
+    def run(self):
+        """Loop principal do servidor que escuta por mensagens de clientes e as processa."""
+        wait = None
+        while True: # Loop infinito para manter o servidor rodando
+            # Com pacotes confiáveis em trânsito ou filas de saída, a espera precisa acordar periodicamente
+            # (e, com clientes a expirar, a cada resolução da roda de timers)
+            if self.io is not None:
+                self.serve_datagram_batch(wait)
+            else:
+                self.serve_one_datagram()
+            with self._batched_sends():
+                busy = self.service_timers()
+            next_wait = self._next_wait(busy)
+            if next_wait != wait:
+                wait = next_wait
+                if self.io is None:
+                    self.sckt.settimeout(wait)
 
 
     def close(self):
         """Fecha o socket do servidor de forma limpa."""
         print("Servidor de Chat encerrando.")
         self.sckt.close()
+        self.metrics.close()
+        self.set_history(None) # Com log, grava nele o histórico em memória
+
+
+def add_history_arguments(parser):
+    """Opções de linha de comando do histórico das salas (compartilhadas pelos servidores síncrono e asyncio)."""
+    parser.add_argument('--history-messages', type=int, default=HISTORY_MAX_MESSAGES,
+                        help="Mensagens guardadas em memória por sala para o histórico (0 desativa o histórico)")
+    parser.add_argument('--history-bytes', type=int, default=HISTORY_MAX_BYTES, help="Bytes guardados em memória por sala para o histórico")
+    parser.add_argument('--history-total-bytes', type=int, default=HISTORY_MAX_TOTAL_BYTES,
+                        help="Bytes guardados em memória para o histórico somando todas as salas")
+    parser.add_argument('--history-log', default=None,
+                        help="Arquivo de log (só acréscimos, lido com mmap) que recebe as mensagens que saem da memória")
+    parser.add_argument('--history-log-bytes', type=int, default=HISTORY_LOG_MAX_BYTES, help="Tamanho máximo do arquivo de log do histórico")
+
+
+def add_send_queue_arguments(parser):
+    """Opções de linha de comando das filas de saída por cliente (compartilhadas pelos servidores síncrono e asyncio)."""
+    parser.add_argument('--send-queue', type=positive_count("Limite da fila de saída"), default=SEND_QUEUE_MAX_PACKETS,
+                        help="Pacotes pendentes por cliente na fila de saída antes de aplicar a política de fila cheia")
+    parser.add_argument('--overflow', choices=OVERFLOW_POLICIES, default=DROP_NEWEST,
+                        help="Fila de saída cheia: descarta as mensagens mais antigas, a nova, ou desconecta o cliente lento")
+
+
+def history_from_args(args):
+    """MessageHistory configurado pelas opções de add_history_arguments (None se o histórico foi desativado)."""
+    if args.history_messages <= 0:
+        return None
+    return MessageHistory(args.history_messages, args.history_bytes, args.history_total_bytes, log_path=args.history_log,
+                          log_max_bytes=args.history_log_bytes)
+
+
+def main(argv=None):
+    """Ponto de entrada do servidor (`python server_chat.py` ou o comando `chat-server` do pacote instalado)."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Servidor de Chat UDP.")
+    add_network_arguments(parser, SERVER_HOST, SERVER_PORT, MAX_BUFF_SIZE, 'BIND', "Endereço em que o servidor escuta")
+    parser.add_argument('--workers', type=positive_count("Número de workers"), default=env_default('WORKERS', 1),
+                        help="Número de processos servidores na mesma porta (SO_REUSEPORT) (ambiente: CHAT_WORKERS)")
+    parser.add_argument('--pacing', type=pacing_argument, default=DEFAULT_PACING, help=f"Controle de taxa por cliente: none, fixed:<pacotes/s>, aimd ou aimd:<inicial>:<máxima> (padrão: {DEFAULT_PACING}). O AIMD se ajusta com os ACKs da entrega confiável; sem --reliable vira uma taxa fixa de ~10 MB/s (entrega completa em loopback); use fixed:/none para mais vazão, aceitando perdas")
+    parser.add_argument('--max-datagram', type=datagram_size, default=MAX_DATAGRAM_SIZE, help="Maior tamanho de datagrama aceito na negociação com os clientes")
+    parser.add_argument('--profile-file', default=None, help="Grava uma amostra das latências internas neste arquivo (perfil amostral)")
+    parser.add_argument('--io', choices=('batch', 'simple'), default='batch',
+                        help="batch: recvmmsg/sendmmsg/UDP GSO quando disponíveis; simple: um recvfrom/sendto por datagrama")
+    parser.add_argument('--no-chat-log', action='store_true',
+                        help="Não loga as mensagens da sala no console (nem descomprime as que chegam comprimidas)")
+    add_history_arguments(parser)
+    add_send_queue_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.workers > 1: # Modo multi-core: um processo por worker, todos escutando na mesma porta
+        from server_workers import run_workers
+        run_workers(args.host, args.port, args.buffer_size, args.workers, pacing=args.pacing, max_datagram=args.max_datagram,
+                    profile_path=args.profile_file, batch_io=args.io == 'batch', chat_log=not args.no_chat_log,
+                    send_queue=(args.send_queue, args.overflow), socket_buffers=(args.rcvbuf, args.sndbuf))
+    else:
+        # Cria e inicia a instância do servidor
+        server = UDPServer(args.host, args.port, args.buffer_size, pacing=args.pacing, max_datagram=args.max_datagram,
+                           profile_path=args.profile_file, batch_io=args.io == 'batch', rcvbuf=args.rcvbuf, sndbuf=args.sndbuf)
+        server.chat_log = not args.no_chat_log
+        server.set_history(history_from_args(args))
+        server.set_send_queue(args.send_queue, args.overflow)
+        try:
+            server.run() # Mantém o servidor rodando
+        except KeyboardInterrupt: # Permite encerrar o servidor com Ctrl+C
+            print("\nServidor interrompido pelo usuário.")
+        finally: # Bloco executado sempre, mesmo se houver exceção ou interrupção
+            server.close() # Garante que o socket do servidor seja fechado
 
 
 if __name__ == '__main__':
-    # Cria e inicia a instância do servidor
-    server = UDPServer(SERVER_HOST, SERVER_PORT, MAX_BUFF_SIZE)
-    try:
-        server.run() # Mantém o servidor rodando
-    except KeyboardInterrupt: # Permite encerrar o servidor com Ctrl+C
-        print("\nServidor interrompido pelo usuário.")
-    finally: # Bloco executado sempre, mesmo se houver exceção ou interrupção
-        server.close() # Garante que o socket do servidor seja fechado
\ No newline at end of file
+    main()
@@ -0,0 +1,274 @@
+# server_workers.py
+# Modo multi-core do servidor: N processos escutando na mesma porta com SO_REUSEPORT.
+# O kernel distribui os datagramas pelo endereço de origem, então todos os pacotes de um
+# cliente (e a remontagem dos uploads dele) ficam sempre no mesmo worker. A lista de
+# membros da sala é replicada entre os workers por sockets Unix locais.
+import itertools
+import multiprocessing
+import os
+import selectors
+import shutil
+import signal
+import socket as skt
+import tempfile
+from collections import deque
+
+from chat_protocol import MAX_DATAGRAM_SIZE, format_compress_option, parse_compress_option
+from server_chat import UDPServer
+
+IPC_RECV_SIZE = 4096    # Maior evento de registro (o nome de usuário é limitado pelo protocolo)
+IPC_RETRY_WAIT = 0.005  # Espera máxima do loop enquanto há eventos aguardando espaço na fila de outro worker
+PARENT_CHECK_INTERVAL = 1.0 # Segundos entre verificações de que o processo principal ainda existe
+
+
+def _ipc_path(ipc_dir, worker_id):
+    """Caminho do socket Unix de um worker."""
+    return os.path.join(ipc_dir, f"worker-{worker_id}.sock")
+
+
+def _exit_on_sigterm(signum, frame):
+    """Trata o SIGTERM (kill, systemd, docker stop...) como uma saída normal, para os blocos finally rodarem."""
+    raise SystemExit(128 + signum)
+
+
+class WorkerUDPServer(UDPServer):
+    """UDPServer que compartilha a porta com outros workers e replica entre eles as entradas/saídas de clientes e salas."""
+    def __init__(self, host, port, max_buff, worker_id, num_workers, ipc_dir, pacing=None, max_datagram=MAX_DATAGRAM_SIZE,
+                 profile_path=None, batch_io=True, rcvbuf=None, sndbuf=None):
+        """Faz o bind com SO_REUSEPORT e abre o canal local de registro de membros."""
+        # Cada worker grava o próprio perfil amostral (arquivo com sufixo do worker)
+        super().__init__(host, port, max_buff, reuse_port=True, pacing=pacing, max_datagram=max_datagram,
+                         profile_path=f"{profile_path}.worker{worker_id}" if profile_path else None, batch_io=batch_io,
+                         rcvbuf=rcvbuf, sndbuf=sndbuf)
+        self.worker_id = worker_id
+        # Os ACKs de um cliente sempre chegam ao worker dono dele, não ao worker que retransmitiu
+        # a mensagem; por isso a entrega confiável não é oferecida neste modo.
+        self.supports_reliable = False
+        # Cada worker só guarda as mensagens que ele mesmo retransmite (e numera os ids por conta própria),
+        # então o histórico das salas também não é oferecido neste modo.
+        self.set_history(None)
+        # Os workers respondem pela mesma porta e os fragmentos só trazem o id da mensagem, então o cliente não
+        # distingue quem a retransmitiu: cada worker numera as suas em uma classe de resto própria (worker_id
+        # módulo uma potência de 2 >= num_workers, que divide MESSAGE_ID_MODULO e se mantém quando os ids dão a
+        # volta), e mensagens simultâneas de workers diferentes nunca têm o mesmo id no cliente.
+        id_step = 1 << (num_workers - 1).bit_length()
+        self._message_ids = itertools.count(id_step + worker_id, id_step)
+        print(f"[WORKER {worker_id}] pid {os.getpid()}")
+
+        # Canal de registro: cada worker recebe eventos JOIN/LEAVE (e ROOM_JOIN/ROOM_LEAVE) no seu próprio socket Unix
+        self.ipc_sckt = skt.socket(skt.AF_UNIX, skt.SOCK_DGRAM)
+        self.ipc_sckt.bind(_ipc_path(ipc_dir, worker_id))
+        # A fila de um socket Unix de datagramas é curta (net.unix.max_dgram_qlen, ex: 10), e uma rajada de
+        # entradas gera dezenas de eventos; com envios bloqueantes, dois workers com as filas um do outro
+        # cheias travariam juntos. Por isso o canal não bloqueia: o que não cabe espera na fila local do
+        # worker de destino e é reenviado pelo loop, na ordem.
+        self.ipc_sckt.setblocking(False)
+        self.peer_paths = [_ipc_path(ipc_dir, i) for i in range(num_workers) if i != worker_id]
+        self.ipc_backlog = {} # {caminho do worker: deque de eventos que ainda não couberam na fila dele}
+        # Se o processo principal morrer sem encerrar os workers (ex: SIGKILL), o worker é adotado por outro processo
+        # e o getppid() muda: o loop verifica isso periodicamente e sai, em vez de ficar órfão segurando a porta.
+        self.parent_pid = os.getppid()
+
+    def _publish_registry_event(self, event, client_address, detail=""):
+        """Envia um evento de registro ('<evento>:<ip>:<porta>:<detalhe>') para todos os outros workers."""
+        event_bytes = f"{event}:{client_address[0]}:{client_address[1]}:{detail}".encode('utf-8')
+        for peer_path in self.peer_paths:
+            backlog = self.ipc_backlog.get(peer_path)
+            if backlog: # Já há eventos esperando para este worker: este vai depois deles
+                backlog.append(event_bytes)
+            else:
+                self._send_registry_event(peer_path, event_bytes)
+
+    def _send_registry_event(self, peer_path, event_bytes):
+        """Tenta enviar um evento sem bloquear; se a fila do worker estiver cheia, guarda-o para reenviar."""
+        try:
+            self.ipc_sckt.sendto(event_bytes, peer_path)
+        except BlockingIOError:
+            self.ipc_backlog.setdefault(peer_path, deque()).append(event_bytes)
+        except OSError as e: # Worker que já encerrou
+            print(f"[DEBUG_SERVER] Falha ao publicar evento para {peer_path}: {e}")
+            self.ipc_backlog.pop(peer_path, None)
+
+    def flush_registry_backlog(self):
+        """Reenvia, na ordem, os eventos que não couberam nas filas dos outros workers; retorna True se ainda sobrou algum."""
+        for peer_path, backlog in list(self.ipc_backlog.items()):
+            try:
+                while backlog:
+                    self.ipc_sckt.sendto(backlog[0], peer_path)
+                    backlog.popleft()
+            except BlockingIOError: # Fila ainda cheia: tenta de novo na próxima iteração
+                continue
+            except OSError as e:
+                print(f"[DEBUG_SERVER] Falha ao publicar evento para {peer_path}: {e}")
+            del self.ipc_backlog[peer_path]
+        return bool(self.ipc_backlog)
+
+    def _drain_registry_events(self):
+        """Aplica todos os eventos de registro já recebidos (não só um por iteração do loop)."""
+        while True:
+            try:
+                event_bytes = self.ipc_sckt.recv(IPC_RECV_SIZE)
+            except BlockingIOError:
+                return
+            try:
+                self._apply_registry_event(event_bytes)
+            except (ValueError, UnicodeDecodeError) as e:
+                print(f"[DEBUG_SERVER] Evento de registro inválido: {e}")
+
+    def _apply_registry_event(self, event_bytes):
+        """Aplica localmente um evento publicado por outro worker (sem notificar os clientes de novo)."""
+        event, ip, port, detail = event_bytes.decode('utf-8').split(':', 3)
+        client_address = (ip, int(port))
+        if event == "JOIN":
+            # O detalhe descreve o cliente por inteiro: um novo HELLO (ex: de um cliente que voltou com outras
+            # opções) substitui o que este worker sabia dele, inclusive o que deixou de valer
+            max_buff, text_protocol, compress, username = detail.split(':', 3)
+            max_buff, text_protocol = int(max_buff), int(text_protocol)
+            self._register_client(client_address, username)
+            if max_buff:
+                self.client_max_buff[client_address] = max_buff
+            else:
+                self.client_max_buff.pop(client_address, None)
+            if text_protocol:
+                self.text_clients.add(client_address)
+            else:
+                self.text_clients.discard(client_address)
+            if text_protocol == 2:
+                self.legacy_clients.add(client_address)
+            else:
+                self.legacy_clients.discard(client_address)
+            if compress:
+                self.client_encodings[client_address] = frozenset(parse_compress_option(compress))
+            else:
+                self.client_encodings.pop(client_address, None)
+            # Cada worker controla a taxa do que ele mesmo envia ao cliente (sem entrega confiável neste modo)
+            if self.rate_controller_factory is not None:
+                rate_controller = self.rate_controllers[client_address] = self.rate_controller_factory()
+                rate_controller.without_feedback(max_buff or self.MAX_BUFF)
+        elif event == "ROOM_JOIN": # O detalhe é o nome da sala
+            self._add_member(client_address, detail)
+        elif event == "ROOM_LEAVE":
+            self._remove_member(client_address, detail)
+        elif event == "LEAVE": # Mesma limpeza de remove_clients, sem notificar as salas de novo
+            self._unregister_client(client_address)
+            self._discard_client_state(client_address)
+
+    def add_client(self, client_address, username, options=None):
+        """Adiciona o cliente localmente (notificando a sala) e o replica nos outros workers."""
+        super().add_client(client_address, username, options)
+        # Leva o tamanho de datagrama negociado (0 = padrão), o protocolo do cliente (1 = texto, 2 = texto sem cabeçalho
+        # nos fragmentos) e os codecs de compressão que ele aceita (ex: 'lzma,zlib'); o nome de usuário fica por último
+        # para poder conter ':'
+        max_buff = self.client_max_buff.get(client_address, 0)
+        text_protocol = int(client_address in self.text_clients) + int(client_address in self.legacy_clients)
+        compress = format_compress_option(sorted(self.client_encodings.get(client_address, ())))
+        self._publish_registry_event("JOIN", client_address, f"{max_buff}:{text_protocol}:{compress}:{username}")
+
+    def join_room(self, client_address, room):
+        """Coloca o cliente na sala localmente (notificando os membros) e nos outros workers."""
+        joined = super().join_room(client_address, room)
+        if joined:
+            self._publish_registry_event("ROOM_JOIN", client_address, room)
+        return joined
+
+    def leave_room(self, client_address, room):
+        """Tira o cliente da sala localmente (notificando os membros) e nos outros workers."""
+        left = super().leave_room(client_address, room)
+        if left:
+            self._publish_registry_event("ROOM_LEAVE", client_address, room)
+        return left
+
+    def remove_clients(self, client_addresses, reason=""):
+        """Remove os clientes localmente (notificando as salas) e os remove dos outros workers.
+
+        Os heartbeats de um cliente, como todos os seus datagramas, chegam só ao worker dono dele:
+        é esse worker que o expira e publica a saída.
+        """
+        members = [client_address for client_address in client_addresses if client_address in self.clients]
+        super().remove_clients(client_addresses, reason)
+        for client_address in members:
+            self._publish_registry_event("LEAVE", client_address)
+
+    def run(self):
+        """Loop do worker: atende datagramas de clientes e eventos de registro dos outros workers."""
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.sckt, selectors.EVENT_READ)
+            selector.register(self.ipc_sckt, selectors.EVENT_READ)
+            wait = PARENT_CHECK_INTERVAL
+            while os.getppid() == self.parent_pid:
+                # Com filas de saída pendentes (ou clientes a expirar), o select precisa acordar periodicamente
+                for key, _ in selector.select(wait):
+                    if key.fileobj is self.ipc_sckt:
+                        self._drain_registry_events()
+                    elif self.io is not None: # O socket já está legível: drena o lote sem esperar
+                        self.serve_datagram_batch(0)
+                    else:
+                        self.serve_one_datagram()
+                with self._batched_sends():
+                    wait = self._next_wait(self.service_timers())
+                if self.ipc_backlog and self.flush_registry_backlog(): # Algum worker com a fila cheia: tenta de novo logo
+                    wait = IPC_RETRY_WAIT if wait is None else min(wait, IPC_RETRY_WAIT)
+                wait = PARENT_CHECK_INTERVAL if wait is None else min(wait, PARENT_CHECK_INTERVAL)
+            print(f"[WORKER {self.worker_id}] processo principal encerrado; saindo.")
+
+    def close(self):
+        """Fecha o socket UDP e o canal de registro."""
+        super().close()
+        self.ipc_sckt.close()
+
+
+def _worker_main(host, port, max_buff, worker_id, num_workers, ipc_dir, ready_barrier, pacing=None,
+                 max_datagram=MAX_DATAGRAM_SIZE, profile_path=None, batch_io=True, chat_log=True, send_queue=None,
+                 socket_buffers=(None, None)):
+    """Ponto de entrada de cada processo worker."""
+    signal.signal(signal.SIGTERM, _exit_on_sigterm) # terminate() do processo principal: fecha os sockets antes de sair
+    rcvbuf, sndbuf = socket_buffers # SO_RCVBUF/SO_SNDBUF do socket de cada worker
+    server = WorkerUDPServer(host, port, max_buff, worker_id, num_workers, ipc_dir, pacing=pacing, max_datagram=max_datagram,
+                             profile_path=profile_path, batch_io=batch_io, rcvbuf=rcvbuf, sndbuf=sndbuf)
+    server.chat_log = chat_log
+    if send_queue is not None: # (limite de pacotes, política)
+        server.set_send_queue(*send_queue)
+    try:
+        ready_barrier.wait() # Só atende clientes depois que todos os canais de registro existem
+        server.run()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.close()
+
+
+def run_workers(host, port, max_buff, num_workers, pacing=None, max_datagram=MAX_DATAGRAM_SIZE, profile_path=None,
+                batch_io=True, chat_log=True, send_queue=None, socket_buffers=(None, None)):
+    """Inicia `num_workers` processos servidores na mesma porta e espera até serem interrompidos."""
+    if not hasattr(skt, 'SO_REUSEPORT'): # Ex: Windows
+        raise OSError("SO_REUSEPORT não é suportado nesta plataforma; use --workers 1.")
+
+    # Sem isto, um SIGTERM no processo principal o encerraria sem passar pelo finally abaixo, deixando os
+    # workers rodando e o diretório dos sockets Unix para trás.
+    previous_handler = signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    ipc_dir = tempfile.mkdtemp(prefix="chat-workers-")
+    ready_barrier = multiprocessing.Barrier(num_workers)
+    processes = [
+        multiprocessing.Process(target=_worker_main, args=(host, port, max_buff, i, num_workers, ipc_dir, ready_barrier, pacing, max_datagram, profile_path,
+                                      batch_io, chat_log, send_queue, socket_buffers),
+                                daemon=True)
+        for i in range(num_workers)
+    ]
+    try:
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt: # Ctrl+C chega a todos os processos do grupo
+        print("\nServidor interrompido pelo usuário.")
+    except SystemExit:
+        print("\nServidor encerrado (SIGTERM).")
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN) # Um segundo SIGTERM não interrompe a limpeza
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            if process.pid is not None: # Pode não ter chegado a iniciar
+                process.join()
+        shutil.rmtree(ipc_dir, ignore_errors=True)
+        signal.signal(signal.SIGTERM, previous_handler)
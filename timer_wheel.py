@@ -0,0 +1,66 @@
+# timer_wheel.py
+# Roda de timers de resolução fixa, para expirar estados ociosos sem varrer todos eles.
+import time
+
+
+class TimerWheel:
+    """Agenda prazos por chave em slots de `resolution` segundos.
+
+    Agendar, reagendar e cancelar custam O(1); expire() só percorre os slots já vencidos.
+    Um prazo pode vencer até `resolution` segundos depois do pedido, nunca antes.
+    """
+    def __init__(self, resolution=1.0, now=None):
+        self.resolution = resolution
+        self.slots = {} # {índice do slot: set de chaves}
+        self.slot_of = {} # {chave: índice do slot}
+        now = time.monotonic() if now is None else now
+        self.cursor = int(now / resolution) # Próximo slot a verificar
+
+    def schedule(self, key, deadline):
+        """Agenda (ou reagenda) o prazo de uma chave."""
+        slot = int(deadline / self.resolution) + 1 # Arredonda para cima: nunca vence antes do prazo
+        old_slot = self.slot_of.get(key)
+        if old_slot == slot:
+            return
+        if old_slot is not None:
+            self._remove(key, old_slot)
+        keys = self.slots.get(slot)
+        if keys is None: # Sem setdefault: não cria um set a cada chamada
+            keys = self.slots[slot] = set()
+        keys.add(key)
+        self.slot_of[key] = slot
+
+    def cancel(self, key):
+        """Remove o prazo de uma chave (se houver)."""
+        slot = self.slot_of.pop(key, None)
+        if slot is not None:
+            self._remove(key, slot)
+
+    def _remove(self, key, slot):
+        keys = self.slots[slot]
+        keys.discard(key)
+        if not keys:
+            del self.slots[slot]
+
+    def expire(self, now=None):
+        """Remove e retorna as chaves cujo prazo já venceu."""
+        now = time.monotonic() if now is None else now
+        current = int(now / self.resolution)
+        if current < self.cursor:
+            return []
+        if current - self.cursor > len(self.slots): # Muito tempo sem verificar: olha só os slots existentes
+            due = sorted(slot for slot in self.slots if slot <= current)
+        else:
+            due = range(self.cursor, current + 1)
+        expired = []
+        for slot in due:
+            keys = self.slots.pop(slot, None)
+            if keys:
+                for key in keys:
+                    del self.slot_of[key]
+                expired.extend(keys)
+        self.cursor = current + 1
+        return expired
+
+    def __len__(self):
+        return len(self.slot_of)